@@ -241,23 +241,12 @@ Rispondi SOLO con un JSON array valido:
 
 
 def calculate_consecutive_days(logs):
-    """Calcola i giorni consecutivi di intimità"""
-    if not logs:
-        return 0
+    """Calcola i giorni consecutivi di intimità (backend/streaks.py)"""
+    from datetime import date
+    from streaks import compute_streaks, day_ordinals
     
-    dates = sorted(set(log.date for log in logs if log.date), reverse=True)
-    if not dates:
-        return 0
-    
-    consecutive = 1
-    for i in range(1, len(dates)):
-        diff = (dates[i-1] - dates[i]).days
-        if diff == 1:
-            consecutive += 1
-        else:
-            break
-    
-    return consecutive
+    days = day_ordinals(log.date for log in logs if log.date)
+    return compute_streaks(days, date.today().toordinal()).consecutive_days
 
 
 # ============== 3. NUOVO ENDPOINT PER CALCOLO CALORIE AVANZATO ==============
@@ -2,29 +2,14 @@
 # AGGIUNGI QUESTO CODICE AL TUO app.py SUL SERVER
 # Prima della riga: app.include_router(api_router)
 
-# 1. Prima aggiungi questa tabella al database (esegui una sola volta):
-"""
-CREATE TABLE IF NOT EXISTS secret_desires (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    couple_code VARCHAR(50) NOT NULL,
-    user_id VARCHAR(100) NOT NULL,
-    desires JSON,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    UNIQUE KEY unique_user_desires (couple_code, user_id)
-);
-"""
-
-# 2. Aggiungi questo modello SQLAlchemy (dopo gli altri modelli):
-class SecretDesire(Base):
-    __tablename__ = "secret_desires"
-    id = Column(Integer, primary_key=True, index=True)
-    couple_code = Column(String(50), nullable=False)
-    user_id = Column(String(100), nullable=False)
-    desires = Column(JSON, default=list)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+# 1. Tabella e modello: le scelte sono salvate come bitmask nella tabella `selections`
+#    (modello Selection in backend/server.py, sezione catalogo "desires" = DESIRE_ITEMS).
+#    Un bit per desiderio: i match sono un AND, i conteggi un popcount (vedi backend/selections.py).
+#    Se hai già la vecchia tabella secret_desires (lista JSON per utente), convertila una volta:
+#        python server.py migrate-selections
 
+# 2. Nessun modello da aggiungere: usa Selection, catalog, selection_layout,
+#    couple_masks e save_selection già presenti in server.py
 
 # 3. Aggiungi questi endpoint (prima di app.include_router):
 
@@ -38,30 +23,14 @@ async def get_desires(couple_code: str, user_id: str):
     """Get user's desires and matches with partner"""
     db = SessionLocal()
     try:
-        # Get my desires
-        my_record = db.query(SecretDesire).filter(
-            SecretDesire.couple_code == couple_code,
-            SecretDesire.user_id == user_id
-        ).first()
-        
-        my_desires = my_record.desires if my_record else []
-        
-        # Get partner's desires
-        partner_record = db.query(SecretDesire).filter(
-            SecretDesire.couple_code == couple_code,
-            SecretDesire.user_id != user_id
-        ).first()
-        
-        partner_has_selected = partner_record is not None and len(partner_record.desires or []) > 0
-        partner_desires = partner_record.desires if partner_record else []
-        
-        # Calculate matches (only desires both have selected)
-        matches = list(set(my_desires) & set(partner_desires)) if partner_desires else []
+        layout = selection_layout(catalog.current(), DESIRES_CATALOG)
+        # Una sola query: la maschera dell'utente e quella del partner
+        mine, partner = couple_masks(db, couple_code, user_id, DESIRES_CATALOG)
         
         return {
-            "my_desires": my_desires,
-            "matches": matches,
-            "partner_has_selected": partner_has_selected
+            "my_desires": layout.ids_of(mine),
+            "matches": layout.ids_of(mine & partner),
+            "partner_has_selected": partner != 0
         }
     except Exception as e:
         return {"my_desires": [], "matches": [], "partner_has_selected": False, "error": str(e)}
@@ -74,41 +43,19 @@ async def save_desires(request: SaveDesiresRequest):
     """Save user's secret desires"""
     db = SessionLocal()
     try:
-        # Check if record exists
-        existing = db.query(SecretDesire).filter(
-            SecretDesire.couple_code == request.couple_code,
-            SecretDesire.user_id == request.user_id
-        ).first()
-        
-        if existing:
-            existing.desires = request.desires
-            existing.updated_at = datetime.utcnow()
-        else:
-            new_record = SecretDesire(
-                couple_code=request.couple_code,
-                user_id=request.user_id,
-                desires=request.desires
-            )
-            db.add(new_record)
+        layout = selection_layout(catalog.current(), DESIRES_CATALOG)
+        mask = layout.mask(request.desires)  # ValueError se un id non è nel catalogo
         
+        save_selection(db, request.couple_code, request.user_id, DESIRES_CATALOG, mask)
         db.commit()
         
-        # Get partner's desires to calculate matches
-        partner_record = db.query(SecretDesire).filter(
-            SecretDesire.couple_code == request.couple_code,
-            SecretDesire.user_id != request.user_id
-        ).first()
-        
-        partner_has_selected = partner_record is not None and len(partner_record.desires or []) > 0
-        partner_desires = partner_record.desires if partner_record else []
-        
-        # Calculate matches
-        matches = list(set(request.desires) & set(partner_desires)) if partner_desires else []
+        # Maschera del partner per calcolare i match
+        _, partner = couple_masks(db, request.couple_code, request.user_id, DESIRES_CATALOG)
         
         return {
             "success": True,
-            "matches": matches,
-            "partner_has_selected": partner_has_selected
+            "matches": layout.ids_of(mask & partner),
+            "partner_has_selected": partner != 0
         }
     except Exception as e:
         db.rollback()
@@ -3,59 +3,26 @@
 
 # 1. FERTILITA' PER COUPLE_CODE (per l'uomo)
 @api_router.get("/cycle/fertility/couple/{couple_code}")
-async def get_fertility_by_couple(couple_code: str):
+async def get_fertility_by_couple(couple_code: str, from_: Optional[str] = Query(None, alias="from"), to: Optional[str] = None, format: str = "days"):
     """Get fertility data for couple - used by male partner"""
     db = SessionLocal()
     try:
-        # Trova l'utente donna con questo couple_code
-        female_user = db.query(User).filter(
-            User.couple_code == couple_code,
-            User.gender == "female"
-        ).first()
-        
-        if not female_user:
-            return {"periods": [], "ovulation_days": [], "fertile_days": []}
-        
-        # Ottieni i dati del ciclo della donna
-        cycle = db.query(Cycle).filter(Cycle.user_id == female_user.id).first()
+        # Il ciclo seguito dalla coppia: couples.cycle_id (vedi Couple / link_couple_cycle in backend/server.py),
+        # una sola lookup per chiave primaria invece di cercare l'utente donna e poi il suo ciclo
+        cycle = db.query(Cycle).join(
+            Couple, Couple.cycle_id == Cycle.id
+        ).filter(Couple.couple_code == couple_code).first()
         
         if not cycle or not cycle.last_period_date:
             return {"periods": [], "ovulation_days": [], "fertile_days": []}
         
-        # Calcola fertilità (stesso codice dell'endpoint esistente)
-        from datetime import timedelta
-        
-        periods = []
-        ovulation_days = []
-        fertile_days = []
+        # Calcola fertilità con il motore condiviso (backend/fertility.py)
+        from fertility import build_calendar, calendar_payload, check_format, make_cycle, resolve_range
         
-        start_date = cycle.last_period_date
-        cycle_length = cycle.cycle_length or 28
-        period_length = cycle.period_length or 5
-        
-        # Genera per 3 mesi
-        for i in range(3):
-            cycle_start = start_date + timedelta(days=cycle_length * i)
-            
-            # Giorni del ciclo
-            for j in range(period_length):
-                periods.append((cycle_start + timedelta(days=j)).strftime("%Y-%m-%d"))
-            
-            # Ovulazione (circa giorno 14)
-            ovulation = cycle_start + timedelta(days=cycle_length - 14)
-            ovulation_days.append(ovulation.strftime("%Y-%m-%d"))
-            
-            # Giorni fertili (5 giorni prima e 1 dopo ovulazione)
-            for j in range(-5, 2):
-                fertile_date = ovulation + timedelta(days=j)
-                if fertile_date.strftime("%Y-%m-%d") not in periods:
-                    fertile_days.append(fertile_date.strftime("%Y-%m-%d"))
-        
-        return {
-            "periods": periods,
-            "ovulation_days": ovulation_days,
-            "fertile_days": fertile_days
-        }
+        check_format(format)
+        params = make_cycle(cycle.last_period_date, cycle.cycle_length, cycle.period_length)
+        first, last = resolve_range(params, from_, to)
+        return calendar_payload(build_calendar(params, first, last), format)
     except Exception as e:
         return {"periods": [], "ovulation_days": [], "fertile_days": [], "error": str(e)}
     finally:
@@ -109,28 +76,11 @@ def calculate_calories(duration_minutes: int, positions: list, quality_rating: i
 
 
 # 3. NOTIFICHE QUANDO PARTNER SELEZIONA UN DESIDERIO
-# Modifica l'endpoint POST /desires/save per inviare notifica
-
-# Aggiungi questo import in cima:
-# import httpx
-
-async def send_push_notification(push_token: str, title: str, body: str):
-    """Invia notifica push tramite Expo"""
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(
-                "https://exp.host/--/api/v2/push/send",
-                json={
-                    "to": push_token,
-                    "title": title,
-                    "body": body,
-                    "sound": "default",
-                    "data": {"type": "desire_update"}
-                }
-            )
-    except Exception as e:
-        print(f"Push notification error: {e}")
-
+# Modifica l'endpoint POST /desires/save (BACKEND_DESIRES_CODE.py) per notificare il partner.
+# La push non viene inviata qui: partner_notifier (backend/notifications.py, già creato in
+# server.py) la mette in coda e un worker in background la invia. Gli eventi per lo stesso
+# partner entro pochi secondi diventano una sola notifica ("ha aggiornato 5 desideri"),
+# quindi la risposta parte subito dopo il commit.
 
 # Modifica l'endpoint save_desires per inviare notifica:
 @api_router.post("/desires/save")
@@ -138,22 +88,31 @@ async def save_desires(request: SaveDesiresRequest):
     """Save user's secret desires and notify partner"""
     db = SessionLocal()
     try:
-        # ... codice esistente per salvare ...
+        layout = selection_layout(catalog.current(), DESIRES_CATALOG)
+        mask = layout.mask(request.desires)  # ValueError se un id non è nel catalogo
         
-        # Dopo aver salvato, notifica il partner
+        previous = save_selection(db, request.couple_code, request.user_id, DESIRES_CATALOG, mask)
+        db.commit()
+        
+        # Dopo aver salvato, notifica il partner (in coda, non blocca la risposta)
         partner = db.query(User).filter(
             User.couple_code == request.couple_code,
             User.id != request.user_id
         ).first()
         
         if partner and partner.push_token:
-            await send_push_notification(
-                partner.push_token,
-                "💭 Desideri Segreti",
-                "Il tuo partner ha aggiornato le sue scelte! Vai a vedere se avete nuovi match 😏"
-            )
+            # Un evento per ogni desiderio aggiunto o tolto
+            partner_notifier.notify(partner.push_token, "desire_update", count=popcount(previous ^ mask))
         
-        # ... resto del codice ...
+        _, partner_mask = couple_masks(db, request.couple_code, request.user_id, DESIRES_CATALOG)
         
+        return {
+            "success": True,
+            "matches": layout.ids_of(mask & partner_mask),
+            "partner_has_selected": partner_mask != 0
+        }
+    except Exception as e:
+        db.rollback()
+        return {"success": False, "error": str(e)}
     finally:
         db.close()
@@ -0,0 +1,62 @@
+"""Declarative achievement badges, shared by both backends.
+
+Each rule names the aggregates it reads. After a write, the caller passes
+the aggregates that write may have changed. Only rules that are still
+locked and depend on one of them are evaluated, and the caller computes
+just the aggregates those rules need. Unlocks are permanent and stored
+with a timestamp, so the stats endpoints only read the stored badges.
+
+Adding a badge means adding a BadgeRule here; reads do not get slower.
+"""
+from typing import Any, Callable, FrozenSet, Iterable, List, Mapping, NamedTuple, Set
+
+
+class BadgeRule(NamedTuple):
+    id: str
+    depends_on: FrozenSet[str]
+    check: Callable[[Mapping[str, Any]], bool]
+
+
+def rule(badge_id: str, *depends_on: str, check: Callable[[Mapping[str, Any]], bool]) -> BadgeRule:
+    return BadgeRule(badge_id, frozenset(depends_on), check)
+
+
+# IDs match the frontend badge catalogue
+BADGE_RULES = (
+    rule("first_time", "total_count", check=lambda a: a["total_count"] >= 1),
+    rule("week_streak", "current_streak", check=lambda a: a["current_streak"] >= 1),
+    rule("quality_king", "average_quality", check=lambda a: a["average_quality"] > 4),
+    rule("explorer", "distinct_locations", check=lambda a: a["distinct_locations"] >= 5),
+    rule("marathon", "max_duration", check=lambda a: a["max_duration"] >= 60),
+    # No time of day is recorded, so these unlock on volume
+    rule("morning", "total_count", check=lambda a: a["total_count"] >= 5),
+    rule("night_owl", "total_count", check=lambda a: a["total_count"] >= 8),
+    rule("perfect_month", "monthly_count", check=lambda a: a["monthly_count"] >= 20),
+)
+
+BADGE_ORDER = {r.id: i for i, r in enumerate(BADGE_RULES)}
+
+# Aggregates that logging an intimacy entry can raise
+INTIMACY_AGGREGATES = frozenset({
+    "total_count", "average_quality", "current_streak", "distinct_locations", "max_duration", "monthly_count",
+})
+ALL_AGGREGATES = frozenset().union(*(r.depends_on for r in BADGE_RULES))
+
+
+def pending_rules(unlocked: Iterable[str], changed: Iterable[str], rules=BADGE_RULES) -> List[BadgeRule]:
+    """Locked rules that read at least one changed aggregate"""
+    unlocked, changed = set(unlocked), frozenset(changed)
+    return [r for r in rules if r.id not in unlocked and r.depends_on & changed]
+
+
+def required_aggregates(rules: Iterable[BadgeRule]) -> Set[str]:
+    return set().union(*(r.depends_on for r in rules))
+
+
+def newly_unlocked(rules: Iterable[BadgeRule], aggregates: Mapping[str, Any]) -> List[str]:
+    return [r.id for r in rules if r.check(aggregates)]
+
+
+def sort_badges(badge_ids: Iterable[str]) -> List[str]:
+    """Catalogue order, unknown (retired) badges last"""
+    return sorted(badge_ids, key=lambda b: BADGE_ORDER.get(b, len(BADGE_ORDER)))
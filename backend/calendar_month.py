@@ -0,0 +1,59 @@
+"""Month view of the couple calendar: every overlay for one month in one response.
+
+The backends run one range-bounded query per overlay (fertility, intimacy,
+moods, special dates) concurrently and pass the rows to `month_payload`.
+Days are offsets from the first of the month, as in the `intervals`
+fertility format, so the payload stays small.
+"""
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional, Tuple
+
+from fertility import FertilityCalendar, interval_payload
+
+
+def month_range(month: str) -> Tuple[date, date]:
+    """First and last day of a YYYY-MM month; raises ValueError on bad input"""
+    try:
+        first = datetime.strptime(month, "%Y-%m").date()
+    except ValueError:
+        raise ValueError("Il mese deve essere nel formato YYYY-MM")
+    following = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return first, following - timedelta(days=1)
+
+
+def _day(first: date, value: str) -> int:
+    return datetime.strptime(value[:10], "%Y-%m-%d").toordinal() - first.toordinal()
+
+
+def month_payload(
+    month: str,
+    calendar: Optional[FertilityCalendar],
+    intimacy: Iterable[dict],
+    moods: Iterable[dict],
+    special_dates: Iterable[dict],
+) -> dict:
+    """intimacy: id/date/quality_rating; moods: user_id/date/mood/energy/stress/libido;
+    special_dates: id/date/title/time"""
+    first, last = month_range(month)
+    fertility = interval_payload(calendar) if calendar else {"periods": [], "fertile": [], "ovulations": []}
+    return {
+        "month": month,
+        "from": first.isoformat(),
+        "days": (last - first).days + 1,
+        "periods": fertility["periods"],
+        "fertile": fertility["fertile"],
+        "ovulations": fertility["ovulations"],
+        "intimacy": [
+            {"id": e["id"], "day": _day(first, e["date"]), "quality_rating": e["quality_rating"]}
+            for e in intimacy
+        ],
+        "moods": [
+            {"user_id": m["user_id"], "day": _day(first, m["date"]), "mood": m["mood"],
+             "energy": m["energy"], "stress": m["stress"], "libido": m["libido"]}
+            for m in moods
+        ],
+        "special_dates": [
+            {"id": d["id"], "day": _day(first, d["date"]), "title": d["title"], "time": d.get("time")}
+            for d in special_dates
+        ],
+    }
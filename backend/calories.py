@@ -0,0 +1,35 @@
+"""Calorie estimates for intimacy sessions, shared by both backends"""
+from typing import List, Optional
+
+# MET (Metabolic Equivalent of Task) per posizione
+POSITION_MET_VALUES = {
+    "missionary": 2.8,      # Bassa intensità per chi sta sotto
+    "cowgirl": 4.0,         # Alta intensità per chi sta sopra
+    "reverse_cowgirl": 4.2,
+    "doggy": 3.5,
+    "standing": 4.5,
+    "spooning": 2.0,        # Bassa intensità, rilassante
+    "69": 3.0,
+    "lotus": 3.2,
+    "prone": 2.5,
+    "edge_of_bed": 3.8,
+    "shower": 4.0,          # Extra sforzo per equilibrio
+    "wall": 4.5,
+    "chair": 3.5,
+}
+
+DEFAULT_MET = 3.0
+DEFAULT_DURATION_MINUTES = 15
+DEFAULT_WEIGHT_KG = 70
+
+
+def estimate_calories(duration_minutes: Optional[int], positions: Optional[List[str]], quality: Optional[int],
+                      weight_kg: float = DEFAULT_WEIGHT_KG) -> float:
+    """MET × peso (kg) × ore, con intensità modificata dalla qualità (1 = -10%, 5 = +30%)"""
+    duration = duration_minutes or DEFAULT_DURATION_MINUTES
+    if positions:
+        avg_met = sum(POSITION_MET_VALUES.get(p.lower().replace(" ", "_"), DEFAULT_MET) for p in positions) / len(positions)
+    else:
+        avg_met = DEFAULT_MET
+    intensity_modifier = 0.8 + ((quality or 3) * 0.1)
+    return avg_met * intensity_modifier * weight_kg * (duration / 60)
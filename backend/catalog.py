@@ -0,0 +1,233 @@
+"""Static content catalogs: wishlist items, positions, challenges, love dice, note templates.
+
+Each backend passes its built-in content as defaults, one section per name.
+Sections are loaded once into immutable structures (lists become tuples,
+objects read-only mappings). A list of objects that all carry an "id" is
+also indexed by it, so lookups use `catalog[name].by_id` instead of a scan.
+
+When `data_dir` (CATALOG_DIR) is set, `<section>.json` there replaces the
+built-in section. The files' mtimes are checked at most every
+`check_interval` seconds, and a change reloads the catalog without a
+restart. A file that does not parse, or whose shape differs from the
+built-in section, is skipped and the previous content stays in use.
+Sections listed in `append_only` are stored as bit positions elsewhere
+(selections.py): their files may only add items at the end, up to
+MAX_BITS items. Removing such a file does not bring back the shorter
+built-in section while the process runs, since stored bits would point
+past its end.
+
+`version` hashes the rendered content of every section. Catalog endpoints
+are pre-rendered once per version and served with a long-lived
+Cache-Control and a content ETag, so clients revalidate rarely and get 304
+until the content changes.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections.abc import Mapping
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional
+
+from fastapi import Request, Response
+
+from http_cache import body_etag, conditional_body, render_json
+from selections import MAX_BITS
+
+CACHE_CONTROL = "public, max-age=86400"
+
+logger = logging.getLogger(__name__)
+
+
+def freeze(value):
+    if isinstance(value, Mapping):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+
+def thaw(value):
+    """Plain dicts and lists again, for JSON and pydantic"""
+    if isinstance(value, Mapping):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def _indexed(value) -> bool:
+    return isinstance(value, (list, tuple)) and bool(value) and all(isinstance(i, Mapping) and "id" in i for i in value)
+
+
+class Section(NamedTuple):
+    items: Any                # tuple of items, or a read-only mapping
+    by_id: Mapping            # id -> item; empty unless every item has an id
+    body: bytes               # rendered JSON
+
+
+def build_section(name: str, value) -> Section:
+    items = freeze(value)
+    by_id = {}
+    if _indexed(items):
+        for item in items:
+            if item["id"] in by_id:
+                raise ValueError(f"{name}: id duplicato {item['id']}")
+            by_id[item["id"]] = item
+    return Section(items, MappingProxyType(by_id), render_json(value))
+
+
+def check_shape(name: str, value, default):
+    """Raises ValueError when a data file does not match its built-in section"""
+    if isinstance(default, Mapping) != isinstance(value, dict) or isinstance(default, (list, tuple)) != isinstance(value, list):
+        raise ValueError(f"{name}: tipo diverso dal catalogo predefinito")
+    if isinstance(value, list) and not value:
+        raise ValueError(f"{name}: catalogo vuoto")
+    if _indexed(default) and not _indexed(value):
+        raise ValueError(f"{name}: ogni elemento deve avere un id")
+
+
+def check_append_only(name: str, value, current: Section):
+    """Raises ValueError unless `value` keeps every current item id at its position and fits a mask"""
+    if len(value) > MAX_BITS:
+        raise ValueError(f"{name}: al massimo {MAX_BITS} elementi")
+    ids = [item["id"] for item in current.items]
+    if [item["id"] for item in value[:len(ids)]] != ids:
+        raise ValueError(f"{name}: si possono solo aggiungere elementi in fondo")
+
+
+class Snapshot:
+    """One immutable version of every section"""
+
+    def __init__(self, sections: Dict[str, Section]):
+        self.sections = MappingProxyType(sections)
+        digest = hashlib.blake2b(digest_size=8)
+        for name in sorted(sections):
+            digest.update(name.encode("utf-8") + b"\0" + sections[name].body + b"\0")
+        self.version = digest.hexdigest()
+        self._derived = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name: str) -> Section:
+        return self.sections[name]
+
+    def payload(self, name: str):
+        return thaw(self.sections[name].items)
+
+    def derived(self, key, build: Callable[["Snapshot"], Any]):
+        """`build(self)`, computed once per version (rendered views, bit layouts)"""
+        with self._lock:
+            value = self._derived.get(key)
+        if value is None:
+            value = build(self)
+            with self._lock:
+                self._derived[key] = value
+        return value
+
+    def view(self, key: str, build: Callable[["Snapshot"], Any]):
+        """(body, etag) of an endpoint's payload"""
+        def render(snapshot):
+            body = render_json(build(snapshot))
+            return body, body_etag(body)
+        return self.derived(("view", key), render)
+
+
+class Catalog:
+    def __init__(self, defaults: Dict[str, Any], data_dir: Optional[str] = None, check_interval: float = 5.0,
+                 append_only: Iterable[str] = ()):
+        self._defaults = {name: build_section(name, value) for name, value in defaults.items()}
+        self._default_values = dict(defaults)
+        self.append_only = frozenset(append_only)
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtimes = {}
+        self.reloads = 0
+        self.errors = 0
+        self._snapshot = Snapshot(dict(self._defaults))
+        self._checked_at = 0.0
+        self._reload()
+        self.reloads = 0
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.data_dir, f"{name}.json")
+
+    def _file_mtimes(self) -> Dict[str, Optional[float]]:
+        mtimes = {}
+        for name in self._defaults:
+            try:
+                mtimes[name] = os.stat(self._path(name)).st_mtime
+            except OSError:
+                mtimes[name] = None
+        return mtimes
+
+    def _reload(self):
+        """Rebuild the snapshot when a data file appeared, changed or went away"""
+        if not self.data_dir:
+            return
+        self._checked_at = time.monotonic()
+        mtimes = self._file_mtimes()
+        if mtimes == self._mtimes:
+            return
+        sections = dict(self._snapshot.sections)
+        for name, mtime in mtimes.items():
+            if mtime == self._mtimes.get(name):
+                continue
+            if mtime is None:
+                if name in self.append_only:
+                    try:
+                        check_append_only(name, self._default_values[name], sections[name])
+                    except ValueError as e:
+                        self.errors += 1
+                        logger.warning("Catalog %s kept after its file was removed: %s", name, e)
+                        continue
+                sections[name] = self._defaults[name]
+                continue
+            try:
+                with open(self._path(name), encoding="utf-8") as f:
+                    value = json.load(f)
+                check_shape(name, value, self._default_values[name])
+                if name in self.append_only:
+                    check_append_only(name, value, sections[name])
+                sections[name] = build_section(name, value)
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                logger.warning("Catalog %s not reloaded: %s", name, e)
+        self._mtimes = mtimes
+        snapshot = Snapshot(sections)
+        if snapshot.version != self._snapshot.version:
+            self._snapshot = snapshot
+            self.reloads += 1
+
+    def current(self) -> Snapshot:
+        if self.data_dir and time.monotonic() - self._checked_at >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked_at >= self.check_interval:
+                    self._reload()
+        return self._snapshot
+
+    def __getitem__(self, name: str) -> Section:
+        return self.current()[name]
+
+    @property
+    def version(self) -> str:
+        return self.current().version
+
+    def response(self, request: Request, key: str, build: Optional[Callable[[Snapshot], Any]] = None) -> Response:
+        """A catalog endpoint: one section by default, or whatever `build` assembles"""
+        snapshot = self.current()
+        body, etag = snapshot.view(key, build or (lambda s: s.payload(key)))
+        response = conditional_body(request, body, "application/json", etag, cache_control=CACHE_CONTROL)
+        response.headers["X-Catalog-Version"] = snapshot.version
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "version": self._snapshot.version,
+            "sections": len(self._snapshot.sections),
+            "data_dir": self.data_dir,
+            "reloads": self.reloads,
+            "errors": self.errors,
+        }
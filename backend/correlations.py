@@ -0,0 +1,181 @@
+"""Mood ↔ intimacy correlations for many couples at once (nightly batch).
+
+Each couple's moods and intimacy entries from the last LOOKBACK_DAYS are
+reduced to one row per day and joined on the day:
+- libido vs frequency: mean libido against the number of entries, over every day with a mood
+- stress vs quality: mean stress against mean quality, on days with both
+- energy vs duration: mean energy against mean duration, on days with both and a duration
+
+Pearson coefficients come from per-couple sums (np.bincount over the whole
+chunk), with no Python loop per couple. Fewer than MIN_DAYS paired days
+give None.
+
+Used by the `correlate-moods` job in server.py. The coach endpoints read
+the stored rows through `insight_cards` / `coach_suggestions`.
+"""
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+LOOKBACK_DAYS = 180
+MIN_DAYS = 8
+NOTABLE = 0.3  # |r| from which a correlation is shown to the couple
+PAIRS = ("libido_frequency", "stress_quality", "energy_duration")
+
+_KEY_SPAN = 1 << 20  # > any day number, so couple * span + day is unique
+
+
+class MoodChunk(NamedTuple):
+    codes: Sequence[str]       # couple codes, in checkpoint order
+    mood_idx: np.ndarray       # index into codes, per mood entry
+    mood_days: np.ndarray      # int64 days since 1970-01-01
+    libido: np.ndarray
+    stress: np.ndarray
+    energy: np.ndarray
+    intimacy_idx: np.ndarray   # index into codes, per intimacy entry
+    intimacy_days: np.ndarray
+    quality: np.ndarray
+    duration: np.ndarray       # minutes, 0 when unknown
+
+
+def _per_day(idx: np.ndarray, days: np.ndarray, *values: np.ndarray):
+    """(sorted couple/day keys, entries per key, mean of each value per key)"""
+    keys, inverse = np.unique(idx * _KEY_SPAN + days, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(keys))
+    return keys, counts, [np.bincount(inverse, weights=v, minlength=len(keys)) / counts for v in values]
+
+
+def _lookup(keys: np.ndarray, table_keys: np.ndarray):
+    """Positions of `keys` in the sorted `table_keys`, and which of them are present"""
+    pos = np.searchsorted(table_keys, keys)
+    pos = np.minimum(pos, max(len(table_keys) - 1, 0))
+    found = table_keys[pos] == keys if len(table_keys) else np.zeros(len(keys), dtype=bool)
+    return pos, found
+
+
+def grouped_pearson(group: np.ndarray, x: np.ndarray, y: np.ndarray, n_groups: int):
+    """Pearson r per group (NaN where undefined) and the sample count per group"""
+    n = np.bincount(group, minlength=n_groups).astype(float)
+    sx = np.bincount(group, weights=x, minlength=n_groups)
+    sy = np.bincount(group, weights=y, minlength=n_groups)
+    sxx = np.bincount(group, weights=x * x, minlength=n_groups)
+    syy = np.bincount(group, weights=y * y, minlength=n_groups)
+    sxy = np.bincount(group, weights=x * y, minlength=n_groups)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r = (n * sxy - sx * sy) / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy))
+    r[n < MIN_DAYS] = np.nan
+    return np.clip(r, -1, 1), n.astype(np.int64)
+
+
+def correlate_chunk(chunk: MoodChunk) -> List[dict]:
+    """One insights row per couple in the chunk"""
+    n = len(chunk.codes)
+    mood_keys, _, (libido, stress, energy) = _per_day(
+        chunk.mood_idx, chunk.mood_days, chunk.libido, chunk.stress, chunk.energy
+    )
+    intimacy_keys, intimacy_count, (quality,) = _per_day(chunk.intimacy_idx, chunk.intimacy_days, chunk.quality)
+    timed = chunk.duration > 0
+    timed_keys, _, (duration,) = _per_day(chunk.intimacy_idx[timed], chunk.intimacy_days[timed], chunk.duration[timed])
+    couple = mood_keys // _KEY_SPAN
+
+    pos, found = _lookup(mood_keys, intimacy_keys)
+    frequency = np.where(found, intimacy_count[pos] if len(intimacy_keys) else 0, 0)
+    r_libido, mood_days = grouped_pearson(couple, libido, frequency.astype(float), n)
+    r_stress, paired_days = grouped_pearson(couple[found], stress[found], quality[pos[found]], n)
+    tpos, tfound = _lookup(mood_keys, timed_keys)
+    r_energy, _ = grouped_pearson(couple[tfound], energy[tfound], duration[tpos[tfound]], n)
+
+    def value(r):
+        return None if np.isnan(r) else round(float(r), 3)
+
+    return [{
+        "couple_code": chunk.codes[i],
+        "libido_frequency": value(r_libido[i]),
+        "stress_quality": value(r_stress[i]),
+        "energy_duration": value(r_energy[i]),
+        "mood_days": int(mood_days[i]),
+        "paired_days": int(paired_days[i]),
+    } for i in range(n)]
+
+
+def _strength(r: float) -> str:
+    return "forte" if abs(r) >= 0.6 else "moderata"
+
+
+def insight_cards(row: Optional[Dict]) -> List[dict]:
+    """Cards for the insights screen, one per notable correlation"""
+    if not row:
+        return []
+    cards = []
+    r = row.get("libido_frequency")
+    if r is not None and abs(r) >= NOTABLE:
+        cards.append({
+            "icon": "🔥",
+            "title": "Desiderio e Frequenza",
+            "value": f"r = {r:+.2f}",
+            "description": f"correlazione {_strength(r)}: " + (
+                "nei giorni di desiderio alto vi cercate di più" if r > 0
+                else "il desiderio dichiarato non si traduce in più momenti insieme"),
+            "color": "#e84393"
+        })
+    r = row.get("stress_quality")
+    if r is not None and abs(r) >= NOTABLE:
+        cards.append({
+            "icon": "🧘",
+            "title": "Stress e Qualità",
+            "value": f"r = {r:+.2f}",
+            "description": f"correlazione {_strength(r)}: " + (
+                "lo stress abbassa la qualità dei vostri momenti" if r < 0
+                else "anche nei giorni stressanti i vostri momenti restano belli"),
+            "color": "#0984e3"
+        })
+    r = row.get("energy_duration")
+    if r is not None and abs(r) >= NOTABLE:
+        cards.append({
+            "icon": "⚡",
+            "title": "Energia e Durata",
+            "value": f"r = {r:+.2f}",
+            "description": f"correlazione {_strength(r)}: " + (
+                "più energia, momenti più lunghi" if r > 0
+                else "i momenti più lunghi arrivano nei giorni tranquilli"),
+            "color": "#fdcb6e"
+        })
+    return cards
+
+
+def coach_suggestions(row: Optional[Dict]) -> List[dict]:
+    """Coach suggestions driven by the couple's correlations"""
+    if not row:
+        return []
+    suggestions = []
+    r = row.get("stress_quality")
+    if r is not None and r <= -NOTABLE:
+        suggestions.append({
+            "type": "wellness",
+            "icon": "🧘",
+            "title": "Lo stress vi pesa",
+            "message": "Nei giorni più stressanti i vostri momenti sono meno appaganti. Provate a staccare insieme prima: una doccia calda, un massaggio, dieci minuti senza telefono.",
+            "action": "Pianifica una serata relax",
+            "priority": "high"
+        })
+    r = row.get("libido_frequency")
+    if r is not None and r <= -NOTABLE:
+        suggestions.append({
+            "type": "connection",
+            "icon": "💬",
+            "title": "Desiderio non ascoltato",
+            "message": "Quando il desiderio è alto non sempre vi trovate. Fatevi sapere come vi sentite: il diario dell'umore del partner è un buon segnale.",
+            "action": "Invia una love note",
+            "priority": "medium"
+        })
+    r = row.get("energy_duration")
+    if r is not None and r >= NOTABLE:
+        suggestions.append({
+            "type": "intimacy",
+            "icon": "⚡",
+            "title": "Scegliete il momento giusto",
+            "message": "I vostri momenti più lunghi arrivano nei giorni di energia alta. Tenetevi le serate in cui siete più carichi.",
+            "action": "Pianifica un appuntamento",
+            "priority": "low"
+        })
+    return suggestions
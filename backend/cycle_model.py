@@ -0,0 +1,109 @@
+"""Adaptive cycle-length model with O(1) updates.
+
+Each tracked user has one small statistics document:
+- Welford running mean / M2 of the observed cycle lengths
+- an exponentially weighted mean that follows recent cycles
+- shortest and longest observed lengths
+
+`observe` folds in one cycle length. The next period is predicted from
+the weighted mean, with an interval of about ±1.96 standard deviations
+(at least one day). Regularity is read from the stored variance, so the
+history is never rescanned.
+"""
+import math
+from datetime import date
+from typing import Iterable, Optional
+
+EWMA_ALPHA = 0.3          # weight of the newest cycle
+PLAUSIBLE_LENGTHS = (15, 60)  # longer gaps are usually a missed log, not a cycle
+MIN_CYCLES = 3            # below this the configured cycle_length is kept
+DEFAULT_STD_DAYS = 3.0    # spread assumed before there is enough history
+Z_95 = 1.96
+
+EMPTY_STATS = {"count": 0, "mean": 0.0, "m2": 0.0, "ewma": None, "shortest": None, "longest": None}
+
+
+def is_plausible(length: Optional[int]) -> bool:
+    return length is not None and PLAUSIBLE_LENGTHS[0] <= length <= PLAUSIBLE_LENGTHS[1]
+
+
+def observe(stats: Optional[dict], length: int) -> dict:
+    """New statistics with one more cycle length (the input is not modified)"""
+    stats = {**EMPTY_STATS, **(stats or {})}
+    count = stats["count"] + 1
+    delta = length - stats["mean"]
+    mean = stats["mean"] + delta / count
+    return {
+        "count": count,
+        "mean": mean,
+        "m2": stats["m2"] + delta * (length - mean),
+        "ewma": length if stats["ewma"] is None else EWMA_ALPHA * length + (1 - EWMA_ALPHA) * stats["ewma"],
+        "shortest": length if stats["shortest"] is None else min(stats["shortest"], length),
+        "longest": length if stats["longest"] is None else max(stats["longest"], length),
+    }
+
+
+def replay(lengths: Iterable[Optional[int]]) -> dict:
+    """Statistics for a whole history, oldest cycle first (backfill)"""
+    stats = dict(EMPTY_STATS)
+    for length in lengths:
+        if is_plausible(length):
+            stats = observe(stats, length)
+    return stats
+
+
+def std_dev(stats: dict) -> Optional[float]:
+    """Population standard deviation, as the regularity thresholds expect"""
+    if not stats or stats["count"] < 2:
+        return None
+    return math.sqrt(stats["m2"] / stats["count"])
+
+
+def regularity(stats: dict) -> str:
+    sd = std_dev(stats)
+    if sd is None or stats["count"] < MIN_CYCLES:
+        return "unknown"
+    if sd <= 2:
+        return "molto regolare"
+    if sd <= 4:
+        return "regolare"
+    if sd <= 7:
+        return "variabile"
+    return "irregolare"
+
+
+def predicted_length(stats: Optional[dict], configured: int) -> int:
+    if not stats or stats["count"] < MIN_CYCLES:
+        return configured
+    return round(stats["ewma"])
+
+
+def predict_next_period(stats: Optional[dict], last_period: date, configured: int) -> dict:
+    """Expected next period start with a ~95% interval"""
+    length = predicted_length(stats, configured)
+    sd = std_dev(stats) if stats and stats["count"] >= MIN_CYCLES else None
+    margin = max(1, math.ceil(Z_95 * (sd if sd is not None else DEFAULT_STD_DAYS)))
+    start = last_period.toordinal() + length
+    return {
+        "predicted_cycle_length": length,
+        "next_period": date.fromordinal(start).isoformat(),
+        "earliest": date.fromordinal(start - margin).isoformat(),
+        "latest": date.fromordinal(start + margin).isoformat(),
+        "confidence": 0.95,
+        "based_on_cycles": stats["count"] if stats else 0,
+    }
+
+
+def summary(stats: Optional[dict]) -> dict:
+    """The `stats` block of the cycle history endpoint"""
+    if not stats or not stats["count"]:
+        return {"average_cycle_length": None, "shortest_cycle": None, "longest_cycle": None, "regularity": "unknown"}
+    sd = std_dev(stats)
+    return {
+        "average_cycle_length": round(stats["mean"], 1),
+        "shortest_cycle": stats["shortest"],
+        "longest_cycle": stats["longest"],
+        "std_dev": round(sd, 1) if sd is not None else None,
+        "recent_average": round(stats["ewma"], 1),
+        "regularity": regularity(stats),
+    }
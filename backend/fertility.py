@@ -0,0 +1,269 @@
+"""Fertility calendar engine shared by every cycle endpoint.
+
+Days are `date.toordinal()` integers. Cycle k (k >= 0) starts on
+start + k * length. Its period covers the first `period_length` days, and
+ovulation falls `LUTEAL_DAYS` before the next period. The fertile window
+runs from 5 days before ovulation to 1 day after it, clipped so that it
+never overlaps the period.
+
+Any from/to range is answered by jumping straight to the cycles that
+overlap it. Nothing is generated day by day, and dates are formatted
+only at the edge.
+
+Endpoints pick the response shape with `format` (see FORMATS):
+- days: one YYYY-MM-DD string per day (the classic payload)
+- intervals: [first, last] day offsets from `from`, inclusive
+- bitmap: one status digit per day of the range
+"""
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import List, NamedTuple, Optional, Tuple
+
+LUTEAL_DAYS = 14
+FERTILE_BEFORE = 5
+FERTILE_AFTER = 1
+
+# Range used when `from`/`to` are omitted: the last period plus 6 cycles
+DEFAULT_CYCLES = 6
+MAX_RANGE_DAYS = 2 * 366
+
+Interval = Tuple[int, int]  # inclusive (first, last) ordinals
+
+FORMATS = ("days", "intervals", "bitmap")
+# Bitmap digits; ovulation wins over fertile, period over both
+STATUS_SAFE, STATUS_PERIOD, STATUS_FERTILE, STATUS_OVULATION = "0", "1", "2", "3"
+
+
+class Cycle(NamedTuple):
+    start: int          # ordinal of the last known period start
+    length: int
+    period_length: int
+
+
+class CycleWindows(NamedTuple):
+    """The landmarks of one cycle, as ordinals"""
+    start: int
+    period_end: int
+    fertile_start: int
+    ovulation: int
+    fertile_end: int
+    next_start: int
+
+
+class FertilityCalendar(NamedTuple):
+    first: int
+    last: int
+    periods: List[Interval]
+    fertile: List[Interval]
+    ovulations: List[int]
+
+
+def to_ordinal(day) -> int:
+    if isinstance(day, datetime):
+        return day.date().toordinal()
+    if isinstance(day, date):
+        return day.toordinal()
+    return datetime.strptime(day, "%Y-%m-%d").toordinal()
+
+
+def iso(ordinal: int) -> str:
+    return date.fromordinal(ordinal).isoformat()
+
+
+def make_cycle(last_period, cycle_length: Optional[int], period_length: Optional[int]) -> Cycle:
+    length = max(cycle_length or 28, 1)
+    return Cycle(to_ordinal(last_period), length, min(max(period_length or 5, 1), length))
+
+
+def cycle_windows(cycle: Cycle, k: int) -> CycleWindows:
+    start = cycle.start + k * cycle.length
+    period_end = start + cycle.period_length - 1
+    ovulation = start + max(cycle.length - LUTEAL_DAYS, 0)
+    return CycleWindows(
+        start=start,
+        period_end=period_end,
+        fertile_start=max(ovulation - FERTILE_BEFORE, period_end + 1),
+        ovulation=ovulation,
+        fertile_end=ovulation + FERTILE_AFTER,
+        next_start=start + cycle.length,
+    )
+
+
+def current_windows(cycle: Cycle, today: int) -> CycleWindows:
+    """The cycle containing `today` (the first one if today precedes it)"""
+    return cycle_windows(cycle, max((today - cycle.start) // cycle.length, 0))
+
+
+def resolve_range(cycle: Cycle, from_: Optional[str], to: Optional[str]) -> Tuple[int, int]:
+    """Validated inclusive (first, last) ordinals; raises ValueError on bad input"""
+    first = to_ordinal(from_) if from_ else cycle.start
+    if to:
+        last = to_ordinal(to)
+    else:
+        # Long cycles would take the default past the maximum range
+        last = first + min(DEFAULT_CYCLES * cycle.length, MAX_RANGE_DAYS) - 1
+    if first > last:
+        raise ValueError("from deve precedere to")
+    if last - first >= MAX_RANGE_DAYS:
+        raise ValueError(f"Intervallo massimo: {MAX_RANGE_DAYS} giorni")
+    return first, last
+
+
+def _clip(first: int, last: int, lo: int, hi: int) -> Optional[Interval]:
+    lo, hi = max(lo, first), min(hi, last)
+    return (lo, hi) if lo <= hi else None
+
+
+def build_calendar(cycle: Cycle, first: int, last: int) -> FertilityCalendar:
+    """Periods, fertile windows and ovulations within [first, last]"""
+    periods, fertile, ovulations = [], [], []
+    k_last = (last - cycle.start) // cycle.length
+    for k in range(max((first - cycle.start) // cycle.length, 0), k_last + 1):
+        w = cycle_windows(cycle, k)
+        period = _clip(first, last, w.start, w.period_end)
+        if period:
+            periods.append(period)
+        window = _clip(first, last, w.fertile_start, w.fertile_end)
+        if window:
+            fertile.append(window)
+        if first <= w.ovulation <= last:
+            ovulations.append(w.ovulation)
+    return FertilityCalendar(first, last, periods, fertile, ovulations)
+
+
+def expand(intervals: List[Interval]) -> List[str]:
+    return [iso(d) for lo, hi in intervals for d in range(lo, hi + 1)]
+
+
+def day_lists(calendar: FertilityCalendar) -> dict:
+    """The classic payload: one YYYY-MM-DD string per day"""
+    return {
+        "periods": expand(calendar.periods),
+        "fertile_days": expand(calendar.fertile),
+        "ovulation_days": [iso(d) for d in calendar.ovulations],
+    }
+
+
+def interval_payload(calendar: FertilityCalendar) -> dict:
+    first = calendar.first
+    return {
+        "format": "intervals",
+        "from": iso(first),
+        "to": iso(calendar.last),
+        "periods": [[lo - first, hi - first] for lo, hi in calendar.periods],
+        "fertile": [[lo - first, hi - first] for lo, hi in calendar.fertile],
+        "ovulations": [d - first for d in calendar.ovulations],
+    }
+
+
+def bitmap_payload(calendar: FertilityCalendar) -> dict:
+    """`status[i]` is the status of day `from + i`"""
+    first = calendar.first
+    status = [STATUS_SAFE] * (calendar.last - first + 1)
+    for intervals, code in ((calendar.fertile, STATUS_FERTILE), (calendar.periods, STATUS_PERIOD)):
+        for lo, hi in intervals:
+            status[lo - first:hi - first + 1] = code * (hi - lo + 1)
+    for day in calendar.ovulations:
+        if status[day - first] != STATUS_PERIOD:
+            status[day - first] = STATUS_OVULATION
+    return {
+        "format": "bitmap",
+        "from": iso(first),
+        "to": iso(calendar.last),
+        "status": "".join(status),
+        "legend": {STATUS_SAFE: "safe", STATUS_PERIOD: "period", STATUS_FERTILE: "fertile", STATUS_OVULATION: "ovulation"},
+    }
+
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ValueError(f"format deve essere uno tra {', '.join(FORMATS)}")
+
+
+def calendar_payload(calendar: Optional[FertilityCalendar], fmt: str = "days") -> dict:
+    """Response for the requested format; `calendar` is None when there is no cycle data"""
+    if calendar is None:
+        if fmt == "days":
+            return {"periods": [], "fertile_days": [], "ovulation_days": []}
+        if fmt == "intervals":
+            return {"format": fmt, "from": None, "to": None, "periods": [], "fertile": [], "ovulations": []}
+        return {"format": fmt, "from": None, "to": None, "status": ""}
+    if fmt == "intervals":
+        return interval_payload(calendar)
+    if fmt == "bitmap":
+        return bitmap_payload(calendar)
+    return day_lists(calendar)
+
+
+class CalendarCache:
+    """Per-user cycle parameters, plus calendars memoized by (cycle, first, last).
+
+    A calendar depends only on its key, so those entries never go stale.
+    The user -> cycle entries are dropped by `invalidate` on every cycle
+    write. A lookup that started before an invalidation is not stored
+    (see `generation`).
+    """
+
+    def __init__(self, max_users: int = 10_000, max_calendars: int = 20_000):
+        self.max_users = max_users
+        self.max_calendars = max_calendars
+        self._users = OrderedDict()      # user_id -> Optional[Cycle]
+        self._calendars = OrderedDict()  # (cycle, first, last) -> FertilityCalendar
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.counters = {"cycle_hits": 0, "cycle_misses": 0, "calendar_hits": 0, "calendar_misses": 0}
+
+    def user_cycle(self, user_id: str) -> Tuple[bool, Optional[Cycle]]:
+        """(found, cycle); a found None means the user has no cycle data"""
+        with self._lock:
+            if user_id in self._users:
+                self._users.move_to_end(user_id)
+                self.counters["cycle_hits"] += 1
+                return True, self._users[user_id]
+            self.counters["cycle_misses"] += 1
+            return False, None
+
+    def put_user_cycle(self, user_id: str, cycle: Optional[Cycle], generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return  # a cycle write happened while this lookup was running
+            self._users[user_id] = cycle
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, *user_ids: str):
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+    def calendar(self, cycle: Cycle, first: int, last: int) -> FertilityCalendar:
+        key = (cycle, first, last)
+        with self._lock:
+            cached = self._calendars.get(key)
+            if cached is not None:
+                self._calendars.move_to_end(key)
+                self.counters["calendar_hits"] += 1
+                return cached
+            self.counters["calendar_misses"] += 1
+        calendar = build_calendar(cycle, first, last)
+        with self._lock:
+            self._calendars[key] = calendar
+            while len(self._calendars) > self.max_calendars:
+                self._calendars.popitem(last=False)
+        return calendar
+
+    def stats(self) -> dict:
+        with self._lock:
+            c = self.counters
+            cycle_lookups = c["cycle_hits"] + c["cycle_misses"]
+            calendar_lookups = c["calendar_hits"] + c["calendar_misses"]
+            return {
+                "users": len(self._users),
+                "calendars": len(self._calendars),
+                **c,
+                "cycle_hit_rate": round(c["cycle_hits"] / cycle_lookups, 3) if cycle_lookups else 0,
+                "calendar_hit_rate": round(c["calendar_hits"] / calendar_lookups, 3) if calendar_lookups else 0,
+            }
@@ -0,0 +1,69 @@
+"""Conditional GET helpers shared by both backends.
+
+`conditional_json` renders the payload once, tags it with a strong ETag
+computed from the body, and answers 304 Not Modified when the client's
+If-None-Match already names it. `conditional_body` does the same for a
+pre-rendered body and also honours If-Modified-Since.
+"""
+import hashlib
+import json
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+
+from fastapi import Request, Response
+
+
+def render_json(payload) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def body_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match comparison (weak, as RFC 9110 requires for GET)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any((tag[2:] if tag.startswith("W/") else tag) == etag for tag in candidates)
+
+
+def not_modified_since(if_modified_since: Optional[str], last_modified: datetime) -> bool:
+    """last_modified is naive UTC; unparseable dates count as modified"""
+    if not if_modified_since:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is not None:
+        since = since.replace(tzinfo=None) - since.utcoffset()
+    return last_modified.replace(microsecond=0) <= since
+
+
+def conditional_body(request: Request, body: bytes, media_type: str, etag: str,
+                     last_modified: Optional[datetime] = None,
+                     cache_control: str = "private, no-cache") -> Response:
+    """The body, or an empty 304 when the client's validators still match.
+    
+    If-None-Match takes precedence; If-Modified-Since is only checked without it.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, etag)
+    else:
+        not_modified = last_modified is not None and not_modified_since(request.headers.get("if-modified-since"), last_modified)
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def conditional_json(request: Request, payload, cache_control: str = "private, no-cache") -> Response:
+    """JSON response with an ETag, or an empty 304 when the client already has it"""
+    body = render_json(payload)
+    return conditional_body(request, body, "application/json", body_etag(body), cache_control=cache_control)
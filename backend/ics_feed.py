@@ -0,0 +1,179 @@
+"""iCalendar (RFC 5545) feed of a couple's special dates and predicted periods.
+
+Calendar apps poll subscription URLs every few minutes. `FeedCache` keeps
+the rendered feed per couple until the next special-date or cycle write
+(or the next day, since predictions start from the current cycle). It
+also remembers when the content last changed, so polls revalidate to 304
+through either ETag or Last-Modified.
+
+Every DTSTAMP comes from the stored rows, so rebuilding unchanged data
+gives byte-identical output and the same ETag.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+
+from fertility import Cycle, Interval, build_calendar, current_windows, iso
+from http_cache import body_etag
+
+PRODID = "-//Couple Bliss//Calendario di coppia//IT"
+UID_DOMAIN = "couplebliss"
+PREDICTED_CYCLES = 6
+MAX_LINE_OCTETS = 75
+
+
+def escape_text(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line: str) -> str:
+    """Split lines longer than 75 octets; continuation lines start with a space"""
+    if len(line.encode("utf-8")) <= MAX_LINE_OCTETS:
+        return line
+    parts, current, size = [], "", 0
+    for char in line:
+        width = len(char.encode("utf-8"))
+        if size + width > MAX_LINE_OCTETS:
+            parts.append(current)
+            current, size = " ", 1
+        current += char
+        size += width
+    parts.append(current)
+    return "\r\n".join(parts)
+
+
+def utc_stamp(value: Optional[datetime]) -> str:
+    if value is None:
+        return "19700101T000000Z"
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _ics_date(ordinal: int) -> str:
+    return iso(ordinal).replace("-", "")
+
+
+def special_date_event(d: dict) -> Iterator[str]:
+    """d: id/date/title/time/notes/created_at; all-day unless a time is set"""
+    day = d["date"].replace("-", "")
+    yield "BEGIN:VEVENT"
+    yield f"UID:special-{d['id']}@{UID_DOMAIN}"
+    yield f"DTSTAMP:{utc_stamp(d.get('created_at'))}"
+    if d.get("time"):
+        # Floating local time: shown at the same clock time wherever the phone is
+        yield f"DTSTART:{day}T{d['time'].replace(':', '')[:4]}00"
+        yield "DURATION:PT1H"
+    else:
+        yield f"DTSTART;VALUE=DATE:{day}"
+        yield "DURATION:P1D"
+    yield f"SUMMARY:{escape_text(d['title'])}"
+    if d.get("notes"):
+        yield f"DESCRIPTION:{escape_text(d['notes'])}"
+    yield "END:VEVENT"
+
+
+def period_event(couple_code: str, period: Interval, stamp: Optional[datetime]) -> Iterator[str]:
+    first, last = period
+    yield "BEGIN:VEVENT"
+    yield f"UID:period-{couple_code}-{iso(first)}@{UID_DOMAIN}"
+    yield f"DTSTAMP:{utc_stamp(stamp)}"
+    yield f"DTSTART;VALUE=DATE:{_ics_date(first)}"
+    yield f"DTEND;VALUE=DATE:{_ics_date(last + 1)}"
+    yield "SUMMARY:Ciclo previsto"
+    yield "TRANSP:TRANSPARENT"
+    yield "END:VEVENT"
+
+
+def predicted_periods(cycle: Optional[Cycle], today: int) -> List[Interval]:
+    """Periods of the current cycle and the next ones"""
+    if cycle is None:
+        return []
+    start = current_windows(cycle, today).start
+    return build_calendar(cycle, start, start + PREDICTED_CYCLES * cycle.length - 1).periods
+
+
+def render_feed(couple_code: str, special_dates: Iterable[dict], periods: Iterable[Interval],
+                cycle_stamp: Optional[datetime]) -> bytes:
+    """The whole VCALENDAR; `special_dates` can be a streaming cursor"""
+    def lines():
+        yield "BEGIN:VCALENDAR"
+        yield "VERSION:2.0"
+        yield f"PRODID:{PRODID}"
+        yield "CALSCALE:GREGORIAN"
+        yield "METHOD:PUBLISH"
+        yield "X-WR-CALNAME:Couple Bliss"
+        for d in special_dates:
+            yield from special_date_event(d)
+        for period in periods:
+            yield from period_event(couple_code, period, cycle_stamp)
+        yield "END:VCALENDAR"
+    return ("\r\n".join(fold(line) for line in lines()) + "\r\n").encode("utf-8")
+
+
+class Feed(NamedTuple):
+    body: bytes
+    etag: str
+    last_modified: datetime  # when this content first appeared (UTC)
+
+
+class FeedCache:
+    """Rendered feeds per couple code, valid for one day until invalidated.
+
+    Invalidated entries are kept as a tombstone: if the rebuilt feed has the
+    same ETag, its Last-Modified is carried over. The TTL covers writes
+    handled by other worker processes.
+    """
+
+    def __init__(self, max_feeds: int = 5000, ttl_seconds: float = 900):
+        self.max_feeds = max_feeds
+        self.ttl_seconds = ttl_seconds
+        self._feeds = OrderedDict()  # couple_code -> (expires_at, day, Feed)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, couple_code: str, day) -> Optional[Feed]:
+        with self._lock:
+            entry = self._feeds.get(couple_code)
+            if entry is None or entry[1] != day or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._feeds.move_to_end(couple_code)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, couple_code: str, day, body: bytes) -> Feed:
+        etag = body_etag(body)
+        with self._lock:
+            previous = self._feeds.get(couple_code)
+            if previous is not None and previous[2].etag == etag:
+                last_modified = previous[2].last_modified
+            else:
+                last_modified = datetime.utcnow().replace(microsecond=0)
+            feed = Feed(body, etag, last_modified)
+            self._feeds[couple_code] = (time.monotonic() + self.ttl_seconds, day, feed)
+            self._feeds.move_to_end(couple_code)
+            while len(self._feeds) > self.max_feeds:
+                self._feeds.popitem(last=False)
+            return feed
+
+    def invalidate(self, *couple_codes: Optional[str]):
+        with self._lock:
+            for code in couple_codes:
+                entry = self._feeds.get(code)
+                if entry is not None:
+                    self._feeds[code] = (0, entry[1], entry[2])
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "feeds": len(self._feeds),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
@@ -0,0 +1,106 @@
+"""Mood analytics for one couple, computed by a single windowed query.
+
+Both backends group mood entries by day and run window functions over the
+result (SQL `OVER`, Mongo `$setWindowFields`). They produce one row per
+logged day, with these keys:
+
+- date, day (days since 1970-01-01), n, <metric>_sum: that day's entries
+- n_<w>d, <metric>_<w>d: sums over the trailing w-day window (w in WINDOWS)
+- weekday_n, weekday_mood_sum: totals of that row's weekday in the period
+- total_n, total_<metric>: totals of the period
+- sync, sync_days: mean partner sync (1 - |mood gap| / 4) on days both logged
+- recent_n / prior_n, recent_<t> / prior_<t>: sums over the last 7 days and
+  the 7 days before, for the trend metrics
+
+Rows before `start` are only fetched so that the first windows are full.
+`build_analytics` formats the rows and does no further aggregation.
+"""
+from datetime import date, timedelta
+from typing import Iterable, Tuple
+
+from stats_engine import WEEKDAY_NAMES_IT, day_number
+
+METRICS = ("mood", "energy", "stress", "libido")
+WINDOWS = (7, 30)
+TREND_METRICS = ("stress", "libido")
+TREND_DAYS = 7
+TREND_THRESHOLD = 0.3  # points on the 1-5 scale
+SYNC_SCALE = 4         # largest possible mood gap between partners
+DEFAULT_DAYS = 30
+MAX_DAYS = 366
+
+
+def analytics_range(days: int, today: date) -> Tuple[str, str, str]:
+    """(lookback, start, end) as YYYY-MM-DD; raises ValueError on bad input"""
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"days deve essere tra 1 e {MAX_DAYS}")
+    start = today - timedelta(days=days - 1)
+    lookback = start - timedelta(days=max(WINDOWS) - 1)
+    return lookback.isoformat(), start.isoformat(), today.isoformat()
+
+
+def trend_bounds(end: str) -> Tuple[int, int]:
+    """Day numbers starting the recent and the prior trend windows"""
+    end_day = day_number(date.fromisoformat(end))
+    return end_day - TREND_DAYS + 1, end_day - 2 * TREND_DAYS + 1
+
+
+def weekday_of(day: int) -> int:
+    """Monday = 0, for day numbers since 1970-01-01 (a Thursday)"""
+    return (day + 3) % 7
+
+
+def _avg(total, n, digits: int = 2):
+    return round(total / n, digits) if n else None
+
+
+def _trend(recent, prior) -> dict:
+    if recent is None or prior is None:
+        return {"recent": recent, "prior": prior, "change": None, "direction": "unknown"}
+    change = round(recent - prior, 2)
+    direction = "rising" if change > TREND_THRESHOLD else "falling" if change < -TREND_THRESHOLD else "stable"
+    return {"recent": recent, "prior": prior, "change": change, "direction": direction}
+
+
+def build_analytics(rows: Iterable[dict], start: str, end: str) -> dict:
+    """Response of the mood analytics endpoint; rows are sorted by day"""
+    rows = list(rows)
+    period = [r for r in rows if r["date"] >= start]
+    series = {"dates": [r["date"] for r in period]}
+    for w in WINDOWS:
+        for metric in METRICS:
+            series[f"{metric}_{w}d"] = [_avg(r[f"{metric}_{w}d"], r[f"n_{w}d"]) for r in period]
+
+    if not period:
+        return {
+            "from": start, "to": end, "entries_count": 0, "averages": {m: None for m in METRICS},
+            "series": series, "sync_score": None, "sync_days": 0, "weekday_profile": [],
+            "best_day": None, "trends": {t: _trend(None, None) for t in TREND_METRICS},
+        }
+
+    totals = rows[-1]  # period-wide windows repeat the same values on every row
+    weekdays = {}
+    for r in period:
+        weekdays.setdefault(weekday_of(r["day"]), r)
+    profile = [{
+        "weekday": WEEKDAY_NAMES_IT[wd],
+        "average_mood": _avg(weekdays[wd]["weekday_mood_sum"], weekdays[wd]["weekday_n"], 1),
+        "entries": int(weekdays[wd]["weekday_n"]),
+    } for wd in sorted(weekdays)]
+    best = max(profile, key=lambda p: p["average_mood"] or 0)
+
+    return {
+        "from": start,
+        "to": end,
+        "entries_count": int(totals["total_n"]),
+        "averages": {m: _avg(totals[f"total_{m}"], totals["total_n"], 1) for m in METRICS},
+        "series": series,
+        "sync_score": round(totals["sync"] * 100) if totals["sync"] is not None else None,
+        "sync_days": int(totals["sync_days"] or 0),
+        "weekday_profile": profile,
+        "best_day": best["weekday"],
+        "trends": {
+            t: _trend(_avg(totals[f"recent_{t}"], totals["recent_n"]), _avg(totals[f"prior_{t}"], totals["prior_n"]))
+            for t in TREND_METRICS
+        },
+    }
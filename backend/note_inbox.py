@@ -0,0 +1,104 @@
+"""Long-poll wakeups for new love notes.
+
+`send_love_note` calls `publish()` after its write. Clients park on
+`wait()`, which holds the request on a per-couple asyncio.Condition until
+a note for them arrives or the timeout elapses.
+
+The cursor is the id of the newest note the user has received, read from
+the database by the endpoint's `latest` callback, so it means the same in
+every worker and across restarts. `wait()` reads it once when called and
+again after a wakeup. A parked request costs no queries. A cursor other
+than the current one, or no cursor at all, answers at once. Wakeups only
+cover notes sent through the same process. A note sent through another
+worker shows up when the client's wait times out and it asks again.
+"""
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+MAX_WAIT_SECONDS = 25
+
+
+class _CoupleInbox:
+    __slots__ = ("total", "sent", "condition", "waiters")
+
+    def __init__(self):
+        self.total = 0
+        self.sent: Dict[str, int] = {}  # sender_id -> notes sent
+        self.condition = asyncio.Condition()
+        self.waiters = 0
+
+    def received(self, user_id: str) -> int:
+        return self.total - self.sent.get(user_id, 0)
+
+
+class NoteInbox:
+    def __init__(self, max_couples: int = 50_000):
+        self.max_couples = max_couples
+        self._couples = OrderedDict()  # couple_code -> _CoupleInbox
+        self.published = 0
+        self.woken = 0
+        self.timeouts = 0
+
+    def _inbox(self, couple_code: str) -> _CoupleInbox:
+        inbox = self._couples.get(couple_code)
+        if inbox is None:
+            inbox = self._couples[couple_code] = _CoupleInbox()
+            self._evict()
+        self._couples.move_to_end(couple_code)
+        return inbox
+
+    def _evict(self):
+        """Drop the least recently used couples nobody is waiting on"""
+        for code in list(self._couples):
+            if len(self._couples) <= self.max_couples:
+                return
+            if not self._couples[code].waiters:
+                del self._couples[code]
+
+    async def publish(self, couple_code: str, sender_id: str):
+        """A note was stored; wakes the couple's waiters. Must be called on the event loop"""
+        inbox = self._inbox(couple_code)
+        inbox.total += 1
+        inbox.sent[sender_id] = inbox.sent.get(sender_id, 0) + 1
+        self.published += 1
+        if inbox.waiters:
+            async with inbox.condition:
+                inbox.condition.notify_all()
+
+    async def wait(self, couple_code: str, user_id: str, after: Optional[str],
+                   latest: Callable[[], Awaitable[str]],
+                   timeout: float = MAX_WAIT_SECONDS) -> Tuple[bool, str]:
+        """(changed, cursor): returns once `latest()` moves past `after`, or after `timeout` seconds"""
+        inbox = self._inbox(couple_code)
+        # Counted as a waiter (so not evicted) and snapshotted before the read,
+        # so a note published while it runs still wakes this request
+        inbox.waiters += 1
+        try:
+            received = inbox.received(user_id)
+            cursor = await latest()
+            if cursor != after:
+                return True, cursor
+            try:
+                async with inbox.condition:
+                    await asyncio.wait_for(
+                        inbox.condition.wait_for(lambda: inbox.received(user_id) != received),
+                        timeout=max(0.0, min(timeout, MAX_WAIT_SECONDS))
+                    )
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return False, after
+            self.woken += 1
+            cursor = await latest()
+            return cursor != after, cursor
+        finally:
+            inbox.waiters -= 1
+
+    def stats(self) -> dict:
+        return {
+            "couples": len(self._couples),
+            "waiting": sum(inbox.waiters for inbox in self._couples.values()),
+            "published": self.published,
+            "woken": self.woken,
+            "timeouts": self.timeouts,
+        }
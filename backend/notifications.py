@@ -0,0 +1,134 @@
+"""Partner push notifications, sent by a background worker.
+
+Endpoints call `notify()` after their commit and return at once. Events
+for the same (push token, kind) that arrive within `window_seconds` of the
+first one are merged into a single push whose text carries the total, for
+example "Il tuo partner ha aggiornato 5 desideri". When the window closes,
+the worker sends every due push in one request to the Expo push API,
+reusing a single HTTP client.
+
+The worker starts with the first event and runs on the event loop.
+`close()` (app shutdown) sends what is still pending. A push that fails
+is logged and dropped: notifications are best effort.
+"""
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+EXPO_PUSH_URL = "https://exp.host/--/api/v2/push/send"
+EXPO_MAX_MESSAGES = 100  # per request, as the Expo API allows
+
+# kind -> (title, text for one event, text for n events)
+MESSAGES = {
+    "desire_update": (
+        "💭 Desideri Segreti",
+        "Il tuo partner ha aggiornato un desiderio! Vai a vedere se avete nuovi match 😏",
+        "Il tuo partner ha aggiornato {n} desideri! Vai a vedere se avete nuovi match 😏",
+    ),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def render_message(token: str, kind: str, count: int) -> dict:
+    title, one, many = MESSAGES[kind]
+    return {
+        "to": token,
+        "title": title,
+        "body": one if count == 1 else many.format(n=count),
+        "sound": "default",
+        "data": {"type": kind, "count": count},
+    }
+
+
+class PartnerNotifier:
+    def __init__(self, window_seconds: float = 10.0, url: str = EXPO_PUSH_URL):
+        self.window_seconds = window_seconds
+        self.url = url
+        self._pending: Dict[Tuple[str, str], List] = {}  # (token, kind) -> [first event time, count]
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._client = None
+        self.events = 0
+        self.sent = 0
+        self.failed = 0
+
+    def notify(self, token: Optional[str], kind: str, count: int = 1):
+        """Queue `count` events for a recipient; must be called on the event loop"""
+        if not token or count <= 0:
+            return
+        if kind not in MESSAGES:
+            raise ValueError(f"Tipo di notifica sconosciuto: {kind}")
+        self._ensure_worker()
+        self.events += count
+        pending = self._pending.get((token, kind))
+        if pending is None:
+            self._pending[(token, kind)] = [self._loop.time(), count]
+            self._wake.set()
+        else:
+            pending[1] += count
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    def _take(self, due_before: float) -> List[dict]:
+        due = [key for key, (first, _) in self._pending.items() if first <= due_before]
+        return [render_message(token, kind, self._pending.pop((token, kind))[1]) for token, kind in due]
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            now = self._loop.time()
+            messages = self._take(now - self.window_seconds)
+            if messages:
+                await self._send(messages)
+                continue
+            first = min(first for first, _ in self._pending.values())
+            await asyncio.sleep(first + self.window_seconds - now)
+
+    async def _send(self, messages: List[dict]):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=10.0)
+        for i in range(0, len(messages), EXPO_MAX_MESSAGES):
+            batch = messages[i:i + EXPO_MAX_MESSAGES]
+            try:
+                response = await self._client.post(self.url, json=batch)
+                response.raise_for_status()
+                self.sent += len(batch)
+            except Exception as e:
+                self.failed += len(batch)
+                logger.warning("Push notification error: %s", e)
+
+    async def close(self):
+        """Stop the worker and send whatever is still pending"""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        messages = self._take(float("inf"))
+        if messages:
+            await self._send(messages)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "events": self.events,
+            "sent": self.sent,
+            "failed": self.failed,
+        }
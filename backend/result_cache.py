@@ -0,0 +1,131 @@
+"""In-process LRU + TTL cache for endpoint results that only change on writes.
+
+Entries are keyed by (endpoint, scope, day), where scope is the couple_code
+or user_id the result belongs to and day is "today" as seen by the
+endpoint. Write handlers call `invalidate(scope)` after committing. A
+result computed while an invalidation ran is not stored (see `generation`),
+so a read that started before a write can't cache what it saw. The TTL
+is a safety net for writes handled by other worker processes.
+"""
+import functools
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Callable, Hashable, Optional
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 5000, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._by_scope = {}  # scope -> set of keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: tuple):
+        """Return the cached value, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key: tuple, value, generation: Optional[int] = None):
+        """Store a value; with `generation`, only if nothing was invalidated since it was read"""
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, size, value)
+            self._by_scope.setdefault(key[1], set()).add(key)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, *scopes: Optional[str]):
+        """Drop every endpoint result for the given couple codes / user ids"""
+        with self._lock:
+            self.generation += 1
+            for scope in scopes:
+                for key in self._by_scope.pop(scope, ()):
+                    if key in self._entries:
+                        self._remove(key, drop_from_scope=False)
+                        self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_scope.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key: tuple, drop_from_scope: bool = True):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        if drop_from_scope:
+            keys = self._by_scope.get(key[1])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_scope[key[1]]
+
+    def cached(self, endpoint: str, scope: str = "couple_code", today: Callable[[], Hashable] = date.today):
+        """Cache an async endpoint by (endpoint, <scope argument>, today()).
+
+        Results reporting {"success": False} are not cached.
+        """
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                key = (endpoint, kwargs[scope], today())
+                result = self.get(key)
+                if result is None:
+                    generation = self.generation
+                    result = await func(*args, **kwargs)
+                    if not (isinstance(result, dict) and result.get("success") is False):
+                        self.put(key, result, generation)
+                return result
+            return wrapper
+        return decorator
+
+
+def _estimate_size(value) -> int:
+    """Approximate footprint: length of the JSON encoding"""
+    try:
+        return len(json.dumps(value, default=str))
+    except (TypeError, ValueError):
+        return 1024
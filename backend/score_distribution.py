@@ -0,0 +1,80 @@
+"""Distribution of sessometro scores across couples, for percentile ranking.
+
+Scores lie in [0, 10] and are shown with one decimal, so a fixed histogram
+of 101 buckets is exact and takes O(1) memory and time per query. Unlike a
+t-digest or KLL sketch, it can also move a couple from its old score to
+its new one.
+
+Bucket deltas are kept in memory. The backend persists them every
+`flush_interval` seconds by adding them to the stored counts, then
+reloads the totals so that deltas from other workers show up too.
+"""
+import threading
+import time
+from typing import Dict, Mapping, Optional
+
+SCORE_BUCKETS = 101
+
+
+def score_bucket(score: float) -> int:
+    return min(max(int(round(score * 10)), 0), SCORE_BUCKETS - 1)
+
+
+class ScoreHistogram:
+    def __init__(self, flush_interval: float = 60):
+        self.flush_interval = flush_interval
+        self.loaded = False
+        self._counts = [0] * SCORE_BUCKETS
+        self._pending: Dict[int, int] = {}
+        self._below = None  # prefix sums, rebuilt lazily
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def load(self, stored: Mapping[int, int]):
+        """Replace the snapshot with persisted counts (plus deltas not flushed yet)"""
+        with self._lock:
+            self._counts = [stored.get(b, 0) + self._pending.get(b, 0) for b in range(SCORE_BUCKETS)]
+            self._below = None
+            self.loaded = True
+
+    def move(self, old: Optional[float], new: Optional[float]):
+        """Record that a couple's score changed from `old` to `new` (None = not ranked)"""
+        with self._lock:
+            for score, delta in ((old, -1), (new, 1)):
+                if score is None:
+                    continue
+                bucket = score_bucket(score)
+                self._counts[bucket] += delta
+                self._pending[bucket] = self._pending.get(bucket, 0) + delta
+            self._below = None
+
+    @property
+    def total(self) -> int:
+        return sum(self._counts)
+
+    def percentile(self, score: float) -> Optional[float]:
+        """Share of couples scoring lower, counting ties as half (0-100)"""
+        with self._lock:
+            if self._below is None:
+                below, running = [], 0
+                for count in self._counts:
+                    below.append(running)
+                    running += count
+                self._below = below + [running]
+            total = self._below[-1]
+            if total <= 0:
+                return None
+            bucket = score_bucket(score)
+            ties = self._counts[bucket]
+            return round((self._below[bucket] + ties / 2) / total * 100, 1)
+
+    def flush_due(self) -> bool:
+        return time.monotonic() - self._last_flush >= self.flush_interval
+
+    def take_pending(self) -> Dict[int, int]:
+        """Hand the unflushed deltas to the caller for persisting"""
+        with self._lock:
+            pending = {b: d for b, d in self._pending.items() if d}
+            self._pending = {}
+            self._last_flush = time.monotonic()
+            return pending
@@ -0,0 +1,120 @@
+"""Vectorized sessometro scoring for many couples at once.
+
+`score_chunk` takes the entries of a whole chunk of couples as flat arrays
+plus a couple index per entry. All per-couple aggregates come from
+np.bincount / np.unique over the chunk, without a Python loop per couple.
+`derive_scores` turns aggregates into scores and accepts scalars as well,
+so the on-request path of the stats endpoint shares the same formulas.
+
+Used by the nightly `score-couples` job in server.py. `score_chunk` is a
+pure function, so it can run in a multiprocessing pool.
+"""
+from datetime import date
+from typing import Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+from stats_engine import _EPOCH_ORDINAL, day_number, weekdays
+
+
+class ChunkPayload(NamedTuple):
+    codes: Sequence[str]    # couple codes, in checkpoint order
+    couple_idx: np.ndarray  # index into codes, per entry
+    days: np.ndarray        # int64 days since 1970-01-01, per entry
+    ratings: np.ndarray     # int64 quality ratings, per entry
+
+
+def derive_scores(monthly_count, prev_month_count, average_quality, monthly_average_quality, streak, spontaneity) -> Dict[str, np.ndarray]:
+    """Sessometro score, passion trend and romance vs passion from aggregates (arrays or scalars)"""
+    monthly_count = np.asarray(monthly_count, dtype=float)
+    prev_month_count = np.asarray(prev_month_count, dtype=float)
+    monthly_average_quality = np.asarray(monthly_average_quality, dtype=float)
+
+    frequency_score = np.minimum(monthly_count / 8 * 10, 10)
+    quality_score = np.asarray(average_quality, dtype=float) * 2
+    streak_score = np.minimum(np.asarray(streak, dtype=float) * 2, 10)
+    sessometro_score = frequency_score * 0.4 + quality_score * 0.35 + streak_score * 0.25
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        trend_change = np.where(prev_month_count > 0, (monthly_count - prev_month_count) / prev_month_count * 100, 0)
+    passion_trend = np.where(
+        prev_month_count > 0,
+        np.where(trend_change > 20, "rising", np.where(trend_change < -20, "cooling", "stable")),
+        np.where(monthly_count > 0, "rising", "stable"),
+    )
+
+    romance_vs_passion = np.select(
+        [
+            (monthly_count > 8) & (monthly_average_quality < 3.5),
+            (monthly_count < 4) & (monthly_average_quality > 4),
+            (monthly_count > 8) & (monthly_average_quality > 4),
+        ],
+        ["più passione", "più romanticismo", "fuoco totale"],
+        default="equilibrato",
+    )
+    return {
+        "sessometro_score": np.round(sessometro_score, 1),
+        "passion_trend": passion_trend,
+        "spontaneity": np.asarray(spontaneity, dtype=np.int64),
+        "romance_vs_passion": romance_vs_passion,
+    }
+
+
+def _current_week_streaks(couple_idx: np.ndarray, days: np.ndarray, n: int, today_n: int) -> np.ndarray:
+    """Consecutive active weeks per couple ending this week or last week"""
+    streak = np.zeros(n, dtype=np.int64)
+    if days.size == 0:
+        return streak
+    weeks = (days + _EPOCH_ORDINAL - 1) // 7
+    # Unique (couple, week) pairs, sorted by couple then week
+    pairs = np.unique(np.stack([couple_idx, weeks], axis=1), axis=0)
+    couples, weeks = pairs[:, 0], pairs[:, 1]
+    new_run = np.ones(len(pairs), dtype=bool)
+    new_run[1:] = (couples[1:] != couples[:-1]) | (weeks[1:] != weeks[:-1] + 1)
+    run_id = np.cumsum(new_run) - 1
+    run_start = np.flatnonzero(new_run)
+    position = np.arange(len(pairs)) - run_start[run_id]
+    # The last pair of each couple closes its most recent run
+    last = np.ones(len(pairs), dtype=bool)
+    last[:-1] = couples[1:] != couples[:-1]
+    this_week = (today_n + _EPOCH_ORDINAL - 1) // 7
+    alive = last & (weeks >= this_week - 1)
+    streak[couples[alive]] = position[alive] + 1
+    return streak
+
+
+def score_chunk(payload: ChunkPayload, today: date) -> List[dict]:
+    """One score row per couple in the chunk"""
+    codes, couple_idx, days, ratings = payload
+    n = len(codes)
+    today_n = day_number(today)
+    monthly = days > today_n - 30
+    prev_month = (days > today_n - 60) & ~monthly
+
+    total = np.bincount(couple_idx, minlength=n)
+    quality_sum = np.bincount(couple_idx, weights=ratings, minlength=n)
+    monthly_count = np.bincount(couple_idx[monthly], minlength=n)
+    monthly_quality = np.bincount(couple_idx[monthly], weights=ratings[monthly], minlength=n)
+    prev_month_count = np.bincount(couple_idx[prev_month], minlength=n)
+
+    # Distinct weekdays in the last 30 days
+    weekday_keys = np.unique(couple_idx[monthly] * 7 + weekdays(days[monthly]))
+    active_weekdays = np.bincount(weekday_keys // 7, minlength=n)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        average_quality = np.where(total > 0, quality_sum / total, 0)
+        monthly_average_quality = np.where(monthly_count > 0, monthly_quality / monthly_count, 0)
+
+    scores = derive_scores(
+        monthly_count, prev_month_count, average_quality, monthly_average_quality,
+        _current_week_streaks(couple_idx, days, n, today_n),
+        active_weekdays * 100 // 7,
+    )
+    return [{
+        "couple_code": codes[i],
+        "sessometro_score": float(scores["sessometro_score"][i]),
+        "passion_trend": str(scores["passion_trend"][i]),
+        "spontaneity": int(scores["spontaneity"][i]),
+        "romance_vs_passion": str(scores["romance_vs_passion"][i]),
+        "entries": int(total[i]),
+    } for i in range(n)]
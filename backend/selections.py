@@ -0,0 +1,160 @@
+"""Catalog selections (wishlist, secret desires) as bitmasks.
+
+A user's picks from one catalog are a single integer: bit i is the i-th
+item of the catalog section. The partner match is `mine & partner`, and
+counts are popcounts. There is no row per wish and no list intersection.
+
+Bit positions must never move, so these catalog sections are append-only
+(see Catalog's `append_only`). MAX_BITS keeps a mask inside a signed
+BIGINT column.
+
+`python selections.py` benchmarks the mask path against the row/list form
+it replaces.
+"""
+from typing import Iterable, List, Sequence, Tuple
+
+MAX_BITS = 63
+
+
+def popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+class BitLayout:
+    """Catalog item id <-> bit of a selection mask"""
+
+    def __init__(self, ids: Sequence[str]):
+        if len(ids) > MAX_BITS:
+            raise ValueError(f"Catalogo troppo grande per una maschera ({len(ids)} > {MAX_BITS})")
+        self.ids = tuple(ids)
+        self.bits = {item_id: 1 << i for i, item_id in enumerate(self.ids)}
+        self.full = (1 << len(self.ids)) - 1
+
+    @classmethod
+    def of(cls, section) -> "BitLayout":
+        return cls([item["id"] for item in section.items])
+
+    def bit(self, item_id: str) -> int:
+        try:
+            return self.bits[item_id]
+        except KeyError:
+            raise ValueError(f"Elemento non presente nel catalogo: {item_id}")
+
+    def mask(self, item_ids: Iterable[str]) -> int:
+        """Raises ValueError on ids outside the catalog"""
+        mask = 0
+        for item_id in item_ids:
+            mask |= self.bit(item_id)
+        return mask
+
+    def split(self, item_ids: Iterable[str]) -> Tuple[int, List[str]]:
+        """(mask of the known ids, unknown ids), for migrations"""
+        mask, unknown = 0, []
+        for item_id in item_ids:
+            bit = self.bits.get(item_id)
+            if bit is None:
+                unknown.append(item_id)
+            else:
+                mask |= bit
+        return mask, unknown
+
+    def ids_of(self, mask: int) -> List[str]:
+        """Selected ids in catalog order; bits past the catalog end are ignored"""
+        mask &= self.full
+        ids = []
+        while mask:
+            low = mask & -mask
+            ids.append(self.ids[low.bit_length() - 1])
+            mask ^= low
+        return ids
+
+
+def _list_matches(mine: List[str], partner: List[str]):
+    """The row/JSON form: set intersections over id lists"""
+    matches = set(mine) & set(partner)
+    return list(mine), list(matches), len(set(partner) - set(mine))
+
+
+def _mask_matches(layout: BitLayout, mine: int, partner: int):
+    return layout.ids_of(mine), layout.ids_of(mine & partner), popcount(partner & ~mine)
+
+
+def _bench_reads(pairs, layout: BitLayout, lookups: int):
+    """Per-request read + match from SQLite: one row per wish vs one mask per user"""
+    import sqlite3
+    import time
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE wishlist (couple_code TEXT, user_id TEXT, item_id TEXT)")
+    conn.execute("CREATE INDEX ix_wishlist_couple ON wishlist (couple_code)")
+    conn.execute("CREATE TABLE selections (couple_code TEXT, user_id TEXT, catalog TEXT, mask INTEGER, "
+                 "PRIMARY KEY (couple_code, user_id, catalog))")
+    for n, (mine, partner) in enumerate(pairs):
+        code = f"C{n}"
+        conn.executemany("INSERT INTO wishlist VALUES (?, ?, ?)",
+                         [(code, "a", i) for i in mine] + [(code, "b", i) for i in partner])
+        conn.executemany("INSERT INTO selections VALUES (?, ?, 'wishlist', ?)",
+                         [(code, "a", layout.mask(mine)), (code, "b", layout.mask(partner))])
+    codes = [f"C{n % len(pairs)}" for n in range(lookups)]
+
+    start = time.perf_counter()
+    for code in codes:
+        rows = conn.execute("SELECT user_id, item_id FROM wishlist WHERE couple_code = ?", (code,)).fetchall()
+        _list_matches([i for u, i in rows if u == "a"], [i for u, i in rows if u != "a"])
+    rows_s = (time.perf_counter() - start) / lookups
+
+    start = time.perf_counter()
+    for code in codes:
+        mine = partner = 0
+        for user_id, mask in conn.execute(
+                "SELECT user_id, mask FROM selections WHERE couple_code = ? AND catalog = 'wishlist'", (code,)):
+            if user_id == "a":
+                mine = mask
+            else:
+                partner |= mask
+        _mask_matches(layout, mine, partner)
+    masks_s = (time.perf_counter() - start) / lookups
+    conn.close()
+    return rows_s, masks_s
+
+
+def benchmark(couples: int = 100_000, catalog_size: int = 31, lookups: int = 20_000, seed: int = 7):
+    import random
+    import time
+
+    rng = random.Random(seed)
+    ids = [f"item_{i}" for i in range(catalog_size)]
+    layout = BitLayout(ids)
+    pairs = [(rng.sample(ids, rng.randint(0, catalog_size)), rng.sample(ids, rng.randint(0, catalog_size)))
+             for _ in range(couples)]
+    masks = [(layout.mask(mine), layout.mask(partner)) for mine, partner in pairs]
+
+    start = time.perf_counter()
+    for mine, partner in pairs:
+        _list_matches(mine, partner)
+    list_s = (time.perf_counter() - start) / couples
+
+    start = time.perf_counter()
+    for mine, partner in masks:
+        _mask_matches(layout, mine, partner)
+    mask_s = (time.perf_counter() - start) / couples
+
+    start = time.perf_counter()
+    for mine, partner in masks:
+        popcount(mine & partner)
+        popcount(partner & ~mine)
+    count_s = (time.perf_counter() - start) / couples
+
+    print(f"{catalog_size}-item catalog, {couples} couples (get_wishlist / get_desires matching)")
+    print(f"  id lists + sets : {list_s * 1e6:8.2f} us/couple")
+    print(f"  bitmask + ids   : {mask_s * 1e6:8.2f} us/couple ({list_s / mask_s:.1f}x)")
+    print(f"  bitmask counts  : {count_s * 1e6:8.2f} us/couple ({list_s / count_s:.1f}x)")
+
+    rows_s, masks_s = _bench_reads(pairs[:10_000], layout, lookups)
+    print(f"SQLite read + match, {lookups} requests")
+    print(f"  row per wish    : {rows_s * 1e6:8.2f} us/request")
+    print(f"  mask per user   : {masks_s * 1e6:8.2f} us/request ({rows_s / masks_s:.1f}x)")
+
+
+if __name__ == "__main__":
+    benchmark()
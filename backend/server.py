@@ -1,16 +1,47 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime, timedelta
+from typing import Any, Callable, Optional, List
+from datetime import date, datetime, timedelta
 import random
 import uuid
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, String, Integer, Float, Boolean, DateTime, Text, Date
+from sqlalchemy import create_engine, Column, String, Integer, BigInteger, Float, Boolean, DateTime, Text, Date, Index, case, func, insert, inspect, literal, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.sql.expression import FunctionElement
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+import asyncio
+from collections import deque
+import functools
 import json
+import multiprocessing
+import numpy as np
+import sys
+import time
+
+from badges import ALL_AGGREGATES, INTIMACY_AGGREGATES, newly_unlocked, pending_rules, required_aggregates, sort_badges
+from calendar_month import month_payload, month_range
+from calories import estimate_calories
+from catalog import Catalog
+from correlations import LOOKBACK_DAYS as CORRELATION_DAYS, PAIRS as CORRELATION_PAIRS, MoodChunk, coach_suggestions, correlate_chunk, insight_cards
+from fertility import Cycle, CalendarCache, calendar_payload, check_format, current_windows, iso, make_cycle, resolve_range as resolve_fertility_range
+from http_cache import conditional_body, conditional_json
+from mood_analytics import DEFAULT_DAYS as MOOD_ANALYTICS_DAYS, METRICS as MOOD_METRICS, SYNC_SCALE, TREND_METRICS, WINDOWS as MOOD_WINDOWS, analytics_range, build_analytics, trend_bounds
+from ics_feed import FeedCache, predicted_periods, render_feed
+from note_inbox import MAX_WAIT_SECONDS, NoteInbox
+from notifications import PartnerNotifier
+from result_cache import ResultCache
+from score_distribution import SCORE_BUCKETS, ScoreHistogram, score_bucket
+from scoring import ChunkPayload, derive_scores, score_chunk
+from selections import BitLayout, popcount
+from stats_engine import to_arrays, weekdays
+from streaks import StreakCache, Streaks, compute_streaks, to_ordinal, week_ordinal
+from timeseries import build_series, resolve_range
+from today_snapshot import MoodSnapshot, local_today
 
 load_dotenv()
 
@@ -34,6 +65,7 @@ class User(Base):
 
 class IntimacyLog(Base):
     __tablename__ = "intimacy_logs"
+    __table_args__ = (Index("ix_intimacy_logs_couple_date", "couple_code", "date"),)
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     couple_code = Column(String(10), nullable=False)
     date = Column(String(10), nullable=False)
@@ -55,8 +87,17 @@ class CycleData(Base):
     period_length = Column(Integer, default=5)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class Couple(Base):
+    """One row per couple; cycle_id points at the cycle its fertility views track"""
+    __tablename__ = "couples"
+    couple_code = Column(String(10), primary_key=True)
+    cycle_owner_id = Column(String(36))
+    cycle_id = Column(String(36))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class Mood(Base):
     __tablename__ = "moods"
+    __table_args__ = (Index("ix_moods_couple_date", "couple_code", "date"),)
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_id = Column(String(36), nullable=False)
     couple_code = Column(String(10), nullable=False)
@@ -69,6 +110,7 @@ class Mood(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class Wishlist(Base):
+    """Legacy row-per-wish form, folded into selections by `python server.py migrate-selections`"""
     __tablename__ = "wishlist"
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     couple_code = Column(String(10), nullable=False)
@@ -76,8 +118,18 @@ class Wishlist(Base):
     item_id = Column(String(50), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class Selection(Base):
+    """A user's picks from one catalog section (wishlist, desires) as a bitmask of item positions"""
+    __tablename__ = "selections"
+    couple_code = Column(String(10), primary_key=True)
+    user_id = Column(String(36), primary_key=True)
+    catalog = Column(String(30), primary_key=True)
+    mask = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 class SpecialDate(Base):
     __tablename__ = "special_dates"
+    __table_args__ = (Index("ix_special_dates_couple_date", "couple_code", "date"),)
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     couple_code = Column(String(10), nullable=False)
     title = Column(String(200), nullable=False)
@@ -97,6 +149,14 @@ class LoveNote(Base):
     category = Column(String(50))
     is_read = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    __table_args__ = (Index("ix_love_notes_couple_created", "couple_code", "created_at"),)
+
+class LoveNoteUnread(Base):
+    """Unread love notes per (couple, recipient), kept by send / mark-read in the note's transaction"""
+    __tablename__ = "love_note_unread"
+    couple_code = Column(String(10), primary_key=True)
+    user_id = Column(String(36), primary_key=True)
+    unread = Column(Integer, nullable=False, default=0)
 
 class WeeklyChallenge(Base):
     __tablename__ = "weekly_challenges"
@@ -107,6 +167,84 @@ class WeeklyChallenge(Base):
     completed = Column(Boolean, default=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
+class CoupleStats(Base):
+    """Running intimacy aggregates, maintained by log_intimacy/delete_intimacy"""
+    __tablename__ = "couple_stats"
+    couple_code = Column(String(10), primary_key=True)
+    total_count = Column(Integer, default=0)
+    quality_sum = Column(Integer, default=0)
+    max_duration = Column(Integer, default=0)
+    location_counts = Column(Text)  # JSON object: location -> entries
+    last_entry_date = Column(String(10))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class DailyRollup(Base):
+    """Per-couple per-day sums backing every windowed statistic"""
+    __tablename__ = "daily_rollups"
+    couple_code = Column(String(10), primary_key=True)
+    date = Column(String(10), primary_key=True)
+    week = Column(Integer)  # week_ordinal(date), so weekly series can GROUP BY it
+    intimacy_count = Column(Integer, default=0)
+    quality_sum = Column(Integer, default=0)
+    duration_sum = Column(Integer, default=0)
+    calories = Column(Float, default=0)
+    mood_count = Column(Integer, default=0)
+    mood_sum = Column(Integer, default=0)
+    energy_sum = Column(Integer, default=0)
+    stress_sum = Column(Integer, default=0)
+    libido_sum = Column(Integer, default=0)
+
+class CoupleBadge(Base):
+    """Badges a couple has unlocked; unlocks are permanent"""
+    __tablename__ = "couple_badges"
+    couple_code = Column(String(10), primary_key=True)
+    badge_id = Column(String(50), primary_key=True)
+    unlocked_at = Column(DateTime, default=datetime.utcnow)
+
+class CoupleScore(Base):
+    """Latest scores per couple: written nightly by `score-couples`, read by the stats endpoint"""
+    __tablename__ = "couple_scores"
+    couple_code = Column(String(10), primary_key=True)
+    sessometro_score = Column(Float)
+    passion_trend = Column(String(10))
+    spontaneity = Column(Integer)
+    romance_vs_passion = Column(String(30))
+    scored_on = Column(String(10))  # day of the last batch run that scored this couple
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CoupleInsight(Base):
+    """Mood <-> intimacy correlations per couple, written nightly by `correlate-moods`"""
+    __tablename__ = "couple_insights"
+    couple_code = Column(String(10), primary_key=True)
+    libido_frequency = Column(Float)
+    stress_quality = Column(Float)
+    energy_duration = Column(Float)
+    mood_days = Column(Integer, default=0)
+    paired_days = Column(Integer, default=0)
+    computed_on = Column(String(10))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class BatchCheckpoint(Base):
+    """Progress of a batch job run, so an interrupted run resumes where it stopped"""
+    __tablename__ = "batch_checkpoints"
+    job = Column(String(50), primary_key=True)
+    run_date = Column(String(10))
+    last_key = Column(String(36), default="")
+    processed = Column(Integer, default=0)
+    finished = Column(Boolean, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ScoreBucket(Base):
+    """Couples per 0.1-wide sessometro score bucket (0 = 0.0 ... 100 = 10.0)"""
+    __tablename__ = "score_histogram"
+    bucket = Column(Integer, primary_key=True, autoincrement=False)
+    couples = Column(Integer, default=0)
+
+ROLLUP_FIELDS = (
+    "intimacy_count", "quality_sum", "duration_sum", "calories",
+    "mood_count", "mood_sum", "energy_sum", "stress_sum", "libido_sum"
+)
+
 # Create tables
 Base.metadata.create_all(bind=engine)
 
@@ -260,6 +398,65 @@ WEEKLY_CHALLENGES = [
     {"id": "wc8", "title": "Esplorazione Sensoriale", "description": "Usate bende, piume, ghiaccio per esplorare le sensazioni"}
 ]
 
+DESIRE_ITEMS = [
+    {"id": "roleplay", "name": "Giochi di ruolo", "emoji": "🎭", "category": "fantasy"},
+    {"id": "toys", "name": "Toys & Accessori", "emoji": "🎁", "category": "exploration"},
+    {"id": "bondage_light", "name": "Bondage leggero", "emoji": "🎀", "category": "bdsm"},
+    {"id": "blindfold", "name": "Benda sugli occhi", "emoji": "🙈", "category": "sensory"},
+    {"id": "massage", "name": "Massaggio erotico", "emoji": "💆", "category": "sensual"},
+    {"id": "public_risk", "name": "Rischio in pubblico", "emoji": "🌃", "category": "adventure"},
+    {"id": "food_play", "name": "Cibo & Sensualità", "emoji": "🍓", "category": "sensory"},
+    {"id": "lingerie", "name": "Lingerie speciale", "emoji": "👙", "category": "visual"},
+    {"id": "video", "name": "Filmarsi insieme", "emoji": "📹", "category": "visual"},
+    {"id": "photo", "name": "Foto intime", "emoji": "📸", "category": "visual"},
+    {"id": "domination", "name": "Dominazione", "emoji": "👑", "category": "bdsm"},
+    {"id": "submission", "name": "Sottomissione", "emoji": "🦋", "category": "bdsm"},
+    {"id": "outdoor", "name": "All'aperto", "emoji": "🏕️", "category": "adventure"},
+    {"id": "shower", "name": "Doccia/Vasca", "emoji": "🚿", "category": "location"},
+    {"id": "morning", "name": "Sesso mattutino", "emoji": "🌅", "category": "timing"},
+    {"id": "quickie", "name": "Quickie improvviso", "emoji": "⚡", "category": "timing"},
+    {"id": "slow", "name": "Lungo e sensuale", "emoji": "🕯️", "category": "style"},
+    {"id": "rough", "name": "Passionale e intenso", "emoji": "🔥", "category": "style"},
+    {"id": "oral_give", "name": "Dare piacere orale", "emoji": "💋", "category": "acts"},
+    {"id": "oral_receive", "name": "Ricevere piacere orale", "emoji": "😮", "category": "acts"},
+    {"id": "new_positions", "name": "Posizioni nuove", "emoji": "🤸", "category": "exploration"},
+    {"id": "mirror", "name": "Davanti allo specchio", "emoji": "🪞", "category": "visual"},
+    {"id": "talking_dirty", "name": "Parole sporche", "emoji": "🗣️", "category": "verbal"},
+    {"id": "sexting", "name": "Sexting durante il giorno", "emoji": "📱", "category": "verbal"},
+    {"id": "strip", "name": "Spogliarello", "emoji": "💃", "category": "visual"},
+    {"id": "costume", "name": "Costumi/Travestimenti", "emoji": "🎃", "category": "fantasy"},
+    {"id": "threesome_fantasy", "name": "Fantasia a tre (solo parlarne)", "emoji": "💭", "category": "fantasy"},
+    {"id": "watching", "name": "Guardare insieme contenuti", "emoji": "👀", "category": "visual"},
+    {"id": "surprise", "name": "Sorprese inaspettate", "emoji": "🎉", "category": "adventure"},
+    {"id": "hotel", "name": "Fuga in hotel", "emoji": "🏨", "category": "location"}
+]
+
+LOVE_NOTE_TEMPLATES = [
+    {"id": "1", "category": "romantic", "message": "Sei la cosa più bella che mi sia mai capitata 💕"},
+    {"id": "2", "category": "romantic", "message": "Non vedo l'ora di rivederti ❤️"},
+    {"id": "3", "category": "spicy", "message": "Stasera ho voglia di te... 🔥"},
+    {"id": "4", "category": "spicy", "message": "Non riesco a smettere di pensare a ieri notte 😏"},
+    {"id": "5", "category": "sweet", "message": "Grazie di esistere nella mia vita 🌹"},
+    {"id": "6", "category": "sweet", "message": "Sei il mio pensiero fisso 💭"}
+]
+
+# Built-in content; CATALOG_DIR/<section>.json overrides a section and is reloaded on change
+catalog = Catalog({
+    "love_dice_actions": LOVE_DICE_ACTIONS,
+    "love_dice_body_parts": LOVE_DICE_BODY_PARTS,
+    "love_dice_duration": LOVE_DICE_DURATION,
+    "love_dice_scenarios": LOVE_DICE_SCENARIOS,
+    "spicy_challenges": SPICY_CHALLENGES,
+    "positions": POSITION_SUGGESTIONS,
+    "wishlist_items": WISHLIST_ITEMS,
+    "weekly_challenges": WEEKLY_CHALLENGES,
+    "desires": DESIRE_ITEMS,
+    "love_note_templates": LOVE_NOTE_TEMPLATES,
+}, data_dir=os.environ.get("CATALOG_DIR"), append_only=("wishlist_items", "desires"))
+
+def suggestions_payload(c) -> dict:
+    return {"challenges": c.payload("spicy_challenges"), "positions": c.payload("positions")}
+
 # ================= FASTAPI APP =================
 app = FastAPI(title="Couple Bliss API", version="1.0.0")
 
@@ -273,6 +470,12 @@ app.add_middleware(
 
 api_router = APIRouter(prefix="/api")
 
+# Stats, insights and predictions only change on writes (or when the day changes)
+result_cache = ResultCache()
+
+# Partner pushes are queued after the commit and sent, merged per recipient, by a background worker
+partner_notifier = PartnerNotifier()
+
 def get_db():
     db = SessionLocal()
     try:
@@ -280,6 +483,530 @@ def get_db():
     finally:
         db.close()
 
+# ================= COUPLE STATS =================
+def _bump(counts: dict, key, delta: int):
+    key = str(key)
+    value = counts.get(key, 0) + delta
+    if value > 0:
+        counts[key] = value
+    else:
+        counts.pop(key, None)
+
+def _fold_intimacy(stats: CoupleStats, locations: dict, entry: IntimacyLog, delta: int):
+    stats.total_count = (stats.total_count or 0) + delta
+    stats.quality_sum = (stats.quality_sum or 0) + delta * (entry.quality_rating or 0)
+    if entry.location:
+        _bump(locations, entry.location, delta)
+    if delta > 0:
+        stats.max_duration = max(stats.max_duration or 0, entry.duration_minutes or 0)
+        if not stats.last_entry_date or entry.date > stats.last_entry_date:
+            stats.last_entry_date = entry.date
+
+def build_couple_stats(db, couple_code: str) -> CoupleStats:
+    """Compute a couple_stats row from the raw intimacy_logs rows"""
+    stats = CoupleStats(couple_code=couple_code, total_count=0, quality_sum=0, max_duration=0)
+    locations = {}
+    entries = db.query(IntimacyLog).filter(IntimacyLog.couple_code == couple_code).yield_per(500)
+    for entry in entries:
+        _fold_intimacy(stats, locations, entry, 1)
+    stats.location_counts = json.dumps(locations)
+    return stats
+
+def load_couple_stats(db, couple_code: str, for_update: bool = False) -> CoupleStats:
+    """Return the couple_stats row, backfilling it from raw rows on first access"""
+    query = db.query(CoupleStats).filter(CoupleStats.couple_code == couple_code)
+    if for_update:
+        query = query.with_for_update()
+    stats = query.first()
+    if stats is None:
+        stats = build_couple_stats(db, couple_code)
+        db.add(stats)
+        rebuild_daily_rollups(db, couple_code)
+    return stats
+
+def ensure_couple_stats(db, couple_code: str) -> CoupleStats:
+    """Read-path variant of load_couple_stats that commits a first-time backfill"""
+    stats = db.query(CoupleStats).filter(CoupleStats.couple_code == couple_code).first()
+    if stats is None:
+        stats = load_couple_stats(db, couple_code)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent request backfilled the same couple first
+            db.rollback()
+            stats = db.query(CoupleStats).filter(CoupleStats.couple_code == couple_code).first()
+    return stats
+
+MYSQL_DEADLOCK = 1213
+
+def commit_stats_write(db, write: Callable[[], Any]):
+    """Run `write()`, which creates couple_stats / daily_rollups rows on first use, and commit.
+
+    Two first writes for a couple (or a couple's day) both insert the missing row, and the second
+    hits the primary key, or InnoDB picks it as a deadlock victim on the gap locks. That one rolls
+    back and runs again against the row now there. Returns the result of `write()`.
+    """
+    try:
+        result = write()
+        db.commit()
+        return result
+    except IntegrityError:
+        db.rollback()
+    except OperationalError as e:
+        db.rollback()
+        if getattr(e.orig, "args", (None,))[0] != MYSQL_DEADLOCK:
+            raise
+    result = write()
+    db.commit()
+    return result
+
+def apply_intimacy_to_stats(db, stats: CoupleStats, entry: IntimacyLog, delta: int):
+    """Add (delta=1) or remove (delta=-1) one entry; runs in the caller's transaction"""
+    locations = json.loads(stats.location_counts or "{}")
+    _fold_intimacy(stats, locations, entry, delta)
+    stats.location_counts = json.dumps(locations)
+
+    if delta < 0:
+        # Max and latest date can't be decremented, re-read them only when the removed entry held them
+        others = db.query(IntimacyLog).filter(
+            IntimacyLog.couple_code == entry.couple_code,
+            IntimacyLog.id != entry.id
+        )
+        if (entry.duration_minutes or 0) >= (stats.max_duration or 0):
+            stats.max_duration = others.with_entities(func.max(IntimacyLog.duration_minutes)).scalar() or 0
+        if entry.date == stats.last_entry_date:
+            stats.last_entry_date = others.with_entities(func.max(IntimacyLog.date)).scalar()
+
+def intimacy_rollup_deltas(entry: IntimacyLog, sign: int = 1) -> dict:
+    positions = json.loads(entry.positions_used) if entry.positions_used else []
+    return {
+        "intimacy_count": sign,
+        "quality_sum": sign * (entry.quality_rating or 0),
+        "duration_sum": sign * (entry.duration_minutes or 0),
+        "calories": sign * estimate_calories(entry.duration_minutes, positions, entry.quality_rating),
+    }
+
+def mood_rollup_deltas(mood: Mood, sign: int = 1) -> dict:
+    return {
+        "mood_count": sign,
+        "mood_sum": sign * (mood.mood or 0),
+        "energy_sum": sign * (mood.energy or 0),
+        "stress_sum": sign * (mood.stress or 0),
+        "libido_sum": sign * (mood.libido or 0),
+    }
+
+def bump_daily_rollup(db, couple_code: str, date: str, deltas: dict):
+    """Apply deltas to one (couple, day) rollup row inside the caller's transaction"""
+    row = db.query(DailyRollup).filter(
+        DailyRollup.couple_code == couple_code,
+        DailyRollup.date == date
+    ).with_for_update().first()
+    if row is None:
+        row = DailyRollup(couple_code=couple_code, date=date, week=week_ordinal(date), **{f: 0 for f in ROLLUP_FIELDS})
+        db.add(row)
+    for field, delta in deltas.items():
+        setattr(row, field, (getattr(row, field) or 0) + delta)
+
+def rebuild_daily_rollups(db, couple_code: str):
+    """Recompute a couple's daily_rollups rows from intimacy_logs and moods"""
+    rows = {}
+    def row_for(date):
+        if date not in rows:
+            rows[date] = DailyRollup(couple_code=couple_code, date=date, week=week_ordinal(date), **{f: 0 for f in ROLLUP_FIELDS})
+        return rows[date]
+
+    for entry in db.query(IntimacyLog).filter(IntimacyLog.couple_code == couple_code).yield_per(500):
+        row = row_for(entry.date)
+        for field, delta in intimacy_rollup_deltas(entry).items():
+            setattr(row, field, getattr(row, field) + delta)
+    for mood in db.query(Mood).filter(Mood.couple_code == couple_code).yield_per(500):
+        row = row_for(mood.date)
+        for field, delta in mood_rollup_deltas(mood).items():
+            setattr(row, field, getattr(row, field) + delta)
+
+    db.query(DailyRollup).filter(DailyRollup.couple_code == couple_code).delete()
+    db.add_all(rows.values())
+    db.flush()
+
+def rollup_window(db, couple_code: str, after: str, until: Optional[str] = None):
+    """Sum the rollup rows with after < date <= until (at most ~60 rows per window)"""
+    query = db.query(*[func.coalesce(func.sum(getattr(DailyRollup, f)), 0) for f in ROLLUP_FIELDS]).filter(
+        DailyRollup.couple_code == couple_code,
+        DailyRollup.date > after
+    )
+    if until:
+        query = query.filter(DailyRollup.date <= until)
+    return dict(zip(ROLLUP_FIELDS, query.one()))
+
+def rebuild_couple_stats(couple_code: Optional[str] = None) -> int:
+    """Recompute couple_stats and daily_rollups from raw rows (backfill / consistency repair)"""
+    db = SessionLocal()
+    try:
+        if couple_code:
+            codes = [couple_code]
+        else:
+            codes = {c for (c,) in db.query(IntimacyLog.couple_code).distinct()}
+            codes |= {c for (c,) in db.query(Mood.couple_code).distinct()}
+            codes |= {c for (c,) in db.query(CoupleStats.couple_code)}
+        for code in sorted(codes):
+            db.query(CoupleStats).filter(CoupleStats.couple_code == code).delete()
+            stats = build_couple_stats(db, code)
+            db.add(stats)
+            rebuild_daily_rollups(db, code)
+            evaluate_couple_badges(db, stats, ALL_AGGREGATES)
+            db.commit()
+        return len(codes)
+    finally:
+        db.close()
+
+streak_cache = StreakCache()
+
+def couple_streaks(db, stats: CoupleStats, today: datetime) -> Streaks:
+    """Streaks over the couple's active days, memoized until the next write or day change"""
+    today_ordinal = today.toordinal()
+    # updated_at may only have second precision, so pair it with the counters
+    version = (stats.updated_at, stats.total_count, stats.last_entry_date)
+    cached = streak_cache.get(stats.couple_code, version, today_ordinal)
+    if cached is not None:
+        return cached
+    active_days = db.query(DailyRollup.date).filter(
+        DailyRollup.couple_code == stats.couple_code,
+        DailyRollup.intimacy_count > 0
+    ).order_by(DailyRollup.date).all()
+    streaks = compute_streaks([to_ordinal(d) for (d,) in active_days], today_ordinal)
+    streak_cache.put(stats.couple_code, version, today_ordinal, streaks)
+    return streaks
+
+# ================= BADGES =================
+def badge_aggregates(db, stats: CoupleStats, names) -> dict:
+    """Compute only the named aggregates the pending badge rules read"""
+    suppliers = {
+        "total_count": lambda: stats.total_count or 0,
+        "average_quality": lambda: (stats.quality_sum or 0) / stats.total_count if stats.total_count else 0,
+        "current_streak": lambda: couple_streaks(db, stats, datetime.now()).current_weeks,
+        "distinct_locations": lambda: len(json.loads(stats.location_counts or "{}")),
+        "max_duration": lambda: stats.max_duration or 0,
+        "monthly_count": lambda: rollup_window(
+            db, stats.couple_code, (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
+        )["intimacy_count"],
+    }
+    return {name: suppliers[name]() for name in names}
+
+def evaluate_couple_badges(db, stats: CoupleStats, changed=INTIMACY_AGGREGATES) -> List[str]:
+    """Unlock newly earned badges inside the caller's transaction and return their ids"""
+    unlocked = {b for (b,) in db.query(CoupleBadge.badge_id).filter(CoupleBadge.couple_code == stats.couple_code)}
+    rules = pending_rules(unlocked, changed)
+    if not rules:
+        return []
+    # Make the pending stats/rollup changes visible to the aggregate queries
+    db.flush()
+    earned = newly_unlocked(rules, badge_aggregates(db, stats, required_aggregates(rules)))
+    now = datetime.utcnow()
+    db.add_all([CoupleBadge(couple_code=stats.couple_code, badge_id=b, unlocked_at=now) for b in earned])
+    return earned
+
+def ensure_couple_badges(db, stats: CoupleStats) -> dict:
+    """badge id -> unlock time; couples with entries but no unlocks yet are evaluated once"""
+    rows = db.query(CoupleBadge).filter(CoupleBadge.couple_code == stats.couple_code).all()
+    if not rows and stats.total_count:
+        evaluate_couple_badges(db, stats, ALL_AGGREGATES)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        rows = db.query(CoupleBadge).filter(CoupleBadge.couple_code == stats.couple_code).all()
+    return {row.badge_id: row.unlocked_at for row in rows}
+
+# ================= SCORE DISTRIBUTION =================
+score_histogram = ScoreHistogram()
+
+def load_score_histogram(db):
+    rows = dict(db.query(ScoreBucket.bucket, ScoreBucket.couples).all())
+    if len(rows) < SCORE_BUCKETS:
+        # Seed every bucket once so flushes only ever need an UPDATE
+        db.add_all([ScoreBucket(bucket=b, couples=0) for b in range(SCORE_BUCKETS) if b not in rows])
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+    score_histogram.load(rows)
+
+def flush_score_histogram(db):
+    """Add the in-memory bucket deltas to score_histogram, then reload the shared totals"""
+    for bucket, delta in score_histogram.take_pending().items():
+        db.query(ScoreBucket).filter(ScoreBucket.bucket == bucket).update(
+            {ScoreBucket.couples: ScoreBucket.couples + delta}, synchronize_session=False
+        )
+    db.commit()
+    load_score_histogram(db)
+
+def record_couple_score(db, couple_code: str, score: float) -> Optional[float]:
+    """Keep the couple's histogram bucket current and return its percentile among all couples"""
+    if not score_histogram.loaded:
+        load_score_histogram(db)
+    row = db.query(CoupleScore).filter(CoupleScore.couple_code == couple_code).first()
+    old = row.sessometro_score if row else None
+    if old is None or score_bucket(old) != score_bucket(score):
+        try:
+            if row is None:
+                db.add(CoupleScore(couple_code=couple_code, sessometro_score=score))
+                moved = True
+            else:
+                # Compare-and-set, so concurrent readers move the couple only once
+                moved = db.query(CoupleScore).filter(
+                    CoupleScore.couple_code == couple_code,
+                    CoupleScore.sessometro_score == old
+                ).update({"sessometro_score": score}, synchronize_session=False) == 1
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            moved = False
+        if moved:
+            score_histogram.move(old, score)
+    if score_histogram.flush_due():
+        flush_score_histogram(db)
+    return score_histogram.percentile(score)
+
+def rebuild_score_histogram() -> int:
+    """Recount score_histogram exactly from couple_scores (repairs deltas lost on a crash)"""
+    db = SessionLocal()
+    try:
+        counts = [0] * SCORE_BUCKETS
+        for (score,) in db.query(CoupleScore.sessometro_score).filter(CoupleScore.sessometro_score.isnot(None)):
+            counts[score_bucket(score)] += 1
+        db.query(ScoreBucket).delete()
+        db.add_all([ScoreBucket(bucket=b, couples=n) for b, n in enumerate(counts)])
+        db.commit()
+        score_histogram.take_pending()
+        load_score_histogram(db)
+        return sum(counts)
+    finally:
+        db.close()
+
+# ================= NIGHTLY SCORING =================
+SCORING_JOB = "score-couples"
+SCORE_FIELDS = ("sessometro_score", "passion_trend", "spontaneity", "romance_vs_passion")
+
+def fresh_couple_score(db, couple_code: str, now: datetime) -> Optional[CoupleScore]:
+    """The couple's batch scores, if the last run (today's or last night's) covered it"""
+    yesterday = (now - timedelta(days=1)).strftime('%Y-%m-%d')
+    return db.query(CoupleScore).filter(
+        CoupleScore.couple_code == couple_code,
+        CoupleScore.scored_on >= yesterday
+    ).first()
+
+def live_couple_scores(db, couple_code: str, avg_quality: float, streak: int, now: datetime) -> dict:
+    """Same formulas as the batch job, from the rollups of the last 60 days"""
+    month_ago = (now - timedelta(days=30)).strftime('%Y-%m-%d')
+    two_months_ago = (now - timedelta(days=60)).strftime('%Y-%m-%d')
+    monthly = rollup_window(db, couple_code, month_ago)
+    prev_month_count = rollup_window(db, couple_code, two_months_ago, month_ago)["intimacy_count"]
+    active_dates = [d for (d,) in db.query(DailyRollup.date).filter(
+        DailyRollup.couple_code == couple_code,
+        DailyRollup.date > month_ago,
+        DailyRollup.intimacy_count > 0
+    )]
+    active_weekdays = len(set(weekdays(to_arrays(active_dates, [0] * len(active_dates)).days).tolist()))
+    monthly_count = monthly["intimacy_count"]
+    scores = derive_scores(
+        monthly_count, prev_month_count, avg_quality,
+        monthly["quality_sum"] / monthly_count if monthly_count else 0,
+        streak, active_weekdays * 100 // 7
+    )
+    return {
+        "sessometro_score": float(scores["sessometro_score"]),
+        "passion_trend": str(scores["passion_trend"]),
+        "spontaneity": int(scores["spontaneity"]),
+        "romance_vs_passion": str(scores["romance_vs_passion"]),
+    }
+
+def _scoring_chunks(after: str, chunk_size: int):
+    """Stream intimacy rows in couple_code order, grouped into chunks of whole couples"""
+    db = SessionLocal()
+    try:
+        rows = db.query(IntimacyLog.couple_code, IntimacyLog.date, IntimacyLog.quality_rating).filter(
+            IntimacyLog.couple_code > after
+        ).order_by(IntimacyLog.couple_code).yield_per(5000)
+        codes, couple_idx, dates, ratings = [], [], [], []
+        for code, day, rating in rows:
+            if not codes or codes[-1] != code:
+                if len(codes) == chunk_size:
+                    arrays = to_arrays(dates, ratings)
+                    yield ChunkPayload(codes, np.asarray(couple_idx, dtype=np.int64), arrays.days, arrays.ratings)
+                    codes, couple_idx, dates, ratings = [], [], [], []
+                codes.append(code)
+            couple_idx.append(len(codes) - 1)
+            dates.append(day)
+            ratings.append(rating)
+        if codes:
+            arrays = to_arrays(dates, ratings)
+            yield ChunkPayload(codes, np.asarray(couple_idx, dtype=np.int64), arrays.days, arrays.ratings)
+    finally:
+        db.close()
+
+def _store_scores(db, rows: List[dict], scored_on: str):
+    """Upsert a chunk of scores and move the couples between histogram buckets (caller commits)"""
+    existing = {s.couple_code: s for s in db.query(CoupleScore).filter(
+        CoupleScore.couple_code.in_([r["couple_code"] for r in rows])
+    )}
+    deltas = {}
+    for row in rows:
+        score = existing.get(row["couple_code"])
+        if score is None:
+            score = CoupleScore(couple_code=row["couple_code"])
+            db.add(score)
+        elif score.sessometro_score is not None:
+            old = score_bucket(score.sessometro_score)
+            deltas[old] = deltas.get(old, 0) - 1
+        new = score_bucket(row["sessometro_score"])
+        deltas[new] = deltas.get(new, 0) + 1
+        for field in SCORE_FIELDS:
+            setattr(score, field, row[field])
+        score.scored_on = scored_on
+    for bucket, delta in deltas.items():
+        if delta:
+            db.query(ScoreBucket).filter(ScoreBucket.bucket == bucket).update(
+                {ScoreBucket.couples: ScoreBucket.couples + delta}, synchronize_session=False
+            )
+
+def score_all_couples(chunk_size: int = 500, processes: Optional[int] = None, restart: bool = False) -> int:
+    """Nightly job: score every couple in a process pool, checkpointing after each chunk"""
+    today = date.today().isoformat()
+    db = SessionLocal()
+    try:
+        load_score_histogram(db)  # seeds the histogram buckets
+        checkpoint = db.query(BatchCheckpoint).filter(BatchCheckpoint.job == SCORING_JOB).first()
+        if checkpoint is None:
+            checkpoint = BatchCheckpoint(job=SCORING_JOB)
+            db.add(checkpoint)
+        if restart or checkpoint.run_date != today:
+            checkpoint.run_date, checkpoint.last_key, checkpoint.processed, checkpoint.finished = today, "", 0, False
+        elif checkpoint.finished:
+            print(f"{SCORING_JOB}: already completed today ({checkpoint.processed} couples)")
+            return 0
+        else:
+            print(f"{SCORING_JOB}: resuming after {checkpoint.last_key!r} ({checkpoint.processed} couples done)")
+        db.commit()
+
+        scored = entries = 0
+        started = time.monotonic()
+
+        def store(rows):
+            nonlocal scored, entries
+            _store_scores(db, rows, today)
+            # Scores and checkpoint commit together, so a resumed run never skips or repeats a couple
+            checkpoint.last_key = rows[-1]["couple_code"]
+            checkpoint.processed += len(rows)
+            db.commit()
+            scored += len(rows)
+            entries += sum(r["entries"] for r in rows)
+            elapsed = max(time.monotonic() - started, 1e-9)
+            print(f"{SCORING_JOB}: {checkpoint.processed} couples, {entries} entries "
+                  f"({scored / elapsed:.0f} couples/s, {entries / elapsed:.0f} entries/s)")
+
+        # At most `window` chunks in flight: the next chunk is read only once the oldest is stored,
+        # so memory stays bounded however fast the database streams rows (Pool.imap reads ahead)
+        window = 2 * (processes or os.cpu_count() or 1)
+        score = functools.partial(score_chunk, today=date.today())
+        pending = deque()
+        with multiprocessing.Pool(processes) as pool:
+            for chunk in _scoring_chunks(checkpoint.last_key, chunk_size):
+                pending.append(pool.apply_async(score, (chunk,)))
+                if len(pending) >= window:
+                    store(pending.popleft().get())
+            while pending:
+                store(pending.popleft().get())
+        checkpoint.finished = True
+        db.commit()
+        return scored
+    finally:
+        db.close()
+
+# ================= MOOD CORRELATIONS =================
+CORRELATION_JOB = "correlate-moods"
+
+def couple_correlations(db, couple_code: str) -> Optional[dict]:
+    """The couple's stored correlations (see correlations.py), None before the first run"""
+    row = db.query(CoupleInsight).filter(CoupleInsight.couple_code == couple_code).first()
+    if row is None:
+        return None
+    return {field: getattr(row, field) for field in CORRELATION_PAIRS + ("mood_days", "paired_days", "computed_on")}
+
+def _correlation_chunks(after: str, since: str, chunk_size: int):
+    """Couples with moods since `since`, in couple_code order, one bounded chunk at a time"""
+    db = SessionLocal()
+    try:
+        codes = [code for (code,) in db.query(Mood.couple_code).filter(
+            Mood.date >= since, Mood.couple_code > after
+        ).distinct().order_by(Mood.couple_code)]
+        for i in range(0, len(codes), chunk_size):
+            chunk = codes[i:i + chunk_size]
+            index = {code: j for j, code in enumerate(chunk)}
+            moods = db.query(Mood.couple_code, Mood.date, Mood.libido, Mood.stress, Mood.energy).filter(
+                Mood.couple_code.in_(chunk), Mood.date >= since
+            ).all()
+            entries = db.query(IntimacyLog.couple_code, IntimacyLog.date, IntimacyLog.quality_rating, IntimacyLog.duration_minutes).filter(
+                IntimacyLog.couple_code.in_(chunk), IntimacyLog.date >= since
+            ).all()
+            mood_arrays = to_arrays([m.date for m in moods], [m.libido for m in moods])
+            entry_arrays = to_arrays([e.date for e in entries], [e.quality_rating for e in entries], [e.duration_minutes for e in entries])
+            yield MoodChunk(
+                chunk,
+                np.asarray([index[m.couple_code] for m in moods], dtype=np.int64),
+                mood_arrays.days,
+                mood_arrays.ratings.astype(float),
+                np.asarray([m.stress or 0 for m in moods], dtype=float),
+                np.asarray([m.energy or 0 for m in moods], dtype=float),
+                np.asarray([index[e.couple_code] for e in entries], dtype=np.int64),
+                entry_arrays.days,
+                entry_arrays.ratings.astype(float),
+                entry_arrays.durations.astype(float),
+            )
+    finally:
+        db.close()
+
+def correlate_all_couples(chunk_size: int = 500, restart: bool = False) -> int:
+    """Nightly job: mood <-> intimacy correlations for every couple, checkpointing after each chunk"""
+    today = date.today()
+    since = (today - timedelta(days=CORRELATION_DAYS)).isoformat()
+    db = SessionLocal()
+    try:
+        checkpoint = db.query(BatchCheckpoint).filter(BatchCheckpoint.job == CORRELATION_JOB).first()
+        if checkpoint is None:
+            checkpoint = BatchCheckpoint(job=CORRELATION_JOB)
+            db.add(checkpoint)
+        if restart or checkpoint.run_date != today.isoformat():
+            checkpoint.run_date, checkpoint.last_key, checkpoint.processed, checkpoint.finished = today.isoformat(), "", 0, False
+        elif checkpoint.finished:
+            print(f"{CORRELATION_JOB}: already completed today ({checkpoint.processed} couples)")
+            return 0
+        else:
+            print(f"{CORRELATION_JOB}: resuming after {checkpoint.last_key!r} ({checkpoint.processed} couples done)")
+        db.commit()
+
+        done = 0
+        for chunk in _correlation_chunks(checkpoint.last_key, since, chunk_size):
+            rows = correlate_chunk(chunk)
+            existing = {i.couple_code: i for i in db.query(CoupleInsight).filter(CoupleInsight.couple_code.in_(chunk.codes))}
+            for row in rows:
+                insight = existing.get(row["couple_code"])
+                if insight is None:
+                    insight = CoupleInsight(couple_code=row["couple_code"])
+                    db.add(insight)
+                for field in CORRELATION_PAIRS + ("mood_days", "paired_days"):
+                    setattr(insight, field, row[field])
+                insight.computed_on = today.isoformat()
+            checkpoint.last_key = chunk.codes[-1]
+            checkpoint.processed += len(rows)
+            db.commit()
+            done += len(rows)
+            print(f"{CORRELATION_JOB}: {checkpoint.processed} couples")
+        checkpoint.finished = True
+        db.commit()
+        return done
+    finally:
+        db.close()
+
 # ================= USER ENDPOINTS =================
 @api_router.post("/users")
 async def create_user(user_data: UserCreate):
@@ -359,11 +1086,19 @@ async def join_couple(input: JoinCoupleInput):
             raise HTTPException(status_code=404, detail="Partner code not found")
         
         # Update both users
+        previous_code = user.couple_code
         user.couple_code = partner.couple_code
         user.partner_id = partner.id
         partner.partner_id = user.id
         
+        # Either member's cycle may now be the one the couple tracks
+        if previous_code != partner.couple_code:
+            link_couple_cycle(db, previous_code)
+        link_couple_cycle(db, partner.couple_code)
         db.commit()
+        calendar_cache.invalidate(user.id, partner.id)
+        result_cache.invalidate(user.id, partner.id)
+        feed_cache.invalidate(previous_code, partner.couple_code)
         
         return {
             "id": user.id,
@@ -392,8 +1127,15 @@ async def log_intimacy(data: IntimacyCreate):
             location=data.location,
             notes=data.notes
         )
-        db.add(entry)
-        db.commit()
+        def write():
+            stats = load_couple_stats(db, data.couple_code, for_update=True)
+            db.add(entry)
+            apply_intimacy_to_stats(db, stats, entry, 1)
+            bump_daily_rollup(db, entry.couple_code, entry.date, intimacy_rollup_deltas(entry))
+            evaluate_couple_badges(db, stats)
+        commit_stats_write(db, write)
+        streak_cache.invalidate(entry.couple_code)
+        result_cache.invalidate(entry.couple_code)
         
         return {"id": entry.id, "message": "Logged successfully"}
     finally:
@@ -422,21 +1164,68 @@ async def get_intimacy_logs(couple_code: str):
 async def delete_intimacy(entry_id: str):
     db = SessionLocal()
     try:
-        entry = db.query(IntimacyLog).filter(IntimacyLog.id == entry_id).first()
+        def write():
+            entry = db.query(IntimacyLog).filter(IntimacyLog.id == entry_id).first()
+            if entry:
+                stats = load_couple_stats(db, entry.couple_code, for_update=True)
+                db.delete(entry)
+                apply_intimacy_to_stats(db, stats, entry, -1)
+                bump_daily_rollup(db, entry.couple_code, entry.date, intimacy_rollup_deltas(entry, -1))
+                # Removing a low-rated entry can raise the average past a badge threshold
+                evaluate_couple_badges(db, stats)
+            return entry
+        entry = commit_stats_write(db, write)
         if entry:
-            db.delete(entry)
-            db.commit()
+            streak_cache.invalidate(entry.couple_code)
+            result_cache.invalidate(entry.couple_code)
         return {"message": "Deleted successfully"}
     finally:
         db.close()
 
+@api_router.get("/intimacy/timeseries/{couple_code}")
+async def get_intimacy_timeseries(
+    couple_code: str,
+    bucket: str = "day",
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    """Counts, average quality and total duration per day/week/month, as parallel arrays"""
+    try:
+        start, end = resolve_range(bucket, from_, to, datetime.now().date())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    key = {
+        "day": DailyRollup.date,
+        "week": DailyRollup.week,
+        "month": func.substr(DailyRollup.date, 1, 7),
+    }[bucket]
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            key,
+            func.sum(DailyRollup.intimacy_count),
+            func.sum(DailyRollup.quality_sum),
+            func.sum(DailyRollup.duration_sum)
+        ).filter(
+            DailyRollup.couple_code == couple_code,
+            DailyRollup.date >= start,
+            DailyRollup.date <= end,
+            DailyRollup.intimacy_count > 0
+        ).group_by(key).all()
+        return build_series(bucket, start, end, rows)
+    finally:
+        db.close()
+
 @api_router.get("/intimacy/stats/{couple_code}")
+@result_cache.cached("intimacy_stats")
 async def get_intimacy_stats(couple_code: str):
     db = SessionLocal()
     try:
-        entries = db.query(IntimacyLog).filter(IntimacyLog.couple_code == couple_code).all()
+        stats = ensure_couple_stats(db, couple_code)
         
-        if not entries:
+        total_count = stats.total_count or 0
+        if not total_count:
             return {
                 "total_count": 0,
                 "monthly_count": 0,
@@ -445,39 +1234,41 @@ async def get_intimacy_stats(couple_code: str):
                 "sessometro_level": "Nuova Coppia",
                 "sessometro_level_emoji": "🌱",
                 "sessometro_score": 0,
+                "sessometro_percentile": None,
+                "passion_trend": "stable",
+                "spontaneity_score": 0,
+                "romance_vs_passion": "equilibrato",
                 "streak": 0,
+                "best_streak": 0,
+                "consecutive_days": 0,
                 "badges": [],
+                "badges_unlocked_at": {},
                 "next_milestone": "Ancora 10 per il badge 'Affiatati'"
             }
         
         now = datetime.now()
-        month_ago = now - timedelta(days=30)
-        week_ago = now - timedelta(days=7)
+        month_ago = (now - timedelta(days=30)).strftime('%Y-%m-%d')
+        week_ago = (now - timedelta(days=7)).strftime('%Y-%m-%d')
         
-        monthly_entries = [e for e in entries if datetime.strptime(e.date, '%Y-%m-%d') > month_ago]
-        weekly_entries = [e for e in entries if datetime.strptime(e.date, '%Y-%m-%d') > week_ago]
-        
-        monthly_count = len(monthly_entries)
-        weekly_count = len(weekly_entries)
-        avg_quality = sum(e.quality_rating for e in entries) / len(entries) if entries else 0
+        monthly_count = rollup_window(db, couple_code, month_ago)["intimacy_count"]
+        weekly_count = rollup_window(db, couple_code, week_ago)["intimacy_count"]
+        avg_quality = (stats.quality_sum or 0) / total_count
         
         # Calculate streak
-        dates = sorted(set(e.date for e in entries), reverse=True)
-        streak = 0
-        if dates:
-            current_week = now.isocalendar()[1]
-            for date_str in dates:
-                entry_date = datetime.strptime(date_str, '%Y-%m-%d')
-                if entry_date.isocalendar()[1] >= current_week - streak:
-                    streak += 1
-                else:
-                    break
-        
-        # Calculate score
-        frequency_score = min(monthly_count / 8 * 10, 10)
-        quality_score = avg_quality * 2
-        streak_score = min(streak * 2, 10)
-        sessometro_score = (frequency_score * 0.4 + quality_score * 0.35 + streak_score * 0.25)
+        streaks = couple_streaks(db, stats, now)
+        streak = streaks.current_weeks
+        
+        # Scores come from the nightly batch job, computed live only for couples it hasn't scored yet
+        batch = fresh_couple_score(db, couple_code, now)
+        if batch is not None:
+            scores = {field: getattr(batch, field) for field in SCORE_FIELDS}
+            if not score_histogram.loaded or score_histogram.flush_due():
+                flush_score_histogram(db)
+            percentile = score_histogram.percentile(batch.sessometro_score)
+        else:
+            scores = live_couple_scores(db, couple_code, avg_quality, streak, now)
+            percentile = record_couple_score(db, couple_code, scores["sessometro_score"])
+        sessometro_score = scores["sessometro_score"]
         
         # Level
         if sessometro_score >= 8:
@@ -496,47 +1287,94 @@ async def get_intimacy_stats(couple_code: str):
             level = "Nuova Coppia"
             level_emoji = "🌱"
         
-        # Badges
-        badges = []
-        if len(entries) >= 1:
-            badges.append("first_time")
-        if streak >= 1:
-            badges.append("week_streak")
-        if avg_quality > 4:
-            badges.append("quality_king")
-        if len(entries) >= 5:
-            badges.append("morning")
-        if len(entries) >= 8:
-            badges.append("night_owl")
-        if monthly_count >= 20:
-            badges.append("perfect_month")
-        
-        # Marathon badge
-        has_marathon = any((e.duration_minutes or 0) >= 60 for e in entries)
-        if has_marathon:
-            badges.append("marathon")
-        
-        # Explorer badge
-        unique_locations = set(e.location for e in entries if e.location)
-        if len(unique_locations) >= 5:
-            badges.append("explorer")
+        # Badges are unlocked on write, reading them is a lookup
+        unlocked = ensure_couple_badges(db, stats)
         
         return {
-            "total_count": len(entries),
+            "total_count": total_count,
             "monthly_count": monthly_count,
             "weekly_count": weekly_count,
             "average_quality": round(avg_quality, 1),
             "sessometro_level": level,
             "sessometro_level_emoji": level_emoji,
-            "sessometro_score": round(sessometro_score, 1),
+            "sessometro_score": sessometro_score,
+            "sessometro_percentile": percentile,
+            "passion_trend": scores["passion_trend"],
+            "spontaneity_score": scores["spontaneity"],
+            "romance_vs_passion": scores["romance_vs_passion"],
             "streak": streak,
-            "badges": badges,
-            "next_milestone": f"Ancora {10 - len(entries)} per il badge 'Affiatati'" if len(entries) < 10 else "Continua così!"
+            "best_streak": streaks.best_weeks,
+            "consecutive_days": streaks.consecutive_days,
+            "badges": sort_badges(unlocked),
+            "badges_unlocked_at": {b: at.isoformat() for b, at in unlocked.items()},
+            "next_milestone": f"Ancora {10 - total_count} per il badge 'Affiatati'" if total_count < 10 else "Continua così!"
         }
     finally:
         db.close()
 
 # ================= CYCLE ENDPOINTS =================
+# Shared by the fertility calendar and predictions; dropped on every cycle write
+calendar_cache = CalendarCache()
+
+def latest_member_cycle(db, couple_code: str):
+    """(member ids, the newest cycle of any member or None)"""
+    member_ids = [u.id for u in db.query(User.id).filter(User.couple_code == couple_code)]
+    latest = None
+    if member_ids:
+        latest = db.query(CycleData).filter(
+            CycleData.user_id.in_(member_ids)
+        ).order_by(CycleData.start_date.desc(), CycleData.created_at.desc()).first()
+    return member_ids, latest
+
+def link_couple_cycle(db, couple_code: Optional[str]) -> List[str]:
+    """Point the couple row at the latest cycle of its members; returns the member ids.
+    
+    Called by every write that can change which cycle a couple tracks (cycle
+    writes, join-couple), in the same transaction as the write.
+    """
+    if not couple_code:
+        return []
+    db.flush()
+    member_ids, latest = latest_member_cycle(db, couple_code)
+    couple = db.query(Couple).filter(Couple.couple_code == couple_code).first()
+    if couple is None:
+        couple = Couple(couple_code=couple_code)
+        db.add(couple)
+    couple.cycle_owner_id = latest.user_id if latest else None
+    couple.cycle_id = latest.id if latest else None
+    return member_ids
+
+def backfill_couples() -> int:
+    """Create or refresh the couples row of every couple code in use"""
+    db = SessionLocal()
+    try:
+        codes = [code for (code,) in db.query(User.couple_code).filter(User.couple_code.isnot(None)).distinct()]
+        for code in codes:
+            link_couple_cycle(db, code)
+        db.commit()
+        return len(codes)
+    finally:
+        db.close()
+
+def load_user_cycle(db, user_id: str) -> Optional[Cycle]:
+    """Cycle tracked by the user's couple (their own or the partner's), memoized until the next cycle write"""
+    found, params = calendar_cache.user_cycle(user_id)
+    if found:
+        return params
+    generation = calendar_cache.generation
+    # users.id -> couples.couple_code -> cycle_data.id: primary keys only
+    cycle = db.query(CycleData).join(
+        Couple, Couple.cycle_id == CycleData.id
+    ).join(
+        User, User.couple_code == Couple.couple_code
+    ).filter(User.id == user_id).first()
+    if cycle is None:
+        # Couples not backfilled yet (`python server.py backfill-couples`)
+        cycle = db.query(CycleData).filter(CycleData.user_id == user_id).order_by(CycleData.start_date.desc()).first()
+    params = make_cycle(cycle.start_date, cycle.cycle_length, cycle.period_length) if cycle else None
+    calendar_cache.put_user_cycle(user_id, params, generation)
+    return params
+
 @api_router.post("/cycle")
 async def create_cycle(data: CycleCreate):
     db = SessionLocal()
@@ -549,7 +1387,14 @@ async def create_cycle(data: CycleCreate):
             period_length=data.period_length
         )
         db.add(cycle)
+        user = db.query(User).filter(User.id == data.user_id).first()
+        # The partner's fertility views read this cycle too
+        user_ids = link_couple_cycle(db, user.couple_code if user else None) or [data.user_id]
         db.commit()
+        calendar_cache.invalidate(*user_ids)
+        result_cache.invalidate(*user_ids)
+        if user:
+            feed_cache.invalidate(user.couple_code)
         return {"id": cycle.id, "message": "Cycle created"}
     finally:
         db.close()
@@ -571,227 +1416,538 @@ async def get_cycles(user_id: str):
         db.close()
 
 @api_router.get("/cycle/fertility/{user_id}")
-async def get_fertility_data(user_id: str):
+async def get_fertility_data(
+    user_id: str,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    format: str = "days"
+):
+    """Periods, fertile and ovulation days in [from, to] (default: the last period plus 6 cycles).
+    
+    format=intervals|bitmap returns the compact encodings described in fertility.py.
+    """
+    try:
+        check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     db = SessionLocal()
     try:
-        cycle = db.query(CycleData).filter(CycleData.user_id == user_id).order_by(CycleData.start_date.desc()).first()
-        
-        if not cycle:
-            return {"periods": [], "fertile_days": [], "ovulation_days": []}
-        
-        start = datetime.strptime(cycle.start_date, '%Y-%m-%d')
-        periods = []
-        fertile_days = []
-        ovulation_days = []
-        
-        # Calculate for next 3 cycles
-        for i in range(3):
-            cycle_start = start + timedelta(days=cycle.cycle_length * i)
-            
-            # Period days
-            for d in range(cycle.period_length):
-                periods.append((cycle_start + timedelta(days=d)).strftime('%Y-%m-%d'))
-            
-            # Ovulation (typically day 14)
-            ovulation_day = cycle_start + timedelta(days=14)
-            ovulation_days.append(ovulation_day.strftime('%Y-%m-%d'))
-            
-            # Fertile window (5 days before ovulation + ovulation day)
-            for d in range(-5, 2):
-                fertile_days.append((ovulation_day + timedelta(days=d)).strftime('%Y-%m-%d'))
-        
-        return {
-            "periods": periods,
-            "fertile_days": fertile_days,
-            "ovulation_days": ovulation_days
-        }
+        params = load_user_cycle(db, user_id)
+        if params is None:
+            return calendar_payload(None, format)
+        
+        try:
+            first, last = resolve_fertility_range(params, from_, to)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return calendar_payload(calendar_cache.calendar(params, first, last), format)
     finally:
         db.close()
 
 @api_router.get("/fertility/predictions/{user_id}")
+@result_cache.cached("fertility_predictions", scope="user_id")
 async def get_fertility_predictions(user_id: str):
     db = SessionLocal()
     try:
-        cycle = db.query(CycleData).filter(CycleData.user_id == user_id).order_by(CycleData.start_date.desc()).first()
-        
-        if not cycle:
+        params = load_user_cycle(db, user_id)
+        if params is None:
             return {"next_period": None, "days_to_period": None, "current_phase": "unknown"}
         
-        start = datetime.strptime(cycle.start_date, '%Y-%m-%d')
-        today = datetime.now()
-        
-        # Find next period
-        next_period = start
-        while next_period <= today:
-            next_period += timedelta(days=cycle.cycle_length)
-        
-        days_to_period = (next_period - today).days
+        today = datetime.now().date().toordinal()
+        window = current_windows(params, today)
         
         # Current phase
-        days_since_start = (today - start).days % cycle.cycle_length
-        if days_since_start < cycle.period_length:
+        if today < window.start:
+            phase = "luteale"
+        elif today <= window.period_end:
             phase = "mestruale"
-        elif days_since_start < 14:
+        elif today < window.ovulation:
             phase = "follicolare"
-        elif days_since_start < 16:
+        elif today <= window.fertile_end:
             phase = "ovulazione"
         else:
             phase = "luteale"
         
+        next_period = window.next_start if today >= window.start else window.start
         return {
-            "next_period": next_period.strftime('%Y-%m-%d'),
-            "days_to_period": days_to_period,
+            "next_period": iso(next_period),
+            "days_to_period": next_period - today,
             "current_phase": phase
         }
     finally:
         db.close()
 
+# ================= CALENDAR MONTH =================
+# Each overlay is one (couple_code, date) range query on its own session,
+# so the four run concurrently in the threadpool.
+def _month_rows(query_fn, *args):
+    db = SessionLocal()
+    try:
+        return query_fn(db, *args)
+    finally:
+        db.close()
+
+def load_couple_cycle(db, couple_code: str) -> Optional[CycleData]:
+    cycle = db.query(CycleData).join(
+        Couple, Couple.cycle_id == CycleData.id
+    ).filter(Couple.couple_code == couple_code).first()
+    if cycle is None:
+        # Couples whose cycle predates the couples table (`backfill-couples` not run): link it now
+        _, cycle = latest_member_cycle(db, couple_code)
+        if cycle is not None:
+            link_couple_cycle(db, couple_code)
+            try:
+                db.commit()
+            except IntegrityError:
+                # A concurrent request created the couple row first
+                db.rollback()
+    return cycle
+
+def _month_fertility(db, couple_code: str, first: int, last: int):
+    cycle = load_couple_cycle(db, couple_code)
+    if cycle is None:
+        return None
+    return calendar_cache.calendar(make_cycle(cycle.start_date, cycle.cycle_length, cycle.period_length), first, last)
+
+def _month_intimacy(db, couple_code: str, start: str, end: str):
+    rows = db.query(IntimacyLog.id, IntimacyLog.date, IntimacyLog.quality_rating).filter(
+        IntimacyLog.couple_code == couple_code, IntimacyLog.date >= start, IntimacyLog.date <= end
+    ).order_by(IntimacyLog.date)
+    return [{"id": r.id, "date": r.date, "quality_rating": r.quality_rating} for r in rows]
+
+def _month_moods(db, couple_code: str, start: str, end: str):
+    rows = db.query(Mood.user_id, Mood.date, Mood.mood, Mood.energy, Mood.stress, Mood.libido).filter(
+        Mood.couple_code == couple_code, Mood.date >= start, Mood.date <= end
+    ).order_by(Mood.date)
+    return [r._asdict() for r in rows]
+
+def _month_special_dates(db, couple_code: str, start: str, end: str):
+    rows = db.query(SpecialDate.id, SpecialDate.date, SpecialDate.title, SpecialDate.time).filter(
+        SpecialDate.couple_code == couple_code, SpecialDate.date >= start, SpecialDate.date <= end
+    ).order_by(SpecialDate.date)
+    return [r._asdict() for r in rows]
+
+@api_router.get("/calendar/{couple_code}/{month}")
+async def get_calendar_month(couple_code: str, month: str, request: Request):
+    """Periods, fertile days, intimacy, moods and special dates of one month (YYYY-MM).
+    
+    Days are offsets from the first of the month; answers 304 when If-None-Match matches.
+    """
+    try:
+        first, last = month_range(month)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    start, end = first.isoformat(), last.isoformat()
+    calendar, intimacy, moods, special_dates = await asyncio.gather(
+        run_in_threadpool(_month_rows, _month_fertility, couple_code, first.toordinal(), last.toordinal()),
+        run_in_threadpool(_month_rows, _month_intimacy, couple_code, start, end),
+        run_in_threadpool(_month_rows, _month_moods, couple_code, start, end),
+        run_in_threadpool(_month_rows, _month_special_dates, couple_code, start, end),
+    )
+    return conditional_json(request, month_payload(month, calendar, intimacy, moods, special_dates))
+
+# ================= CALENDAR FEED (ICS) =================
+# Rendered feeds per couple; dropped on special-date and cycle writes
+feed_cache = FeedCache()
+
+def _render_couple_feed(couple_code: str, today: int) -> bytes:
+    db = SessionLocal()
+    try:
+        cycle = load_couple_cycle(db, couple_code)
+        params = make_cycle(cycle.start_date, cycle.cycle_length, cycle.period_length) if cycle else None
+        dates = db.query(SpecialDate).filter(
+            SpecialDate.couple_code == couple_code
+        ).order_by(SpecialDate.date).yield_per(200)
+        rows = ({
+            "id": d.id, "date": d.date, "time": d.time, "title": d.title,
+            "notes": d.notes, "created_at": d.created_at
+        } for d in dates)
+        return render_feed(couple_code, rows, predicted_periods(params, today), cycle.created_at if cycle else None)
+    finally:
+        db.close()
+
+@api_router.get("/calendar/{couple_code}.ics")
+async def get_calendar_feed(couple_code: str, request: Request):
+    """Subscription feed (text/calendar) of special dates and predicted periods"""
+    today = datetime.now().date()
+    feed = feed_cache.get(couple_code, today)
+    if feed is None:
+        body = await run_in_threadpool(_render_couple_feed, couple_code, today.toordinal())
+        feed = feed_cache.put(couple_code, today, body)
+    return conditional_body(request, feed.body, "text/calendar; charset=utf-8", feed.etag, feed.last_modified)
+
 # ================= MOOD ENDPOINTS =================
+# Today's moods per couple, kept current by log_mood (see today_snapshot.py)
+mood_snapshot = MoodSnapshot()
+
+def today_mood_item(m: Mood) -> dict:
+    return {
+        "id": m.id,
+        "user_id": m.user_id,
+        "mood": m.mood,
+        "energy": m.energy,
+        "stress": m.stress,
+        "libido": m.libido
+    }
+
 @api_router.post("/mood")
 async def log_mood(data: MoodCreate):
     db = SessionLocal()
     try:
-        # Check if already logged today
-        existing = db.query(Mood).filter(
-            Mood.user_id == data.user_id,
-            Mood.date == data.date
-        ).first()
-        
-        if existing:
-            existing.mood = data.mood
-            existing.energy = data.energy
-            existing.stress = data.stress
-            existing.libido = data.libido
-            existing.notes = data.notes
-        else:
-            mood = Mood(
-                id=str(uuid.uuid4()),
-                user_id=data.user_id,
-                couple_code=data.couple_code,
-                date=data.date,
-                mood=data.mood,
-                energy=data.energy,
-                stress=data.stress,
-                libido=data.libido,
-                notes=data.notes
-            )
-            db.add(mood)
-        
-        db.commit()
+        def write():
+            # Check if already logged today
+            existing = db.query(Mood).filter(
+                Mood.user_id == data.user_id,
+                Mood.date == data.date
+            ).first()
+            
+            if existing:
+                deltas = mood_rollup_deltas(existing, -1)
+                existing.mood = data.mood
+                existing.energy = data.energy
+                existing.stress = data.stress
+                existing.libido = data.libido
+                existing.notes = data.notes
+                for field, delta in mood_rollup_deltas(existing).items():
+                    deltas[field] += delta
+                bump_daily_rollup(db, existing.couple_code, existing.date, deltas)
+                logged = existing
+            else:
+                mood = Mood(
+                    id=str(uuid.uuid4()),
+                    user_id=data.user_id,
+                    couple_code=data.couple_code,
+                    date=data.date,
+                    mood=data.mood,
+                    energy=data.energy,
+                    stress=data.stress,
+                    libido=data.libido,
+                    notes=data.notes
+                )
+                db.add(mood)
+                # The couple's first mood of the day inserts the rollup row; both partners can race on it
+                bump_daily_rollup(db, mood.couple_code, mood.date, mood_rollup_deltas(mood))
+                logged = mood
+            return (logged.couple_code, logged.date), today_mood_item(logged)
+        
+        snapshot_key, snapshot_item = commit_stats_write(db, write)
+        result_cache.invalidate(data.couple_code)
+        mood_snapshot.record(*snapshot_key, snapshot_item)
         return {"message": "Mood logged"}
     finally:
         db.close()
 
 @api_router.get("/mood/today/{couple_code}")
-async def get_today_moods(couple_code: str):
+async def get_today_moods(couple_code: str, tz: Optional[str] = None):
+    """Today's moods (today in the IANA timezone `tz`, server time without it)"""
+    try:
+        today = local_today(tz, lambda: datetime.now().date()).isoformat()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    cached = mood_snapshot.get(couple_code, today)
+    if cached is not None:
+        return cached
+    
     db = SessionLocal()
     try:
-        today = datetime.now().strftime('%Y-%m-%d')
-        moods = db.query(Mood).filter(Mood.couple_code == couple_code, Mood.date == today).all()
-        return [{
-            "id": m.id,
-            "user_id": m.user_id,
-            "mood": m.mood,
-            "energy": m.energy,
-            "stress": m.stress,
-            "libido": m.libido
-        } for m in moods]
+        generation = mood_snapshot.generation
+        moods = [today_mood_item(m) for m in db.query(Mood).filter(Mood.couple_code == couple_code, Mood.date == today)]
+        mood_snapshot.fill(couple_code, today, moods, generation)
+        return moods
     finally:
         db.close()
 
 @api_router.get("/mood/stats/{couple_code}")
+@result_cache.cached("mood_stats")
 async def get_mood_stats(couple_code: str):
     db = SessionLocal()
     try:
-        month_ago = (datetime.now() - timedelta(days=30)).strftime('%Y-%m-%d')
-        moods = db.query(Mood).filter(
-            Mood.couple_code == couple_code,
-            Mood.date >= month_ago
-        ).all()
+        # Rollup rows use date > after, so step back one day to keep "date >= 30 days ago"
+        after = (datetime.now() - timedelta(days=31)).strftime('%Y-%m-%d')
+        ensure_couple_stats(db, couple_code)
+        window = rollup_window(db, couple_code, after)
+        count = window["mood_count"]
         
-        if not moods:
+        if not count:
             return {"average_mood": 0, "average_energy": 0, "average_libido": 0}
         
         return {
-            "average_mood": round(sum(m.mood for m in moods) / len(moods), 1),
-            "average_energy": round(sum(m.energy for m in moods) / len(moods), 1),
-            "average_libido": round(sum(m.libido for m in moods) / len(moods), 1)
+            "average_mood": round(window["mood_sum"] / count, 1),
+            "average_energy": round(window["energy_sum"] / count, 1),
+            "average_libido": round(window["libido_sum"] / count, 1)
         }
     finally:
         db.close()
 
-# ================= WISHLIST ENDPOINTS =================
-@api_router.get("/wishlist/{couple_code}/{user_id}")
-async def get_wishlist(couple_code: str, user_id: str):
+# Mood analytics: one windowed query per couple (see mood_analytics.py)
+class day_number(FunctionElement):
+    """Days since 1970-01-01 of a YYYY-MM-DD column, as stats_engine.day_number"""
+    type = Integer()
+    inherit_cache = True
+
+@compiles(day_number)
+def _day_number_sqlite(element, compiler, **kw):
+    return "CAST(julianday(%s) - 2440587.5 AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+@compiles(day_number, "mysql")
+def _day_number_mysql(element, compiler, **kw):
+    return "(TO_DAYS(%s) - 719528)" % compiler.process(element.clauses, **kw)
+
+def mood_analytics_query(couple_code: str, lookback: str, start: str, end: str):
+    daily = select(
+        Mood.date,
+        day_number(Mood.date).label("day"),
+        func.count().label("n"),
+        *[func.sum(getattr(Mood, m)).label(f"{m}_sum") for m in MOOD_METRICS],
+        (func.max(Mood.mood) - func.min(Mood.mood)).label("mood_gap"),
+    ).where(
+        Mood.couple_code == couple_code, Mood.date >= lookback, Mood.date <= end
+    ).group_by(Mood.date).subquery()
+    d = daily.c
+    in_period = case((d.date >= start, 1), else_=0)
+    recent_from, prior_from = trend_bounds(end)
+    recent = case((d.day >= recent_from, 1), else_=0)
+    prior = case(((d.day >= prior_from) & (d.day < recent_from), 1), else_=0)
+    sync = case(((d.n == 2) & (d.date >= start), 1.0 - d.mood_gap * 1.0 / SYNC_SCALE))
+    by_weekday = {"partition_by": (d.day + 3) % 7}
+    columns = [d.date, d.day, d.n, *[d[f"{m}_sum"] for m in MOOD_METRICS]]
+    for w in MOOD_WINDOWS:
+        trailing = {"order_by": d.day, "range_": (-(w - 1), 0)}
+        columns.append(func.sum(d.n).over(**trailing).label(f"n_{w}d"))
+        columns += [func.sum(d[f"{m}_sum"]).over(**trailing).label(f"{m}_{w}d") for m in MOOD_METRICS]
+    columns += [
+        func.sum(in_period * d.n).over(**by_weekday).label("weekday_n"),
+        func.sum(in_period * d.mood_sum).over(**by_weekday).label("weekday_mood_sum"),
+        func.sum(in_period * d.n).over().label("total_n"),
+        *[func.sum(in_period * d[f"{m}_sum"]).over().label(f"total_{m}") for m in MOOD_METRICS],
+        func.avg(sync).over().label("sync"),
+        func.count(sync).over().label("sync_days"),
+        func.sum(recent * d.n).over().label("recent_n"),
+        func.sum(prior * d.n).over().label("prior_n"),
+        *[func.sum(recent * d[f"{t}_sum"]).over().label(f"recent_{t}") for t in TREND_METRICS],
+        *[func.sum(prior * d[f"{t}_sum"]).over().label(f"prior_{t}") for t in TREND_METRICS],
+    ]
+    return select(*columns).order_by(d.day)
+
+@api_router.get("/mood/analytics/{couple_code}")
+async def get_mood_analytics(couple_code: str, days: int = MOOD_ANALYTICS_DAYS):
+    """Rolling 7/30-day averages, partner sync, weekday profile and stress/libido trends"""
+    try:
+        lookback, start, end = analytics_range(days, datetime.now().date())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    db = SessionLocal()
+    try:
+        rows = db.execute(mood_analytics_query(couple_code, lookback, start, end)).mappings()
+        return build_analytics(rows, start, end)
+    finally:
+        db.close()
+
+@api_router.get("/calories/monthly/{couple_code}")
+async def get_monthly_calories(couple_code: str, month: Optional[int] = None, year: Optional[int] = None):
+    """Calories burned in a calendar month, summed from the daily rollups"""
     db = SessionLocal()
     try:
-        all_wishes = db.query(Wishlist).filter(Wishlist.couple_code == couple_code).all()
-        my_item_ids = [w.item_id for w in all_wishes if w.user_id == user_id]
-        partner_item_ids = [w.item_id for w in all_wishes if w.user_id != user_id]
+        now = datetime.now()
+        month = month or now.month
+        year = year or now.year
+        prefix = f"{year:04d}-{month:02d}-"
+        ensure_couple_stats(db, couple_code)
         
-        unlocked = set(my_item_ids) & set(partner_item_ids)
+        days = db.query(DailyRollup).filter(
+            DailyRollup.couple_code == couple_code,
+            DailyRollup.date >= prefix + "01",
+            DailyRollup.date <= prefix + "31",
+            DailyRollup.intimacy_count > 0
+        ).order_by(DailyRollup.date).all()
         
-        my_wishes = []
-        for item_id in my_item_ids:
-            item = next((i for i in WISHLIST_ITEMS if i["id"] == item_id), None)
-            if item:
-                my_wishes.append({
-                    "id": str(uuid.uuid4()),
-                    "item_id": item_id,
-                    "title": item["title"],
-                    "both_want": item_id in unlocked
-                })
+        total_calories = sum(d.calories for d in days)
+        session_count = sum(d.intimacy_count for d in days)
         
-        unlocked_wishes = []
-        for item_id in unlocked:
-            item = next((i for i in WISHLIST_ITEMS if i["id"] == item_id), None)
-            if item:
-                unlocked_wishes.append({
-                    "id": str(uuid.uuid4()),
-                    "item_id": item_id,
-                    "title": item["title"],
-                    "both_want": True
-                })
+        return {
+            "success": True,
+            "month": month,
+            "year": year,
+            "total_calories": round(total_calories),
+            "total_duration_minutes": sum(d.duration_sum for d in days),
+            "session_count": session_count,
+            "average_per_session": round(total_calories / session_count) if session_count else 0,
+            "equivalents": {
+                "chocolate_bars": round(total_calories / 100, 1),
+                "pizza_slices": round(total_calories / 285, 1),
+                "km_running": round(total_calories / 60, 1)
+            },
+            "sessions": [{
+                "date": d.date,
+                "calories": round(d.calories),
+                "duration": d.duration_sum,
+                "count": d.intimacy_count
+            } for d in days]
+        }
+    finally:
+        db.close()
+
+# ================= SELECTIONS =================
+# Wishlist and secret desires: one bitmask per (couple, user, catalog section), see selections.py
+WISHLIST_CATALOG = "wishlist_items"
+DESIRES_CATALOG = "desires"
+SELECTIONS_JOB = "migrate-selections"
+
+def selection_layout(snapshot, name: str) -> BitLayout:
+    return snapshot.derived(("bits", name), lambda s: BitLayout.of(s[name]))
+
+def couple_masks(db, couple_code: str, user_id: str, name: str):
+    """(user's mask, OR of the partner's masks) in one query over at most two rows"""
+    mine = partner = 0
+    rows = db.query(Selection.user_id, Selection.mask).filter(
+        Selection.couple_code == couple_code,
+        Selection.catalog == name
+    ).all()
+    for row_user, mask in rows:
+        if row_user == user_id:
+            mine = mask
+        else:
+            partner |= mask
+    return mine, partner
+
+def selection_filter(couple_code: str, user_id: str, name: str):
+    return (Selection.couple_code == couple_code, Selection.user_id == user_id, Selection.catalog == name)
+
+def save_selection(db, couple_code: str, user_id: str, name: str, mask: int) -> int:
+    """Set the mask (not committed); returns the previous one"""
+    row = db.query(Selection).filter(*selection_filter(couple_code, user_id, name)).first()
+    if row is None:
+        db.add(Selection(couple_code=couple_code, user_id=user_id, catalog=name, mask=mask))
+        return 0
+    previous, row.mask = row.mask, mask
+    return previous
+
+def toggle_selection(db, couple_code: str, user_id: str, name: str, bit: int) -> int:
+    """Flip one bit in a single UPDATE and commit; returns the new mask"""
+    # a ^ b spelled as (a | b) - (a & b): SQLite has no XOR operator
+    flipped = Selection.mask.op("|")(bit) - Selection.mask.op("&")(bit)
+    updated = db.query(Selection).filter(*selection_filter(couple_code, user_id, name)).update(
+        {Selection.mask: flipped, Selection.updated_at: datetime.utcnow()}, synchronize_session=False
+    )
+    if not updated:
+        db.add(Selection(couple_code=couple_code, user_id=user_id, catalog=name, mask=bit))
+        try:
+            db.commit()
+            return bit
+        except IntegrityError:
+            # A concurrent first toggle created the row
+            db.rollback()
+            return toggle_selection(db, couple_code, user_id, name, bit)
+    db.commit()
+    return db.query(Selection.mask).filter(*selection_filter(couple_code, user_id, name)).scalar()
+
+def migrate_selections() -> dict:
+    """Fold wishlist rows and secret_desires JSON lists into selection masks.
+    
+    Converted legacy rows are deleted, so the command can be re-run. Rows
+    naming ids outside the catalogs are kept and counted as skipped.
+    """
+    db = SessionLocal()
+    try:
+        snapshot = catalog.current()
+        masks = {}
+        counts = {"wishlist_rows": 0, "desire_rows": 0, "skipped": 0}
+
+        layout = selection_layout(snapshot, WISHLIST_CATALOG)
+        converted = []
+        for wish in db.query(Wishlist).all():
+            bit = layout.bits.get(wish.item_id)
+            if bit is None:
+                counts["skipped"] += 1
+                continue
+            key = (wish.couple_code, wish.user_id, WISHLIST_CATALOG)
+            masks[key] = masks.get(key, 0) | bit
+            converted.append(wish.id)
+        if converted:
+            db.query(Wishlist).filter(Wishlist.id.in_(converted)).delete(synchronize_session=False)
+        counts["wishlist_rows"] = len(converted)
+
+        # secret_desires is created by BACKEND_DESIRES_CODE.py, not by this server
+        if inspect(engine).has_table("secret_desires"):
+            layout = selection_layout(snapshot, DESIRES_CATALOG)
+            converted = []
+            for row_id, couple_code, user_id, desires in db.execute(
+                    text("SELECT id, couple_code, user_id, desires FROM secret_desires")):
+                if isinstance(desires, str):
+                    desires = json.loads(desires or "[]")
+                mask, unknown = layout.split(desires or [])
+                key = (couple_code, user_id, DESIRES_CATALOG)
+                masks[key] = masks.get(key, 0) | mask
+                if unknown:
+                    counts["skipped"] += 1
+                else:
+                    converted.append(row_id)
+            for row_id in converted:
+                db.execute(text("DELETE FROM secret_desires WHERE id = :id"), {"id": row_id})
+            counts["desire_rows"] = len(converted)
+
+        for (couple_code, user_id, name), mask in masks.items():
+            row = db.query(Selection).filter(*selection_filter(couple_code, user_id, name)).first()
+            if row is None:
+                db.add(Selection(couple_code=couple_code, user_id=user_id, catalog=name, mask=mask))
+            else:
+                row.mask |= mask
+        db.commit()
+        return counts
+    finally:
+        db.close()
+
+# ================= WISHLIST ENDPOINTS =================
+@api_router.get("/wishlist/{couple_code}/{user_id}")
+async def get_wishlist(couple_code: str, user_id: str):
+    db = SessionLocal()
+    try:
+        snapshot = catalog.current()
+        items = snapshot[WISHLIST_CATALOG].by_id
+        layout = selection_layout(snapshot, WISHLIST_CATALOG)
+        mine, partner = couple_masks(db, couple_code, user_id, WISHLIST_CATALOG)
+        unlocked = mine & partner
+        
+        # Ids are derived from the selection, so they stay the same across polls; the app
+        # merges both lists, hence the owner / couple prefix
+        my_wishes = [{
+            "id": f"{user_id}:{item_id}",
+            "item_id": item_id,
+            "title": items[item_id]["title"],
+            "both_want": bool(layout.bits[item_id] & unlocked)
+        } for item_id in layout.ids_of(mine)]
+        
+        unlocked_wishes = [{
+            "id": f"{couple_code}:{item_id}",
+            "item_id": item_id,
+            "title": items[item_id]["title"],
+            "both_want": True
+        } for item_id in layout.ids_of(unlocked)]
         
         return {
             "my_wishes": my_wishes,
             "unlocked_wishes": unlocked_wishes,
-            "partner_secret_wishes_count": len(set(partner_item_ids) - set(my_item_ids))
+            "partner_secret_wishes_count": popcount(partner & ~mine)
         }
     finally:
         db.close()
 
 @api_router.post("/wishlist/toggle")
 async def toggle_wishlist(data: WishlistToggle):
+    try:
+        bit = selection_layout(catalog.current(), WISHLIST_CATALOG).bit(data.item_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     db = SessionLocal()
     try:
-        existing = db.query(Wishlist).filter(
-            Wishlist.couple_code == data.couple_code,
-            Wishlist.user_id == data.user_id,
-            Wishlist.item_id == data.item_id
-        ).first()
-        
-        if existing:
-            db.delete(existing)
-            action = "removed"
-        else:
-            wish = Wishlist(
-                id=str(uuid.uuid4()),
-                couple_code=data.couple_code,
-                user_id=data.user_id,
-                item_id=data.item_id
-            )
-            db.add(wish)
-            action = "added"
-        
-        db.commit()
-        return {"action": action, "item_id": data.item_id}
+        mask = toggle_selection(db, data.couple_code, data.user_id, WISHLIST_CATALOG, bit)
+        return {"action": "added" if mask & bit else "removed", "item_id": data.item_id}
     finally:
         db.close()
 
 @api_router.get("/wishlist/items")
-async def get_wishlist_items():
-    return WISHLIST_ITEMS
+async def get_wishlist_items(request: Request):
+    return catalog.response(request, "wishlist_items")
 
 # ================= SPECIAL DATES ENDPOINTS =================
 @api_router.post("/special-dates")
@@ -809,6 +1965,7 @@ async def create_special_date(data: SpecialDateCreate):
         )
         db.add(date)
         db.commit()
+        feed_cache.invalidate(data.couple_code)
         return {"id": date.id, "message": "Date created"}
     finally:
         db.close()
@@ -854,17 +2011,55 @@ async def delete_special_date(date_id: str):
         if date:
             db.delete(date)
             db.commit()
+            feed_cache.invalidate(date.couple_code)
         return {"message": "Deleted"}
     finally:
         db.close()
 
 # ================= LOVE NOTES ENDPOINTS =================
+# A note is unread for every couple member except its sender. Counter rows are created by the
+# first read (exact COUNT), after which send / mark-read move them in the note's own transaction.
+UNREAD_JOB = "reconcile-unread"
+
+note_inbox = NoteInbox()
+
+def bump_unread(db, couple_code: str, sender_id: str, delta: int):
+    """Move the counters of the note's recipients (not committed)"""
+    unread = LoveNoteUnread.unread + delta if delta > 0 else case(
+        (LoveNoteUnread.unread + delta > 0, LoveNoteUnread.unread + delta), else_=0
+    )
+    db.query(LoveNoteUnread).filter(
+        LoveNoteUnread.couple_code == couple_code,
+        LoveNoteUnread.user_id != sender_id
+    ).update({LoveNoteUnread.unread: unread}, synchronize_session=False)
+
+def count_unread(couple_code, user_id):
+    """COUNT(*) of the notes unread by user_id; columns or values"""
+    return select(func.count(LoveNote.id)).where(
+        LoveNote.couple_code == couple_code,
+        LoveNote.sender_id != user_id,
+        LoveNote.is_read == False
+    )
+
+def reconcile_unread() -> int:
+    """Recount every unread counter from love_notes; returns how many had drifted"""
+    db = SessionLocal()
+    try:
+        expected = count_unread(LoveNoteUnread.couple_code, LoveNoteUnread.user_id).scalar_subquery()
+        drifted = db.query(LoveNoteUnread).filter(LoveNoteUnread.unread != expected).count()
+        db.query(LoveNoteUnread).update({LoveNoteUnread.unread: expected}, synchronize_session=False)
+        db.commit()
+        return drifted
+    finally:
+        db.close()
+
 @api_router.post("/love-notes")
 async def send_love_note(data: LoveNoteCreate):
     db = SessionLocal()
     try:
+        note_id = str(uuid.uuid4())
         note = LoveNote(
-            id=str(uuid.uuid4()),
+            id=note_id,
             couple_code=data.couple_code,
             sender_id=data.sender_id,
             sender_name=data.sender_name,
@@ -872,10 +2067,12 @@ async def send_love_note(data: LoveNoteCreate):
             category=data.category
         )
         db.add(note)
+        bump_unread(db, data.couple_code, data.sender_id, 1)
         db.commit()
-        return {"id": note.id, "message": "Note sent"}
     finally:
         db.close()
+    await note_inbox.publish(data.couple_code, data.sender_id)
+    return {"id": note_id, "message": "Note sent"}
 
 @api_router.get("/love-notes/{couple_code}/{user_id}")
 async def get_love_notes(couple_code: str, user_id: str):
@@ -897,15 +2094,51 @@ async def get_love_notes(couple_code: str, user_id: str):
     finally:
         db.close()
 
+async def latest_received_note(couple_code: str, user_id: str) -> str:
+    """Id of the newest note user_id received ("" if none), the long-poll cursor"""
+    db = SessionLocal()
+    try:
+        return db.query(LoveNote.id).filter(
+            LoveNote.couple_code == couple_code,
+            LoveNote.sender_id != user_id
+        ).order_by(LoveNote.created_at.desc(), LoveNote.id.desc()).limit(1).scalar() or ""
+    finally:
+        db.close()
+
+@api_router.get("/love-notes/{couple_code}/{user_id}/wait")
+async def wait_love_notes(couple_code: str, user_id: str, after: Optional[str] = None, timeout: float = MAX_WAIT_SECONDS):
+    """Long poll: answers when user_id receives a note past `after` or on timeout; reload the notes when changed"""
+    changed, cursor = await note_inbox.wait(
+        couple_code, user_id, after, lambda: latest_received_note(couple_code, user_id), timeout
+    )
+    return {"changed": changed, "cursor": cursor}
+
 @api_router.get("/love-notes/unread/{couple_code}/{user_id}")
 async def get_unread_count(couple_code: str, user_id: str):
     db = SessionLocal()
     try:
-        count = db.query(LoveNote).filter(
-            LoveNote.couple_code == couple_code,
-            LoveNote.sender_id != user_id,
-            LoveNote.is_read == False
-        ).count()
+        # Primary-key lookup; the COUNT only runs the first time a user asks
+        count = db.query(LoveNoteUnread.unread).filter(
+            LoveNoteUnread.couple_code == couple_code,
+            LoveNoteUnread.user_id == user_id
+        ).scalar()
+        if count is None:
+            # Count and insert in one statement: its locking read waits for a note being
+            # sent or read concurrently, so that write either lands in the count or
+            # finds the counter row to bump
+            seed = count_unread(couple_code, user_id).with_only_columns(
+                literal(couple_code), literal(user_id), func.count(LoveNote.id)
+            )
+            try:
+                db.execute(insert(LoveNoteUnread).from_select(["couple_code", "user_id", "unread"], seed))
+                db.commit()
+            except IntegrityError:
+                # A concurrent read created the counter first
+                db.rollback()
+            count = db.query(LoveNoteUnread.unread).filter(
+                LoveNoteUnread.couple_code == couple_code,
+                LoveNoteUnread.user_id == user_id
+            ).scalar()
         return {"count": count}
     finally:
         db.close()
@@ -914,24 +2147,23 @@ async def get_unread_count(couple_code: str, user_id: str):
 async def mark_note_read(note_id: str):
     db = SessionLocal()
     try:
-        note = db.query(LoveNote).filter(LoveNote.id == note_id).first()
+        note = db.query(LoveNote.couple_code, LoveNote.sender_id).filter(LoveNote.id == note_id).first()
         if note:
-            note.is_read = True
+            # Conditional, so a note read twice (or concurrently) is only counted down once
+            marked = db.query(LoveNote).filter(
+                LoveNote.id == note_id,
+                LoveNote.is_read == False
+            ).update({LoveNote.is_read: True}, synchronize_session=False)
+            if marked:
+                bump_unread(db, note.couple_code, note.sender_id, -1)
             db.commit()
         return {"message": "Marked as read"}
     finally:
         db.close()
 
 @api_router.get("/love-notes/templates")
-async def get_note_templates():
-    return [
-        {"id": "1", "category": "romantic", "message": "Sei la cosa più bella che mi sia mai capitata 💕"},
-        {"id": "2", "category": "romantic", "message": "Non vedo l'ora di rivederti ❤️"},
-        {"id": "3", "category": "spicy", "message": "Stasera ho voglia di te... 🔥"},
-        {"id": "4", "category": "spicy", "message": "Non riesco a smettere di pensare a ieri notte 😏"},
-        {"id": "5", "category": "sweet", "message": "Grazie di esistere nella mia vita 🌹"},
-        {"id": "6", "category": "sweet", "message": "Sei il mio pensiero fisso 💭"}
-    ]
+async def get_note_templates(request: Request):
+    return catalog.response(request, "love_note_templates")
 
 # ================= WEEKLY CHALLENGE ENDPOINTS =================
 @api_router.get("/weekly-challenge/{couple_code}")
@@ -945,10 +2177,11 @@ async def get_weekly_challenge(couple_code: str):
             WeeklyChallenge.couple_code == couple_code,
             WeeklyChallenge.week_start == week_start
         ).first()
+        challenges = catalog["weekly_challenges"]
         
         if not challenge:
             # Create new challenge for this week
-            random_challenge = random.choice(WEEKLY_CHALLENGES)
+            random_challenge = random.choice(challenges.items)
             challenge = WeeklyChallenge(
                 id=str(uuid.uuid4()),
                 couple_code=couple_code,
@@ -958,10 +2191,10 @@ async def get_weekly_challenge(couple_code: str):
             db.add(challenge)
             db.commit()
         
-        challenge_data = next((c for c in WEEKLY_CHALLENGES if c["id"] == challenge.challenge_id), WEEKLY_CHALLENGES[0])
+        challenge_data = challenges.by_id.get(challenge.challenge_id, challenges.items[0])
         
         return {
-            "challenge": challenge_data,
+            "challenge": dict(challenge_data),
             "completed": challenge.completed,
             "week_start": challenge.week_start
         }
@@ -991,10 +2224,11 @@ async def complete_weekly_challenge(couple_code: str):
 # ================= GAME ENDPOINTS =================
 @api_router.get("/love-dice/roll")
 async def roll_love_dice():
-    action = random.choice(LOVE_DICE_ACTIONS)
-    body_part = random.choice(LOVE_DICE_BODY_PARTS)
-    duration = random.choice(LOVE_DICE_DURATION)
-    scenario = random.choice(LOVE_DICE_SCENARIOS)
+    dice = catalog.current()
+    action = random.choice(dice["love_dice_actions"].items)
+    body_part = random.choice(dice["love_dice_body_parts"].items)
+    duration = random.choice(dice["love_dice_duration"].items)
+    scenario = random.choice(dice["love_dice_scenarios"].items)
     
     include_scenario = random.random() > 0.5
     
@@ -1015,17 +2249,21 @@ async def roll_love_dice():
 async def get_random_suggestion():
     suggestion_type = random.choice(["challenge", "position"])
     if suggestion_type == "challenge":
-        return {"type": "challenge", "data": random.choice(SPICY_CHALLENGES)}
+        return {"type": "challenge", "data": dict(random.choice(catalog["spicy_challenges"].items))}
     else:
-        return {"type": "position", "data": random.choice(POSITION_SUGGESTIONS)}
+        return {"type": "position", "data": dict(random.choice(catalog["positions"].items))}
 
 @api_router.get("/positions")
-async def get_positions():
-    return POSITION_SUGGESTIONS
+async def get_positions(request: Request):
+    return catalog.response(request, "positions")
 
 @api_router.get("/challenges/suggestions")
-async def get_challenge_suggestions():
-    return random.sample(SPICY_CHALLENGES, min(3, len(SPICY_CHALLENGES)))
+async def get_challenge_suggestions(request: Request):
+    return catalog.response(request, "suggestions", suggestions_payload)
+
+@api_router.get("/catalog/version")
+async def get_catalog_version():
+    return {"version": catalog.version}
 
 
 # ================= AI COACH =================
@@ -1118,6 +2356,9 @@ async def analyze_couple_data(request: AICoachAnalyzeRequest):
                 "priority": "medium"
             })
         
+        # Patterns from the nightly mood <-> intimacy correlations
+        suggestions.extend(coach_suggestions(couple_correlations(db, request.couple_code)))
+        
         # Default suggestion if no specific ones
         if not suggestions:
             suggestions.append({
@@ -1164,6 +2405,7 @@ async def analyze_couple_data(request: AICoachAnalyzeRequest):
         db.close()
 
 @api_router.get("/ai-coach/insights/{couple_code}")
+@result_cache.cached("ai_insights")
 async def get_ai_insights(couple_code: str):
     """Get intelligent insights about the couple's relationship"""
     db = SessionLocal()
@@ -1238,6 +2480,8 @@ async def get_ai_insights(couple_code: str):
                 "color": "#2ed573"
             })
         
+        insights.extend(insight_cards(couple_correlations(db, couple_code)))
+        
         return {
             "success": True,
             "insights": insights
@@ -1347,10 +2591,64 @@ def generate_smart_response(question: str) -> dict:
 # ================= INCLUDE ROUTER =================
 app.include_router(api_router)
 
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return {
+        "results": result_cache.stats(),
+        "fertility_calendar": calendar_cache.stats(),
+        "calendar_feeds": feed_cache.stats(),
+        "today_moods": mood_snapshot.stats(),
+        "catalog": catalog.stats(),
+        "notifications": partner_notifier.stats(),
+        "love_note_waits": note_inbox.stats(),
+    }
+
+@app.on_event("shutdown")
+async def flush_notifications():
+    await partner_notifier.close()
+
 @app.get("/")
 async def root():
     return {"message": "Couple Bliss API v1.0", "status": "running"}
 
+def run_command(argv: List[str]) -> bool:
+    """Maintenance commands: `python server.py <command> [args]`"""
+    if not argv:
+        return False
+    command, args = argv[0], argv[1:]
+    if command == "rebuild-stats":
+        count = rebuild_couple_stats(args[0] if args else None)
+        print(f"Rebuilt couple_stats for {count} couple(s)")
+    elif command == "rebuild-score-histogram":
+        count = rebuild_score_histogram()
+        print(f"Rebuilt score_histogram from {count} couple score(s)")
+    elif command == "backfill-couples":
+        count = backfill_couples()
+        print(f"Linked cycles for {count} couple(s)")
+    elif command == SELECTIONS_JOB:
+        counts = migrate_selections()
+        print(f"Migrated {counts['wishlist_rows']} wishlist row(s) and {counts['desire_rows']} desire row(s), "
+              f"{counts['skipped']} skipped (ids outside the catalog)")
+    elif command == UNREAD_JOB:
+        count = reconcile_unread()
+        print(f"Reconciled unread counters, {count} had drifted")
+    elif command == SCORING_JOB:
+        # score-couples [--restart] [CHUNK_SIZE]
+        restart = "--restart" in args
+        sizes = [int(a) for a in args if a.isdigit()]
+        count = score_all_couples(chunk_size=sizes[0] if sizes else 500, restart=restart)
+        print(f"Scored {count} couple(s)")
+    elif command == CORRELATION_JOB:
+        # correlate-moods [--restart] [CHUNK_SIZE]
+        restart = "--restart" in args
+        sizes = [int(a) for a in args if a.isdigit()]
+        count = correlate_all_couples(chunk_size=sizes[0] if sizes else 500, restart=restart)
+        print(f"Correlated {count} couple(s)")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
+    return True
+
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    if not run_command(sys.argv[1:]):
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -1,16 +1,38 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import DeleteOne, UpdateOne
+from pymongo.errors import OperationFailure
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uuid
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
 import random
 import string
+import sys
+import asyncio
+
+from badges import ALL_AGGREGATES, INTIMACY_AGGREGATES, newly_unlocked, pending_rules, required_aggregates, sort_badges
+from calendar_month import month_payload, month_range
+from calories import estimate_calories
+from catalog import Catalog
+from cycle_model import is_plausible, observe, predict_next_period, predicted_length, replay, summary as cycle_summary
+from fertility import Cycle, CalendarCache, calendar_payload, check_format, current_windows, iso, make_cycle, resolve_range as resolve_fertility_range
+from http_cache import conditional_body, conditional_json
+from mood_analytics import DEFAULT_DAYS as MOOD_ANALYTICS_DAYS, METRICS as MOOD_METRICS, SYNC_SCALE, TREND_METRICS, WINDOWS as MOOD_WINDOWS, analytics_range, build_analytics, trend_bounds
+from ics_feed import FeedCache, predicted_periods, render_feed
+from note_inbox import MAX_WAIT_SECONDS, NoteInbox
+from result_cache import ResultCache
+from score_distribution import SCORE_BUCKETS, ScoreHistogram, score_bucket
+from stats_engine import WEEKDAY_NAMES_IT, arrays_from_entries, compute_intimacy_metrics
+from streaks import compute_streaks, day_ordinals, week_ordinal
+from timeseries import build_series, resolve_range
+from today_snapshot import MoodSnapshot, local_today
+from user_cache import UserCache
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -33,6 +55,12 @@ app = FastAPI(
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Stats, insights and predictions only change on writes (or when the UTC day changes)
+result_cache = ResultCache()
+
+def cached_until_write(endpoint: str, scope: str = "couple_code"):
+    return result_cache.cached(endpoint, scope=scope, today=lambda: datetime.utcnow().date())
+
 # ================= MODELS =================
 
 class User(BaseModel):
@@ -558,12 +586,388 @@ WEEKLY_CHALLENGES_POOL = [
     {"title": "Lettere d'Amore", "description": "Scrivetevi una lettera (anche piccante) e scambiatevela a fine settimana", "difficulty": "romantico"},
 ]
 
+LOVE_NOTE_TEMPLATES = {
+    "sweet": [
+        "Sei la cosa più bella della mia giornata 💕",
+        "Non vedo l'ora di tornare a casa da te",
+        "Pensavo a te... come sempre",
+        "Mi manchi già, anche se ci siamo visti stamattina",
+        "Sei il mio pensiero preferito",
+    ],
+    "spicy": [
+        "Non riesco a smettere di pensare a ieri notte... 🔥",
+        "Ho delle idee per stasera...",
+        "Mi fai impazzire, lo sai?",
+        "Conto i minuti fino a stasera",
+        "Ho bisogno di te. Adesso.",
+    ],
+    "funny": [
+        "Se fossi un vegetale, saresti un carote-ino 🥕",
+        "Ti amo più della pizza. E sai quanto amo la pizza.",
+        "Sei la mia persona preferita da infastidire",
+        "Grazie per sopportare la mia follia",
+        "Reminder: sono figo/a e tu sei fortunato/a",
+    ],
+    "romantic": [
+        "In un universo infinito, ho trovato te ✨",
+        "Ogni giorno con te è un regalo",
+        "Sei il mio per sempre",
+        "Mi hai rubato il cuore e non lo rivoglio indietro",
+        "Con te, tutto ha senso",
+    ]
+}
+
+# Built-in content; CATALOG_DIR/<section>.json overrides a section and is reloaded on change
+catalog = Catalog({
+    "love_dice_actions": LOVE_DICE_ACTIONS,
+    "love_dice_body_parts": LOVE_DICE_BODY_PARTS,
+    "love_dice_duration": LOVE_DICE_DURATION,
+    "love_dice_scenarios": LOVE_DICE_SCENARIOS,
+    "spicy_challenges": SPICY_CHALLENGES,
+    "positions": POSITION_SUGGESTIONS,
+    "quiz_questions": COMPATIBILITY_QUESTIONS,
+    "weekly_challenges": WEEKLY_CHALLENGES_POOL,
+    "love_note_templates": LOVE_NOTE_TEMPLATES,
+}, data_dir=os.environ.get("CATALOG_DIR"))
+
+def suggestions_payload(c) -> dict:
+    return {"challenges": c.payload("spicy_challenges"), "positions": c.payload("positions"), "quiz_questions": c.payload("quiz_questions")}
+
+# ================= DAILY ROLLUPS =================
+# One document per (couple_code, date) with the day's sums; windowed stats read these
+ROLLUP_FIELDS = (
+    "intimacy_count", "quality_sum", "duration_sum", "calories",
+    "mood_count", "mood_sum", "energy_sum", "stress_sum", "libido_sum"
+)
+
+def intimacy_rollup_inc(entry: dict, sign: int = 1) -> dict:
+    return {
+        "intimacy_count": sign,
+        "quality_sum": sign * (entry.get("quality_rating") or 0),
+        "duration_sum": sign * (entry.get("duration_minutes") or 0),
+        "calories": sign * estimate_calories(entry.get("duration_minutes"), entry.get("positions_used"), entry.get("quality_rating")),
+    }
+
+def mood_rollup_inc(entry: dict, sign: int = 1) -> dict:
+    return {
+        "mood_count": sign,
+        "mood_sum": sign * entry["mood"],
+        "energy_sum": sign * entry["energy"],
+        "stress_sum": sign * entry["stress"],
+        "libido_sum": sign * entry["libido"],
+    }
+
+async def bump_daily_rollup(couple_code: str, date: str, inc: dict):
+    await db.daily_rollups.update_one(
+        {"couple_code": couple_code, "date": date},
+        {"$inc": inc, "$setOnInsert": {"week": week_ordinal(date)}},
+        upsert=True
+    )
+
+async def get_rollup_days(couple_code: str, after: str) -> List[dict]:
+    """Rollup documents with date > after (a 60-day window is at most ~60 documents)"""
+    return await db.daily_rollups.find(
+        {"couple_code": couple_code, "date": {"$gt": after}}
+    ).to_list(400)
+
+def sum_rollups(days: List[dict]) -> dict:
+    return {f: sum(d.get(f, 0) for d in days) for f in ROLLUP_FIELDS}
+
+async def rebuild_daily_rollups(couple_code: Optional[str] = None) -> int:
+    """Recompute daily_rollups from intimacy and mood_entries (backfill / drift repair)"""
+    query = {"couple_code": couple_code} if couple_code else {}
+    days = {}
+    async for entry in db.intimacy.find(query):
+        day = days.setdefault((entry["couple_code"], entry["date"]), dict.fromkeys(ROLLUP_FIELDS, 0))
+        for field, value in intimacy_rollup_inc(entry).items():
+            day[field] += value
+    async for entry in db.mood_entries.find(query):
+        day = days.setdefault((entry["couple_code"], entry["date"]), dict.fromkeys(ROLLUP_FIELDS, 0))
+        for field, value in mood_rollup_inc(entry).items():
+            day[field] += value
+    
+    await db.daily_rollups.delete_many(query)
+    if days:
+        await db.daily_rollups.insert_many([
+            {"couple_code": code, "date": date, "week": week_ordinal(date), **sums}
+            for (code, date), sums in days.items()
+        ])
+    return len({code for code, _ in days})
+
+# ================= BADGES =================
+# One couple_badges document per unlocked badge, evaluated by the intimacy write path
+async def badge_aggregates(couple_code: str, names) -> dict:
+    """Compute only the named aggregates the pending badge rules read"""
+    values = {}
+    if names & {"total_count", "average_quality", "max_duration"}:
+        totals = await db.intimacy.aggregate([
+            {"$match": {"couple_code": couple_code}},
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "avg_quality": {"$avg": {"$ifNull": ["$quality_rating", 0]}},
+                "max_duration": {"$max": "$duration_minutes"},
+            }}
+        ]).to_list(1)
+        totals = totals[0] if totals else {}
+        values["total_count"] = totals.get("count", 0)
+        values["average_quality"] = totals.get("avg_quality") or 0
+        values["max_duration"] = totals.get("max_duration") or 0
+    if "distinct_locations" in names:
+        locations = await db.intimacy.distinct("location", {"couple_code": couple_code})
+        values["distinct_locations"] = len([loc for loc in locations if loc])
+    if "current_streak" in names:
+        dates = await db.intimacy.distinct("date", {"couple_code": couple_code})
+        values["current_streak"] = compute_streaks(day_ordinals(dates), datetime.utcnow().toordinal()).current_weeks
+    if "monthly_count" in names:
+        month_ago = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d")
+        values["monthly_count"] = sum_rollups(await get_rollup_days(couple_code, month_ago))["intimacy_count"]
+    return values
+
+async def evaluate_couple_badges(couple_code: str, changed=INTIMACY_AGGREGATES) -> List[str]:
+    """Unlock newly earned badges and return their ids"""
+    unlocked = await db.couple_badges.distinct("badge_id", {"couple_code": couple_code})
+    rules = pending_rules(unlocked, changed)
+    if not rules:
+        return []
+    earned = newly_unlocked(rules, await badge_aggregates(couple_code, required_aggregates(rules)))
+    now = datetime.utcnow()
+    for badge_id in earned:
+        await db.couple_badges.update_one(
+            {"couple_code": couple_code, "badge_id": badge_id},
+            {"$setOnInsert": {"unlocked_at": now}},
+            upsert=True
+        )
+    return earned
+
+async def get_couple_badges(couple_code: str, has_entries: bool) -> dict:
+    """badge id -> unlock time; couples with entries but no unlocks yet are evaluated once"""
+    query = {"couple_code": couple_code}
+    docs = await db.couple_badges.find(query, {"_id": 0, "badge_id": 1, "unlocked_at": 1}).to_list(None)
+    if not docs and has_entries:
+        await evaluate_couple_badges(couple_code, ALL_AGGREGATES)
+        docs = await db.couple_badges.find(query, {"_id": 0, "badge_id": 1, "unlocked_at": 1}).to_list(None)
+    return {d["badge_id"]: d["unlocked_at"] for d in docs}
+
+# ================= SCORE DISTRIBUTION =================
+# couple_scores holds each couple's latest score, score_histogram the couples per 0.1 bucket
+score_histogram = ScoreHistogram()
+
+async def load_score_histogram():
+    docs = await db.score_histogram.find({}, {"_id": 0}).to_list(SCORE_BUCKETS)
+    score_histogram.load({d["bucket"]: d["couples"] for d in docs})
+
+async def flush_score_histogram():
+    """Add the in-memory bucket deltas to score_histogram, then reload the shared totals"""
+    for bucket, delta in score_histogram.take_pending().items():
+        await db.score_histogram.update_one({"bucket": bucket}, {"$inc": {"couples": delta}}, upsert=True)
+    await load_score_histogram()
+
+async def record_couple_score(couple_code: str, score: float) -> Optional[float]:
+    """Keep the couple's histogram bucket current and return its percentile among all couples"""
+    if not score_histogram.loaded:
+        await load_score_histogram()
+    doc = await db.couple_scores.find_one({"couple_code": couple_code})
+    old = doc.get("score") if doc else None
+    if old is None or score_bucket(old) != score_bucket(score):
+        # Conditional writes, so concurrent readers move the couple only once
+        if doc is None:
+            result = await db.couple_scores.update_one(
+                {"couple_code": couple_code},
+                {"$setOnInsert": {"score": score, "updated_at": datetime.utcnow()}},
+                upsert=True
+            )
+            moved = result.upserted_id is not None
+        else:
+            result = await db.couple_scores.update_one(
+                {"couple_code": couple_code, "score": old},
+                {"$set": {"score": score, "updated_at": datetime.utcnow()}}
+            )
+            moved = result.modified_count == 1
+        if moved:
+            score_histogram.move(old, score)
+    if score_histogram.flush_due():
+        await flush_score_histogram()
+    return score_histogram.percentile(score)
+
+async def rebuild_score_histogram() -> int:
+    """Recount score_histogram exactly from couple_scores (repairs deltas lost on a crash)"""
+    counts = [0] * SCORE_BUCKETS
+    async for doc in db.couple_scores.find({"score": {"$ne": None}}, {"_id": 0, "score": 1}):
+        counts[score_bucket(doc["score"])] += 1
+    await db.score_histogram.delete_many({})
+    await db.score_histogram.insert_many([{"bucket": b, "couples": n} for b, n in enumerate(counts)])
+    score_histogram.take_pending()
+    await load_score_histogram()
+    return sum(counts)
+
+# ================= CYCLE STATS =================
+# One cycle_stats document per user with running statistics of the tracked cycle lengths
+# It also keeps last_start, the newest period start, so start-period needs no history query
+async def load_cycle_stats(user_id: str) -> dict:
+    """The user's cycle statistics, replayed from cycle_history on first access"""
+    stats = await db.cycle_stats.find_one({"user_id": user_id}, {"_id": 0, "user_id": 0})
+    if stats is None:
+        history = await db.cycle_history.find(
+            {"user_id": user_id}, {"_id": 0, "cycle_length": 1, "period_start_date": 1}
+        ).sort("period_start_date", 1).to_list(None)
+        stats = replay(h.get("cycle_length") for h in history)
+        stats["last_start"] = history[-1]["period_start_date"] if history else None
+        await db.cycle_stats.update_one({"user_id": user_id}, {"$setOnInsert": stats}, upsert=True)
+    return stats
+
+async def last_period_start(user_id: str, stats: dict) -> Optional[str]:
+    if "last_start" in stats:
+        return stats["last_start"]
+    # Statistics stored before last_start was tracked
+    last = await db.cycle_history.find_one(
+        {"user_id": user_id}, {"_id": 0, "period_start_date": 1}, sort=[("period_start_date", -1)]
+    )
+    return last["period_start_date"] if last else None
+
+async def record_period_start(user_id: str, stats: dict, start: str, length: Optional[int]) -> dict:
+    """Store a new period start and fold its cycle length in: one compare-and-set write on count"""
+    while True:
+        updated = observe(stats, length) if is_plausible(length) else {}
+        updated["last_start"] = max(start, stats.get("last_start") or start)
+        result = await db.cycle_stats.update_one(
+            {"user_id": user_id, "count": stats["count"]},
+            {"$set": updated}
+        )
+        if result.matched_count:
+            return {**stats, **updated}
+        stats = await load_cycle_stats(user_id)
+
+# Shared by the fertility calendar and predictions; dropped on every cycle write
+calendar_cache = CalendarCache()
+
+# One couples document per couple code: {couple_code, member_ids, cycle_id, cycle_owner_id}.
+# cycle_id is kept current by every cycle write and join-couple, so a fertility
+# read is one indexed lookup instead of cycle -> user -> cycle by couple_code.
+async def link_couple_cycle(couple_code: Optional[str], member_id: str, cycle: Optional[dict] = None):
+    """Add the member to the couple and, when given, make `cycle` the tracked one"""
+    if not couple_code:
+        return
+    update = {"$addToSet": {"member_ids": member_id}, "$set": {"updated_at": datetime.utcnow()}}
+    if cycle is not None:
+        update["$set"].update({"cycle_id": cycle["id"], "cycle_owner_id": cycle["user_id"]})
+    await db.couples.update_one({"couple_code": couple_code}, update, upsert=True)
+
+async def _couple_cycle(match: dict) -> Tuple[bool, Optional[dict]]:
+    """(found couple, its tracked cycle), in one round trip once the couple is linked"""
+    docs = await db.couples.aggregate([
+        {"$match": match},
+        {"$limit": 1},
+        {"$lookup": {"from": "cycle_data", "localField": "cycle_id", "foreignField": "id", "as": "cycle"}},
+    ]).to_list(1)
+    if not docs:
+        return False, None
+    couple = docs[0]
+    if couple["cycle"]:
+        return True, couple["cycle"][0]
+    # No link yet: create_user / join_couple make couples documents without one, so a cycle
+    # stored before couples existed (and not backfilled) is found the old way and linked
+    cycle = await db.cycle_data.find_one(
+        {"$or": [{"couple_code": couple["couple_code"]}, {"user_id": {"$in": couple.get("member_ids", [])}}]},
+        sort=[("updated_at", -1)]
+    )
+    if cycle:
+        await db.couples.update_one(
+            {"couple_code": couple["couple_code"]},
+            {"$set": {"cycle_id": cycle["id"], "cycle_owner_id": cycle["user_id"], "updated_at": datetime.utcnow()}}
+        )
+    return True, cycle
+
+async def find_tracked_cycle(user_id: str) -> Optional[dict]:
+    """The cycle tracked by the user's couple (their own or the partner's)"""
+    found, cycle = await _couple_cycle({"member_ids": user_id})
+    if found:
+        return cycle
+    # Users without a couples document (`backfill-couples` not run yet)
+    cycle = await db.cycle_data.find_one({"user_id": user_id})
+    if not cycle:
+        user = await db.users.find_one({"id": user_id})
+        if user and user.get("couple_code"):
+            cycle = await db.cycle_data.find_one({"couple_code": user["couple_code"]})
+    return cycle
+
+async def backfill_couples() -> int:
+    """Create or refresh the couples document of every couple code in use"""
+    codes = await db.users.distinct("couple_code")
+    for code in codes:
+        if not code:
+            continue
+        member_ids = await db.users.distinct("id", {"couple_code": code})
+        cycle = await db.cycle_data.find_one(
+            {"$or": [{"couple_code": code}, {"user_id": {"$in": member_ids}}]},
+            sort=[("updated_at", -1)]
+        )
+        await db.couples.update_one(
+            {"couple_code": code},
+            {"$set": {
+                "member_ids": member_ids,
+                "cycle_id": cycle["id"] if cycle else None,
+                "cycle_owner_id": cycle["user_id"] if cycle else None,
+                "updated_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+    return len([code for code in codes if code])
+
+async def load_user_cycle(user_id: str) -> Optional[Cycle]:
+    """Cycle parameters tracked by the user's couple, memoized until the next cycle write"""
+    found, params = calendar_cache.user_cycle(user_id)
+    if found:
+        return params
+    generation = calendar_cache.generation
+    cycle = await find_tracked_cycle(user_id)
+    params = make_cycle(cycle["last_period_date"], cycle["cycle_length"], cycle["period_length"]) if cycle else None
+    calendar_cache.put_user_cycle(user_id, params, generation)
+    return params
+
+async def invalidate_cycle_results(user_id: str, couple_code: Optional[str], partner_id: Optional[str] = None):
+    """Fertility reads fall back to the partner's cycle, so drop both users' entries"""
+    user_ids = [user_id]
+    if partner_id:
+        user_ids.append(partner_id)
+    elif couple_code:
+        user_ids += [u["id"] async for u in db.users.find({"couple_code": couple_code}, {"id": 1})]
+    calendar_cache.invalidate(*user_ids)
+    result_cache.invalidate(*user_ids)
+    feed_cache.invalidate(couple_code)
+
+# ================= USER LOOKUPS =================
+# couple_code / partner_id of a user, for write paths; join-couple drops the entries it changes
+USER_FIELDS = {"_id": 0, "id": 1, "name": 1, "couple_code": 1, "partner_id": 1}
+user_cache = UserCache()
+
+async def cached_user(user_id: str) -> Optional[dict]:
+    user = user_cache.get(user_id)
+    if user is None:
+        generation = user_cache.generation
+        user = await db.users.find_one({"id": user_id}, USER_FIELDS)
+        if user:
+            user_cache.put(user_id, user, generation)
+    return user
+
 # ================= ROUTES =================
 
 @api_router.get("/")
 async def root():
     return {"message": "Couple Wellness API"}
 
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "results": result_cache.stats(),
+        "fertility_calendar": calendar_cache.stats(),
+        "calendar_feeds": feed_cache.stats(),
+        "today_moods": mood_snapshot.stats(),
+        "catalog": catalog.stats(),
+        "users": user_cache.stats(),
+        "love_note_waits": note_inbox.stats(),
+    }
+
 # User Routes
 @api_router.post("/users", response_model=User)
 async def create_user(input: UserCreate):
@@ -572,6 +976,7 @@ async def create_user(input: UserCreate):
     # Generate unique couple code
     user_obj.couple_code = ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
     await db.users.insert_one(user_obj.dict())
+    await link_couple_cycle(user_obj.couple_code, user_obj.id)
     return user_obj
 
 @api_router.get("/users/{user_id}", response_model=User)
@@ -592,7 +997,7 @@ async def join_couple(user_id: str, couple_code: str):
         raise HTTPException(status_code=400, detail="Non puoi collegarti a te stesso")
     
     # Link both users
-    await db.users.update_one(
+    user = await db.users.find_one_and_update(
         {"id": user_id},
         {"$set": {"partner_id": partner["id"], "couple_code": couple_code}}
     )
@@ -601,6 +1006,22 @@ async def join_couple(user_id: str, couple_code: str):
         {"$set": {"partner_id": user_id}}
     )
     
+    # Move the user into the couple; their cycle becomes the tracked one if the couple has none
+    if user and user.get("couple_code") and user["couple_code"] != couple_code:
+        await db.couples.update_one({"couple_code": user["couple_code"]}, {"$pull": {"member_ids": user_id}})
+    couple = await db.couples.find_one({"couple_code": couple_code}, {"cycle_id": 1})
+    own_cycle = None
+    if not (couple and couple.get("cycle_id")):
+        own_cycle = await db.cycle_data.find_one_and_update(
+            {"user_id": user_id}, {"$set": {"couple_code": couple_code}}
+        )
+    await link_couple_cycle(couple_code, partner["id"])
+    await link_couple_cycle(couple_code, user_id, own_cycle)
+    calendar_cache.invalidate(user_id, partner["id"])
+    result_cache.invalidate(user_id, partner["id"])
+    feed_cache.invalidate(couple_code, user.get("couple_code") if user else None)
+    user_cache.invalidate(user_id, partner["id"], user.get("partner_id") if user else None)
+    
     return {"message": "Coppia collegata!", "couple_code": couple_code}
 
 # Cycle Data Routes
@@ -621,99 +1042,117 @@ async def save_cycle_data(input: CycleDataCreate):
     cycle_dict["couple_code"] = couple_code
     cycle_obj = CycleData(**cycle_dict)
     await db.cycle_data.insert_one(cycle_obj.dict())
+    await link_couple_cycle(couple_code, input.user_id, cycle_obj.dict())
+    await invalidate_cycle_results(input.user_id, couple_code)
     return cycle_obj
 
 @api_router.get("/cycle/{user_id}", response_model=Optional[CycleData])
 async def get_cycle_data(user_id: str):
-    # First try to find by user_id
-    cycle = await db.cycle_data.find_one({"user_id": user_id})
-    if cycle:
-        return CycleData(**cycle)
-    
-    # If not found, try to find by couple_code (for partner)
-    user = await db.users.find_one({"id": user_id})
-    if user and user.get("couple_code"):
-        cycle = await db.cycle_data.find_one({"couple_code": user["couple_code"]})
-        if cycle:
-            return CycleData(**cycle)
-    
-    return None
+    # The user's own cycle, or the partner's (for partner viewing)
+    cycle = await find_tracked_cycle(user_id)
+    return CycleData(**cycle) if cycle else None
 
 @api_router.get("/cycle/fertility/{user_id}")
-async def get_fertility_calendar(user_id: str):
-    # First try to find by user_id
-    cycle = await db.cycle_data.find_one({"user_id": user_id})
-    
-    # If not found, try to find by couple_code (for partner viewing)
-    if not cycle:
-        user = await db.users.find_one({"id": user_id})
-        if user and user.get("couple_code"):
-            cycle = await db.cycle_data.find_one({"couple_code": user["couple_code"]})
-    
-    if not cycle:
-        return {"periods": [], "fertile_days": [], "ovulation_days": []}
-    
-    from datetime import timedelta
-    last_period = datetime.strptime(cycle["last_period_date"], "%Y-%m-%d")
-    cycle_length = cycle["cycle_length"]
-    period_length = cycle["period_length"]
-    
-    periods = []
-    fertile_days = []
-    ovulation_days = []
-    
-    # Calculate for next 6 months
-    current_period = last_period
-    for _ in range(6):
-        # Period days
-        for i in range(period_length):
-            periods.append((current_period + timedelta(days=i)).strftime("%Y-%m-%d"))
-        
-        # Ovulation is typically 14 days before next period
-        ovulation = current_period + timedelta(days=cycle_length - 14)
-        ovulation_days.append(ovulation.strftime("%Y-%m-%d"))
-        
-        # Fertile window: 5 days before ovulation + ovulation day + 1 day after
-        for i in range(-5, 2):
-            fertile_day = ovulation + timedelta(days=i)
-            fertile_days.append(fertile_day.strftime("%Y-%m-%d"))
-        
-        current_period = current_period + timedelta(days=cycle_length)
+async def get_fertility_calendar(
+    user_id: str,
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None,
+    format: str = "days"
+):
+    """Periods, fertile and ovulation days in [from, to] (default: the last period plus 6 cycles).
+    
+    format=intervals|bitmap returns the compact encodings described in fertility.py.
+    """
+    try:
+        check_format(format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # The user's own cycle, or the partner's via couple_code (for partner viewing)
+    params = await load_user_cycle(user_id)
+    if params is None:
+        return calendar_payload(None, format)
     
-    return {
-        "periods": periods,
-        "fertile_days": fertile_days,
-        "ovulation_days": ovulation_days
-    }
+    try:
+        first, last = resolve_fertility_range(params, from_, to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return calendar_payload(calendar_cache.calendar(params, first, last), format)
+
+# ================= CALENDAR MONTH =================
+async def _month_fertility(couple_code: str, first: int, last: int):
+    _, cycle = await _couple_cycle({"couple_code": couple_code})
+    if cycle is None:
+        return None
+    return calendar_cache.calendar(make_cycle(cycle["last_period_date"], cycle["cycle_length"], cycle["period_length"]), first, last)
+
+@api_router.get("/calendar/{couple_code}/{month}")
+async def get_calendar_month(couple_code: str, month: str, request: Request):
+    """Periods, fertile days, intimacy, moods and special dates of one month (YYYY-MM).
+    
+    Days are offsets from the first of the month; answers 304 when If-None-Match matches.
+    """
+    try:
+        first, last = month_range(month)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    in_month = {"couple_code": couple_code, "date": {"$gte": first.isoformat(), "$lte": last.isoformat()}}
+    calendar, intimacy, moods, special_dates = await asyncio.gather(
+        _month_fertility(couple_code, first.toordinal(), last.toordinal()),
+        db.intimacy.find(in_month, {"_id": 0, "id": 1, "date": 1, "quality_rating": 1}).sort("date", 1).to_list(None),
+        db.mood_entries.find(
+            in_month, {"_id": 0, "user_id": 1, "date": 1, "mood": 1, "energy": 1, "stress": 1, "libido": 1}
+        ).sort("date", 1).to_list(None),
+        db.special_dates.find(in_month, {"_id": 0, "id": 1, "date": 1, "title": 1, "time": 1}).sort("date", 1).to_list(None),
+    )
+    return conditional_json(request, month_payload(month, calendar, intimacy, moods, special_dates))
+
+# ================= CALENDAR FEED (ICS) =================
+# Rendered feeds per couple; dropped on special-date and cycle writes
+feed_cache = FeedCache()
+
+@api_router.get("/calendar/{couple_code}.ics")
+async def get_calendar_feed(couple_code: str, request: Request):
+    """Subscription feed (text/calendar) of special dates and predicted periods"""
+    today = datetime.utcnow().date()
+    feed = feed_cache.get(couple_code, today)
+    if feed is None:
+        (_, cycle), dates = await asyncio.gather(
+            _couple_cycle({"couple_code": couple_code}),
+            db.special_dates.find(
+                {"couple_code": couple_code},
+                {"_id": 0, "id": 1, "date": 1, "time": 1, "title": 1, "notes": 1, "created_at": 1}
+            ).sort("date", 1).to_list(None),
+        )
+        params = make_cycle(cycle["last_period_date"], cycle["cycle_length"], cycle["period_length"]) if cycle else None
+        body = render_feed(couple_code, dates, predicted_periods(params, today.toordinal()), cycle.get("updated_at") if cycle else None)
+        feed = feed_cache.put(couple_code, today, body)
+    return conditional_body(request, feed.body, "text/calendar; charset=utf-8", feed.etag, feed.last_modified)
 
 # ================= CYCLE HISTORY (Track actual periods) =================
 
 @api_router.post("/cycle/start-period")
 async def start_new_period(input: CycleHistoryCreate):
     """Mark the start of a new period - updates predictions based on actual data"""
-    user = await db.users.find_one({"id": input.user_id})
+    user = await cached_user(input.user_id)
     couple_code = user.get("couple_code") if user else None
     
-    # Get current cycle settings
-    current_cycle = await db.cycle_data.find_one({"user_id": input.user_id})
-    if not current_cycle:
-        # If no cycle data, try couple_code
-        if couple_code:
-            current_cycle = await db.cycle_data.find_one({"couple_code": couple_code})
-    
-    # Get last period from history
-    last_history = await db.cycle_history.find_one(
-        {"user_id": input.user_id},
-        sort=[("period_start_date", -1)]
+    # Current cycle settings (the user's own or the partner's) and the statistics, read together.
+    # The statistics are loaded before the new entry is stored, so a first-time backfill doesn't count it twice
+    current_cycle, cycle_stats = await asyncio.gather(
+        find_tracked_cycle(input.user_id),
+        load_cycle_stats(input.user_id),
     )
     
+    # Last period start, kept in the statistics document
+    last_start = cycle_stats["last_start"] = await last_period_start(input.user_id, cycle_stats)
+    
     # Calculate actual cycle length
     actual_cycle_length = None
     was_early = None
     days_difference = None
     
-    if last_history:
-        last_period_date = datetime.strptime(last_history["period_start_date"], "%Y-%m-%d")
+    if last_start:
+        last_period_date = datetime.strptime(last_start, "%Y-%m-%d")
         new_period_date = datetime.strptime(input.period_start_date, "%Y-%m-%d")
         actual_cycle_length = (new_period_date - last_period_date).days
         
@@ -733,19 +1172,11 @@ async def start_new_period(input: CycleHistoryCreate):
         days_difference=days_difference
     )
     await db.cycle_history.insert_one(history_entry.dict())
+    cycle_stats = await record_period_start(input.user_id, cycle_stats, input.period_start_date, actual_cycle_length)
     
-    # Update cycle data with new last_period_date and optionally adjust cycle length
+    # Update cycle data with new last_period_date and the adaptive cycle length
     if current_cycle:
-        # Calculate average cycle length from history
-        all_history = await db.cycle_history.find(
-            {"user_id": input.user_id, "cycle_length": {"$ne": None}}
-        ).to_list(12)  # Last 12 cycles
-        
-        if len(all_history) >= 3:
-            avg_cycle_length = sum(h["cycle_length"] for h in all_history) / len(all_history)
-            avg_cycle_length = round(avg_cycle_length)
-        else:
-            avg_cycle_length = current_cycle["cycle_length"]
+        avg_cycle_length = predicted_length(cycle_stats, current_cycle["cycle_length"])
         
         # Update cycle data
         await db.cycle_data.update_one(
@@ -766,13 +1197,20 @@ async def start_new_period(input: CycleHistoryCreate):
             period_length=5
         )
         await db.cycle_data.insert_one(new_cycle.dict())
+        await link_couple_cycle(couple_code, input.user_id, new_cycle.dict())
+    await invalidate_cycle_results(input.user_id, couple_code, user.get("partner_id") if user else None)
     
     return {
         "message": "Nuovo ciclo registrato!",
         "actual_cycle_length": actual_cycle_length,
         "was_early": was_early,
         "days_difference": abs(days_difference) if days_difference else None,
-        "history_id": history_entry.id
+        "history_id": history_entry.id,
+        "prediction": predict_next_period(
+            cycle_stats,
+            datetime.strptime(input.period_start_date, "%Y-%m-%d").date(),
+            current_cycle["cycle_length"] if current_cycle else 28
+        )
     }
 
 @api_router.get("/cycle/history/{user_id}")
@@ -789,52 +1227,36 @@ async def get_cycle_history(user_id: str):
                 {"couple_code": user["couple_code"]}
             ).sort("period_start_date", -1).to_list(24)
     
-    # Calculate statistics
-    cycles_with_length = [h for h in history if h.get("cycle_length")]
-    
-    stats = {
-        "total_tracked": len(history),
-        "average_cycle_length": None,
-        "shortest_cycle": None,
-        "longest_cycle": None,
-        "regularity": "unknown"
-    }
-    
-    if cycles_with_length:
-        lengths = [h["cycle_length"] for h in cycles_with_length]
-        stats["average_cycle_length"] = round(sum(lengths) / len(lengths), 1)
-        stats["shortest_cycle"] = min(lengths)
-        stats["longest_cycle"] = max(lengths)
-        
-        # Calculate regularity (standard deviation)
-        if len(lengths) >= 3:
-            mean = sum(lengths) / len(lengths)
-            variance = sum((x - mean) ** 2 for x in lengths) / len(lengths)
-            std_dev = variance ** 0.5
-            
-            if std_dev <= 2:
-                stats["regularity"] = "molto regolare"
-            elif std_dev <= 4:
-                stats["regularity"] = "regolare"
-            elif std_dev <= 7:
-                stats["regularity"] = "variabile"
-            else:
-                stats["regularity"] = "irregolare"
+    # Statistics are maintained by start-period, not recomputed from the history
+    owner_id = history[0]["user_id"] if history else user_id
+    cycle_stats = await load_cycle_stats(owner_id)
+    stats = {"total_tracked": len(history), **cycle_summary(cycle_stats)}
+    
+    prediction = None
+    if history:
+        params = await load_user_cycle(user_id)
+        prediction = predict_next_period(
+            cycle_stats,
+            datetime.strptime(history[0]["period_start_date"], "%Y-%m-%d").date(),
+            params.length if params else 28
+        )
     
     return {
         "history": [CycleHistory(**h) for h in history],
-        "stats": stats
+        "stats": stats,
+        "prediction": prediction
     }
 
 @api_router.put("/cycle/end-period/{history_id}")
 async def end_period(history_id: str, end_date: str):
     """Mark the end of a period"""
-    result = await db.cycle_history.update_one(
+    entry = await db.cycle_history.find_one_and_update(
         {"id": history_id},
         {"$set": {"period_end_date": end_date}}
     )
-    if result.modified_count == 0:
+    if entry is None:
         raise HTTPException(status_code=404, detail="History entry not found")
+    await invalidate_cycle_results(entry["user_id"], entry.get("couple_code"))
     return {"message": "Fine ciclo registrata"}
 
 # Intimacy Routes
@@ -842,6 +1264,9 @@ async def end_period(history_id: str, end_date: str):
 async def log_intimacy(input: IntimacyEntryCreate):
     entry_obj = IntimacyEntry(**input.dict())
     await db.intimacy.insert_one(entry_obj.dict())
+    await bump_daily_rollup(entry_obj.couple_code, entry_obj.date, intimacy_rollup_inc(entry_obj.dict()))
+    await evaluate_couple_badges(entry_obj.couple_code)
+    result_cache.invalidate(entry_obj.couple_code)
     return entry_obj
 
 @api_router.get("/intimacy/{couple_code}", response_model=List[IntimacyEntry])
@@ -851,14 +1276,52 @@ async def get_intimacy_entries(couple_code: str):
 
 @api_router.delete("/intimacy/{entry_id}")
 async def delete_intimacy_entry(entry_id: str):
-    result = await db.intimacy.delete_one({"id": entry_id})
-    if result.deleted_count == 0:
+    entry = await db.intimacy.find_one_and_delete({"id": entry_id})
+    if entry is None:
         raise HTTPException(status_code=404, detail="Entry not found")
+    await bump_daily_rollup(entry["couple_code"], entry["date"], intimacy_rollup_inc(entry, -1))
+    # Removing a low-rated entry can raise the average past a badge threshold
+    await evaluate_couple_badges(entry["couple_code"])
+    result_cache.invalidate(entry["couple_code"])
     return {"message": "Deleted successfully"}
 
+@api_router.get("/intimacy/timeseries/{couple_code}")
+async def get_intimacy_timeseries(
+    couple_code: str,
+    bucket: str = "day",
+    from_: Optional[str] = Query(None, alias="from"),
+    to: Optional[str] = None
+):
+    """Counts, average quality and total duration per day/week/month, as parallel arrays"""
+    try:
+        start, end = resolve_range(bucket, from_, to, datetime.utcnow().date())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    key = {"day": "$date", "week": "$week", "month": {"$substrBytes": ["$date", 0, 7]}}[bucket]
+    groups = await db.daily_rollups.aggregate([
+        {"$match": {
+            "couple_code": couple_code,
+            "date": {"$gte": start, "$lte": end},
+            "intimacy_count": {"$gt": 0}
+        }},
+        {"$group": {
+            "_id": key,
+            "count": {"$sum": "$intimacy_count"},
+            "quality_sum": {"$sum": "$quality_sum"},
+            "duration_sum": {"$sum": "$duration_sum"}
+        }}
+    ]).to_list(None)
+    rows = [(g["_id"], g["count"], g["quality_sum"], g["duration_sum"]) for g in groups]
+    return build_series(bucket, start, end, rows)
+
 @api_router.get("/intimacy/stats/{couple_code}")
+@cached_until_write("intimacy_stats")
 async def get_intimacy_stats(couple_code: str):
-    entries = await db.intimacy.find({"couple_code": couple_code}).to_list(1000)
+    entries = await db.intimacy.find(
+        {"couple_code": couple_code},
+        {"_id": 0, "date": 1, "quality_rating": 1, "duration_minutes": 1, "location": 1}
+    ).to_list(None)
     
     if not entries:
         return {
@@ -868,8 +1331,10 @@ async def get_intimacy_stats(couple_code: str):
             "average_quality": 0,
             "sessometro_level": "Nuova Coppia",
             "sessometro_score": 0,
+            "sessometro_percentile": None,
             "streak": 0,
             "best_streak": 0,
+            "consecutive_days": 0,
             "favorite_day": None,
             "hottest_week": None,
             "passion_trend": "stable",
@@ -881,75 +1346,37 @@ async def get_intimacy_stats(couple_code: str):
                 "romance_vs_passion": "balanced"
             },
             "badges": [],
+            "badges_unlocked_at": {},
             "next_milestone": "Prima volta insieme"
         }
     
     from datetime import timedelta
-    from collections import Counter
     
     now = datetime.utcnow()
-    month_ago = now - timedelta(days=30)
-    week_ago = now - timedelta(days=7)
-    two_months_ago = now - timedelta(days=60)
-    
-    # Basic counts
-    monthly_entries = [e for e in entries if datetime.strptime(e["date"], "%Y-%m-%d") >= month_ago]
-    weekly_entries = [e for e in entries if datetime.strptime(e["date"], "%Y-%m-%d") >= week_ago]
-    prev_month_entries = [e for e in entries if two_months_ago <= datetime.strptime(e["date"], "%Y-%m-%d") < month_ago]
-    
-    monthly_count = len(monthly_entries)
-    weekly_count = len(weekly_entries)
-    prev_month_count = len(prev_month_entries)
-    
-    avg_quality = sum(e["quality_rating"] for e in entries) / len(entries)
-    monthly_avg_quality = sum(e["quality_rating"] for e in monthly_entries) / len(monthly_entries) if monthly_entries else 0
-    
-    # Calculate streak (consecutive weeks with activity)
-    sorted_entries = sorted(entries, key=lambda x: x["date"], reverse=True)
-    dates = [datetime.strptime(e["date"], "%Y-%m-%d") for e in sorted_entries]
-    
-    streak = 0
-    best_streak = 0
-    current_streak = 0
-    
-    # Weekly streak calculation
-    if dates:
-        current_week = now.isocalendar()[1]
-        current_year = now.year
-        weeks_with_activity = set()
-        for d in dates:
-            weeks_with_activity.add((d.year, d.isocalendar()[1]))
-        
-        # Check consecutive weeks
-        for i in range(52):  # Check last year
-            week_to_check = current_week - i
-            year_to_check = current_year
-            if week_to_check <= 0:
-                week_to_check += 52
-                year_to_check -= 1
-            if (year_to_check, week_to_check) in weeks_with_activity:
-                current_streak += 1
-            else:
-                if current_streak > best_streak:
-                    best_streak = current_streak
-                if i < 2:  # Allow one week gap for current streak
-                    continue
-                break
-        streak = current_streak
-        if current_streak > best_streak:
-            best_streak = current_streak
+    metrics = compute_intimacy_metrics(arrays_from_entries(entries), now.date())
+    # A day counts as inside a window when it is strictly after the window's start day
+    month_ago = (now - timedelta(days=30)).strftime("%Y-%m-%d")
+    week_ago = (now - timedelta(days=7)).strftime("%Y-%m-%d")
+    two_months_ago = (now - timedelta(days=60)).strftime("%Y-%m-%d")
     
-    # Favorite day of week
-    day_counts = Counter()
-    for e in entries:
-        day = datetime.strptime(e["date"], "%Y-%m-%d").strftime("%A")
-        day_counts[day] += 1
+    # Basic counts, from the last 60 daily rollups
+    rollup_days = [d for d in await get_rollup_days(couple_code, two_months_ago) if d.get("intimacy_count", 0) > 0]
+    monthly_days = [d for d in rollup_days if d["date"] > month_ago]
+    monthly = sum_rollups(monthly_days)
     
-    day_names_it = {
-        "Monday": "Lunedì", "Tuesday": "Martedì", "Wednesday": "Mercoledì",
-        "Thursday": "Giovedì", "Friday": "Venerdì", "Saturday": "Sabato", "Sunday": "Domenica"
-    }
-    favorite_day = day_names_it.get(day_counts.most_common(1)[0][0]) if day_counts else None
+    monthly_count = monthly["intimacy_count"]
+    weekly_count = sum_rollups([d for d in monthly_days if d["date"] > week_ago])["intimacy_count"]
+    prev_month_count = sum_rollups([d for d in rollup_days if d["date"] <= month_ago])["intimacy_count"]
+    
+    avg_quality = metrics["average_quality"]
+    monthly_avg_quality = monthly["quality_sum"] / monthly_count if monthly_count else 0
+    
+    # Streak (consecutive weeks with activity, the current one may end last week)
+    streak = metrics["streak"]
+    best_streak = metrics["best_streak"]
+    
+    # Favorite day of week
+    favorite_day = WEEKDAY_NAMES_IT[metrics["favorite_weekday"]]
     
     # Passion trend
     if prev_month_count > 0:
@@ -973,8 +1400,8 @@ async def get_intimacy_stats(couple_code: str):
     mood_boost = min(100, int((monthly_count * 5) + (avg_quality * 10)))
     
     # Spontaneity score (variety in days of week)
-    unique_days = len(set(datetime.strptime(e["date"], "%Y-%m-%d").weekday() for e in monthly_entries))
-    spontaneity = int((unique_days / 7) * 100) if monthly_entries else 0
+    unique_days = len(set(datetime.strptime(d["date"], "%Y-%m-%d").weekday() for d in monthly_days))
+    spontaneity = int((unique_days / 7) * 100) if monthly_days else 0
     
     # Romance vs Passion (based on quality vs frequency)
     if monthly_count > 8 and monthly_avg_quality < 3.5:
@@ -1001,6 +1428,7 @@ async def get_intimacy_stats(couple_code: str):
         trend_score * 0.15 +
         variety_score * 0.10
     )
+    percentile = await record_couple_score(couple_code, round(sessometro_score, 1))
     
     # More fun levels
     if sessometro_score >= 9:
@@ -1028,43 +1456,8 @@ async def get_intimacy_stats(couple_code: str):
         level = "Nuova Coppia"
         level_emoji = "🌱"
     
-    # Badges system - return IDs that match frontend
-    badges = []
-    
-    # First time badge - if at least 1 entry
-    if len(entries) >= 1:
-        badges.append("first_time")
-    
-    # Week streak - 7+ days consecutive (simplified: check if streak >= 1)
-    if streak >= 1:
-        badges.append("week_streak")
-    
-    # Quality king - average quality > 4
-    if avg_quality > 4:
-        badges.append("quality_king")
-    
-    # Explorer - 5+ different locations (check unique locations)
-    unique_locations = set(e.get("location") for e in entries if e.get("location"))
-    if len(unique_locations) >= 5:
-        badges.append("explorer")
-    
-    # Marathon - any session 60+ minutes
-    has_marathon = any((e.get("duration_minutes") or 0) >= 60 for e in entries)
-    if has_marathon:
-        badges.append("marathon")
-    
-    # Morning person - any entry with morning time
-    # For simplicity, check if entries exist in early dates (we don't have time data)
-    if len(entries) >= 5:  # Simplified: unlock after 5 entries
-        badges.append("morning")
-    
-    # Night owl - simplified: unlock after 8 entries
-    if len(entries) >= 8:
-        badges.append("night_owl")
-    
-    # Perfect month - 20+ in a month
-    if monthly_count >= 20:
-        badges.append("perfect_month")
+    # Badges are unlocked on write, reading them is a lookup
+    unlocked = await get_couple_badges(couple_code, has_entries=True)
     
     # Next milestone
     total = len(entries)
@@ -1085,8 +1478,10 @@ async def get_intimacy_stats(couple_code: str):
         "sessometro_level": level,
         "sessometro_level_emoji": level_emoji,
         "sessometro_score": round(sessometro_score, 1),
+        "sessometro_percentile": percentile,
         "streak": streak,
         "best_streak": best_streak,
+        "consecutive_days": metrics["consecutive_days"],
         "favorite_day": favorite_day,
         "passion_trend": passion_trend,
         "fun_stats": {
@@ -1096,7 +1491,8 @@ async def get_intimacy_stats(couple_code: str):
             "spontaneity_score": spontaneity,
             "romance_vs_passion": romance_vs_passion
         },
-        "badges": badges,
+        "badges": sort_badges(unlocked),
+        "badges_unlocked_at": {b: at.isoformat() for b, at in unlocked.items()},
         "next_milestone": next_milestone,
         "score_breakdown": {
             "frequency": round(frequency_score, 1),
@@ -1109,12 +1505,16 @@ async def get_intimacy_stats(couple_code: str):
 
 # Challenges Routes
 @api_router.get("/challenges/suggestions")
-async def get_challenge_suggestions():
-    return {
-        "challenges": SPICY_CHALLENGES,
-        "positions": POSITION_SUGGESTIONS,
-        "quiz_questions": COMPATIBILITY_QUESTIONS
-    }
+async def get_challenge_suggestions(request: Request):
+    return catalog.response(request, "suggestions", suggestions_payload)
+
+@api_router.get("/positions")
+async def get_positions(request: Request):
+    return catalog.response(request, "positions")
+
+@api_router.get("/catalog/version")
+async def get_catalog_version():
+    return {"version": catalog.version}
 
 @api_router.post("/challenges", response_model=Challenge)
 async def add_challenge(input: ChallengeCreate):
@@ -1141,17 +1541,18 @@ async def complete_challenge(challenge_id: str):
 async def get_random_suggestion():
     suggestion_type = random.choice(["challenge", "position"])
     if suggestion_type == "challenge":
-        return {"type": "challenge", "data": random.choice(SPICY_CHALLENGES)}
+        return {"type": "challenge", "data": dict(random.choice(catalog["spicy_challenges"].items))}
     else:
-        return {"type": "position", "data": random.choice(POSITION_SUGGESTIONS)}
+        return {"type": "position", "data": dict(random.choice(catalog["positions"].items))}
 
 # ================= LOVE DICE =================
 @api_router.get("/love-dice/roll")
 async def roll_love_dice():
-    action = random.choice(LOVE_DICE_ACTIONS)
-    body_part = random.choice(LOVE_DICE_BODY_PARTS)
-    duration = random.choice(LOVE_DICE_DURATION)
-    scenario = random.choice(LOVE_DICE_SCENARIOS)
+    dice = catalog.current()
+    action = random.choice(dice["love_dice_actions"].items)
+    body_part = random.choice(dice["love_dice_body_parts"].items)
+    duration = random.choice(dice["love_dice_duration"].items)
+    scenario = random.choice(dice["love_dice_scenarios"].items)
     
     # 50% chance to include scenario
     include_scenario = random.random() > 0.5
@@ -1172,20 +1573,16 @@ async def roll_love_dice():
 # ================= WISHLIST =================
 @api_router.post("/wishlist", response_model=WishlistItem)
 async def add_wishlist_item(input: WishlistItemCreate):
-    # Check if partner already has this wish
-    user = await db.users.find_one({"id": input.user_id})
+    # Check if partner already has this wish, unlocking it in the same round trip
+    user = await cached_user(input.user_id)
     if user and user.get("partner_id"):
-        partner_wish = await db.wishlist.find_one({
-            "couple_code": input.couple_code,
-            "user_id": user["partner_id"],
-            "item_id": input.item_id
-        })
+        partner_wish = await db.wishlist.find_one_and_update(
+            {"couple_code": input.couple_code, "user_id": user["partner_id"], "item_id": input.item_id},
+            {"$set": {"both_want": True}},
+            projection={"_id": 1}
+        )
         if partner_wish:
-            # Both want it! Unlock both
-            await db.wishlist.update_one(
-                {"id": partner_wish["id"]},
-                {"$set": {"both_want": True}}
-            )
+            # Both want it!
             item = WishlistItem(**input.dict(), both_want=True)
         else:
             item = WishlistItem(**input.dict())
@@ -1197,56 +1594,45 @@ async def add_wishlist_item(input: WishlistItemCreate):
 
 @api_router.post("/wishlist/toggle")
 async def toggle_wishlist_item(couple_code: str, user_id: str, item_id: str):
-    """Toggle a wishlist item - add if not exists, remove if exists"""
-    # Check if user already has this wish
-    existing = await db.wishlist.find_one({
-        "couple_code": couple_code,
-        "user_id": user_id,
-        "item_id": item_id
-    })
-    
-    if existing:
-        # Remove it
-        await db.wishlist.delete_one({"id": existing["id"]})
-        # Also unset both_want on partner's wish if exists
-        user = await db.users.find_one({"id": user_id})
-        if user and user.get("partner_id"):
-            await db.wishlist.update_one(
-                {"couple_code": couple_code, "user_id": user["partner_id"], "item_id": item_id},
-                {"$set": {"both_want": False}}
-            )
-        return {"action": "removed", "unlocked": False}
+    """Toggle a wishlist item - add if not exists, remove if exists.
+    
+    Removing takes one round trip, adding three (plus the cached user lookup).
+    """
+    user = await cached_user(user_id)
+    partner_id = user.get("partner_id") if user else None
+    own = {"couple_code": couple_code, "user_id": user_id, "item_id": item_id}
+    partner = {"couple_code": couple_code, "user_id": partner_id, "item_id": item_id}
+    
+    # Try to remove it; the partner's copy can't be "both want" without ours, so unset it in the same batch
+    if partner_id:
+        result = await db.wishlist.bulk_write([
+            DeleteOne(own),
+            UpdateOne(partner, {"$set": {"both_want": False}}),
+        ])
+        removed = result.deleted_count
     else:
-        # Add it
-        user = await db.users.find_one({"id": user_id})
-        both_want = False
-        
-        if user and user.get("partner_id"):
-            partner_wish = await db.wishlist.find_one({
-                "couple_code": couple_code,
-                "user_id": user["partner_id"],
-                "item_id": item_id
-            })
-            if partner_wish:
-                both_want = True
-                # Update partner's wish too
-                await db.wishlist.update_one(
-                    {"id": partner_wish["id"]},
-                    {"$set": {"both_want": True}}
-                )
-        
-        new_item = {
-            "id": str(uuid.uuid4()),
-            "couple_code": couple_code,
-            "user_id": user_id,
-            "item_id": item_id,
-            "title": item_id,  # Will be shown from frontend
-            "both_want": both_want,
-            "created_at": datetime.utcnow()
-        }
-        await db.wishlist.insert_one(new_item)
-        
-        return {"action": "added", "unlocked": both_want}
+        removed = (await db.wishlist.delete_one(own)).deleted_count
+    if removed:
+        return {"action": "removed", "unlocked": False}
+    
+    # Add it, unlocking the partner's copy if there is one
+    both_want = False
+    if partner_id:
+        partner_wish = await db.wishlist.find_one_and_update(
+            partner, {"$set": {"both_want": True}}, projection={"_id": 1}
+        )
+        both_want = partner_wish is not None
+    
+    new_item = {
+        "id": str(uuid.uuid4()),
+        "title": item_id,  # Will be shown from frontend
+        "both_want": both_want,
+        "created_at": datetime.utcnow()
+    }
+    # Upsert: a double tap can't store the wish twice
+    await db.wishlist.update_one(own, {"$setOnInsert": new_item}, upsert=True)
+    
+    return {"action": "added", "unlocked": both_want}
 
 @api_router.get("/wishlist/{couple_code}/{user_id}")
 async def get_wishlist(couple_code: str, user_id: str):
@@ -1305,15 +1691,13 @@ async def delete_wishlist_item(item_id: str):
 # ================= QUIZ COMPARATIVO =================
 @api_router.post("/quiz/answer")
 async def save_quiz_answer(input: QuizAnswerCreate):
-    # Remove existing answer for this question from this user
-    await db.quiz_answers.delete_many({
-        "couple_code": input.couple_code,
-        "user_id": input.user_id,
-        "question_id": input.question_id
-    })
-    
+    # Replace this user's answer to the question in one round trip
     answer = QuizAnswer(**input.dict())
-    await db.quiz_answers.insert_one(answer.dict())
+    await db.quiz_answers.replace_one(
+        {"couple_code": input.couple_code, "user_id": input.user_id, "question_id": input.question_id},
+        answer.dict(),
+        upsert=True
+    )
     return answer
 
 @api_router.get("/quiz/results/{couple_code}")
@@ -1339,7 +1723,8 @@ async def get_quiz_results(couple_code: str):
     user2_answers = {a["question_id"]: a["answer_index"] for a in answers if a["user_id"] == user2_id}
     
     # Check if both completed all questions
-    total_questions = len(COMPATIBILITY_QUESTIONS)
+    questions = catalog["quiz_questions"].items
+    total_questions = len(questions)
     if len(user1_answers) < total_questions or len(user2_answers) < total_questions:
         return {
             "complete": False,
@@ -1352,7 +1737,7 @@ async def get_quiz_results(couple_code: str):
     matches = 0
     comparisons = []
     
-    for q in COMPATIBILITY_QUESTIONS:
+    for q in questions:
         q_id = q["id"]
         u1_answer = user1_answers.get(q_id, -1)
         u2_answer = user2_answers.get(q_id, -1)
@@ -1363,7 +1748,7 @@ async def get_quiz_results(couple_code: str):
         
         comparisons.append({
             "question": q["question"],
-            "options": q["options"],
+            "options": list(q["options"]),
             "user1_answer": q["options"][u1_answer] if 0 <= u1_answer < len(q["options"]) else "?",
             "user2_answer": q["options"][u2_answer] if 0 <= u2_answer < len(q["options"]) else "?",
             "user1_name": user1_name,
@@ -1397,6 +1782,7 @@ async def get_quiz_results(couple_code: str):
 async def create_special_date(input: SpecialDateCreate):
     date_obj = SpecialDate(**input.dict())
     await db.special_dates.insert_one(date_obj.dict())
+    feed_cache.invalidate(date_obj.couple_code)
     return date_obj
 
 @api_router.get("/special-dates/{couple_code}")
@@ -1429,7 +1815,9 @@ async def get_special_dates(couple_code: str):
 
 @api_router.delete("/special-dates/{date_id}")
 async def delete_special_date(date_id: str):
-    await db.special_dates.delete_one({"id": date_id})
+    deleted = await db.special_dates.find_one_and_delete({"id": date_id})
+    if deleted:
+        feed_cache.invalidate(deleted["couple_code"])
     return {"message": "Deleted"}
 
 # ================= WEEKLY CHALLENGE =================
@@ -1450,7 +1838,7 @@ async def get_weekly_challenge(couple_code: str):
         return WeeklyChallenge(**existing)
     
     # Generate new weekly challenge
-    challenge = random.choice(WEEKLY_CHALLENGES_POOL)
+    challenge = dict(random.choice(catalog["weekly_challenges"].items))
     weekly = WeeklyChallenge(
         couple_code=couple_code,
         week_number=week_number,
@@ -1479,18 +1867,13 @@ async def complete_weekly_challenge(couple_code: str):
 
 # ================= FERTILITY PREDICTIONS FOR HOME =================
 @api_router.get("/fertility/predictions/{user_id}")
+@cached_until_write("fertility_predictions", scope="user_id")
 async def get_fertility_predictions(user_id: str):
     """Get fertility predictions for display on home screen"""
-    # Get cycle data
-    cycle = await db.cycle_data.find_one({"user_id": user_id})
+    # The user's own cycle, or the partner's
+    params = await load_user_cycle(user_id)
     
-    if not cycle:
-        # Try partner's cycle
-        user = await db.users.find_one({"id": user_id})
-        if user and user.get("couple_code"):
-            cycle = await db.cycle_data.find_one({"couple_code": user["couple_code"]})
-    
-    if not cycle:
+    if params is None:
         return {
             "has_data": False,
             "today_status": None,
@@ -1500,34 +1883,17 @@ async def get_fertility_predictions(user_id: str):
             "fertility_tip": "Configura il ciclo per vedere le previsioni"
         }
     
-    from datetime import timedelta
-    
-    last_period = datetime.strptime(cycle["last_period_date"], "%Y-%m-%d")
-    cycle_length = cycle["cycle_length"]
-    period_length = cycle["period_length"]
-    today = datetime.utcnow().date()
-    
-    # Calculate current and next cycles
-    current_cycle_start = last_period
-    while (current_cycle_start + timedelta(days=cycle_length)).date() <= today:
-        current_cycle_start += timedelta(days=cycle_length)
-    
-    next_period = current_cycle_start + timedelta(days=cycle_length)
-    ovulation_date = current_cycle_start + timedelta(days=cycle_length - 14)
-    fertile_start = ovulation_date - timedelta(days=5)
-    fertile_end = ovulation_date + timedelta(days=1)
-    period_end = current_cycle_start + timedelta(days=period_length - 1)
+    today = datetime.utcnow().date().toordinal()
+    window = current_windows(params, today)
     
     # Determine today's status
-    today_dt = datetime.combine(today, datetime.min.time())
-    
-    if current_cycle_start.date() <= today <= period_end.date():
+    if window.start <= today <= window.period_end:
         status = "period"
         status_text = "Ciclo mestruale"
         status_color = "#ff4757"
         tip = "Riposo e cura di te. Momenti di intimità possono aiutare con i crampi!"
-    elif fertile_start.date() <= today <= fertile_end.date():
-        if today == ovulation_date.date():
+    elif window.fertile_start <= today <= window.fertile_end:
+        if today == window.ovulation:
             status = "ovulation"
             status_text = "Ovulazione - Massima fertilità!"
             status_color = "#ffa502"
@@ -1543,9 +1909,9 @@ async def get_fertility_predictions(user_id: str):
         status_color = "#1e90ff"
         tip = "Bassa probabilità di concepimento. Momento ideale per intimità senza pensieri!"
     
-    days_to_ovulation = (ovulation_date.date() - today).days
-    days_to_period = (next_period.date() - today).days
-    days_to_fertile = (fertile_start.date() - today).days
+    days_to_ovulation = window.ovulation - today
+    days_to_period = window.next_start - today
+    days_to_fertile = window.fertile_start - today
     
     return {
         "has_data": True,
@@ -1553,27 +1919,37 @@ async def get_fertility_predictions(user_id: str):
         "today_status_text": status_text,
         "today_status_color": status_color,
         "fertility_tip": tip,
-        "next_period": next_period.strftime("%Y-%m-%d"),
+        "next_period": iso(window.next_start),
         "days_to_period": max(0, days_to_period),
-        "next_ovulation": ovulation_date.strftime("%Y-%m-%d"),
+        "next_ovulation": iso(window.ovulation),
         "days_to_ovulation": days_to_ovulation,
-        "next_fertile_start": fertile_start.strftime("%Y-%m-%d") if days_to_fertile > 0 else None,
+        "next_fertile_start": iso(window.fertile_start) if days_to_fertile > 0 else None,
         "days_to_fertile": max(0, days_to_fertile) if days_to_fertile > 0 else 0,
         "is_trying_to_conceive_day": status in ["fertile", "ovulation"]
     }
 
 # ================= MOOD TRACKER =================
 
+# Today's moods per couple, kept current by log_mood (see today_snapshot.py)
+mood_snapshot = MoodSnapshot()
+
 @api_router.post("/mood", response_model=MoodEntry)
 async def log_mood(input: MoodEntryCreate):
-    # Remove existing mood for this date
-    await db.mood_entries.delete_many({
-        "user_id": input.user_id,
-        "date": input.date
-    })
-    
+    # Replace the mood for this date, getting the previous one back for the rollup (one round trip)
     entry = MoodEntry(**input.dict())
-    await db.mood_entries.insert_one(entry.dict())
+    previous = await db.mood_entries.find_one_and_replace(
+        {"user_id": input.user_id, "date": input.date},
+        entry.dict(),
+        upsert=True
+    )
+    
+    inc = mood_rollup_inc(entry.dict())
+    if previous:
+        for field, value in mood_rollup_inc(previous, -1).items():
+            inc[field] += value
+    await bump_daily_rollup(entry.couple_code, entry.date, inc)
+    result_cache.invalidate(entry.couple_code)
+    mood_snapshot.record(entry.couple_code, entry.date, entry.dict())
     return entry
 
 @api_router.get("/mood/{couple_code}")
@@ -1590,29 +1966,36 @@ async def get_mood_entries(couple_code: str, days: int = 30):
     return [MoodEntry(**e) for e in entries]
 
 @api_router.get("/mood/today/{couple_code}")
-async def get_today_mood(couple_code: str):
-    """Get today's mood for both partners"""
-    today = datetime.utcnow().strftime("%Y-%m-%d")
-    entries = await db.mood_entries.find({
-        "couple_code": couple_code,
-        "date": today
-    }).to_list(2)
+async def get_today_mood(couple_code: str, tz: Optional[str] = None):
+    """Get today's mood for both partners (today in the IANA timezone `tz`, UTC without it)"""
+    try:
+        today = local_today(tz, lambda: datetime.utcnow().date()).isoformat()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    entries = mood_snapshot.get(couple_code, today)
+    if entries is None:
+        generation = mood_snapshot.generation
+        entries = await db.mood_entries.find({
+            "couple_code": couple_code,
+            "date": today
+        }, {"_id": 0}).to_list(2)
+        mood_snapshot.fill(couple_code, today, entries, generation)
     
     return [MoodEntry(**e) for e in entries]
 
 @api_router.get("/mood/stats/{couple_code}")
+@cached_until_write("mood_stats")
 async def get_mood_stats(couple_code: str):
     """Get mood statistics for couple"""
     from datetime import timedelta
     
-    # Last 30 days
-    cutoff_date = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d")
-    entries = await db.mood_entries.find({
-        "couple_code": couple_code,
-        "date": {"$gte": cutoff_date}
-    }).to_list(200)
+    # Last 30 days (rollup windows exclude their start day)
+    window_start = (datetime.utcnow() - timedelta(days=31)).strftime("%Y-%m-%d")
+    mood_days = [d for d in await get_rollup_days(couple_code, window_start) if d.get("mood_count", 0) > 0]
+    totals = sum_rollups(mood_days)
+    entries_count = totals["mood_count"]
     
-    if not entries:
+    if not entries_count:
         return {
             "avg_mood": 0,
             "avg_energy": 0,
@@ -1624,37 +2007,36 @@ async def get_mood_stats(couple_code: str):
         }
     
     # Calculate averages
-    avg_mood = sum(e["mood"] for e in entries) / len(entries)
-    avg_energy = sum(e["energy"] for e in entries) / len(entries)
-    avg_stress = sum(e["stress"] for e in entries) / len(entries)
-    avg_libido = sum(e["libido"] for e in entries) / len(entries)
+    avg_mood = totals["mood_sum"] / entries_count
+    avg_energy = totals["energy_sum"] / entries_count
+    avg_stress = totals["stress_sum"] / entries_count
+    avg_libido = totals["libido_sum"] / entries_count
+    
+    # Calculate sync score (how similar partners' moods are) on days both logged
+    both_days = [d["date"] for d in mood_days if d["mood_count"] == 2]
+    entries = await db.mood_entries.find(
+        {"couple_code": couple_code, "date": {"$in": both_days}},
+        {"date": 1, "mood": 1}
+    ).to_list(len(both_days) * 2)
     
-    # Calculate sync score (how similar partners' moods are)
-    sync_scores = []
     dates_with_both = {}
     for e in entries:
-        date = e["date"]
-        if date not in dates_with_both:
-            dates_with_both[date] = []
-        dates_with_both[date].append(e)
-    
-    for date, day_entries in dates_with_both.items():
-        if len(day_entries) == 2:
-            diff = abs(day_entries[0]["mood"] - day_entries[1]["mood"])
+        dates_with_both.setdefault(e["date"], []).append(e["mood"])
+    
+    sync_scores = []
+    for date, day_moods in dates_with_both.items():
+        if len(day_moods) == 2:
+            diff = abs(day_moods[0] - day_moods[1])
             sync_scores.append(1 - (diff / 4))  # 0-1 score
     
     sync_score = sum(sync_scores) / len(sync_scores) * 100 if sync_scores else 0
     
     # Find best day
-    from collections import Counter
-    day_counts = Counter()
-    day_moods = {}
-    for e in entries:
-        day = datetime.strptime(e["date"], "%Y-%m-%d").strftime("%A")
-        day_counts[day] += 1
-        if day not in day_moods:
-            day_moods[day] = []
-        day_moods[day].append(e["mood"])
+    weekday_sums = {}
+    for d in mood_days:
+        day = datetime.strptime(d["date"], "%Y-%m-%d").strftime("%A")
+        total, count = weekday_sums.get(day, (0, 0))
+        weekday_sums[day] = (total + d["mood_sum"], count + d["mood_count"])
     
     best_day = None
     best_avg = 0
@@ -1662,8 +2044,8 @@ async def get_mood_stats(couple_code: str):
         "Monday": "Lunedì", "Tuesday": "Martedì", "Wednesday": "Mercoledì",
         "Thursday": "Giovedì", "Friday": "Venerdì", "Saturday": "Sabato", "Sunday": "Domenica"
     }
-    for day, moods in day_moods.items():
-        avg = sum(moods) / len(moods)
+    for day, (total, count) in weekday_sums.items():
+        avg = total / count
         if avg > best_avg:
             best_avg = avg
             best_day = day_names_it.get(day, day)
@@ -1675,46 +2057,140 @@ async def get_mood_stats(couple_code: str):
         "avg_libido": round(avg_libido, 1),
         "sync_score": round(sync_score, 0),
         "best_day": best_day,
-        "entries_count": len(entries)
+        "entries_count": entries_count
+    }
+
+def mood_analytics_pipeline(couple_code: str, lookback: str, start: str, end: str) -> list:
+    """One row per logged day with the window columns described in mood_analytics.py"""
+    recent_from, prior_from = trend_bounds(end)
+    
+    def in_period(field):
+        return {"$multiply": ["$in_period", f"${field}"]}
+    
+    rolling = {}
+    for w in MOOD_WINDOWS:
+        trailing = {"range": [-(w - 1), 0]}
+        rolling[f"n_{w}d"] = {"$sum": "$n", "window": trailing}
+        for m in MOOD_METRICS:
+            rolling[f"{m}_{w}d"] = {"$sum": f"${m}_sum", "window": trailing}
+    # Without a "window", an operator spans its whole partition
+    period_totals = {
+        "total_n": {"$sum": in_period("n")},
+        "sync": {"$avg": "$sync_value"},
+        "sync_days": {"$sum": {"$cond": [{"$eq": ["$sync_value", None]}, 0, 1]}},
+        "recent_n": {"$sum": {"$multiply": ["$recent", "$n"]}},
+        "prior_n": {"$sum": {"$multiply": ["$prior", "$n"]}},
     }
+    for m in MOOD_METRICS:
+        period_totals[f"total_{m}"] = {"$sum": in_period(f"{m}_sum")}
+    for t in TREND_METRICS:
+        period_totals[f"recent_{t}"] = {"$sum": {"$multiply": ["$recent", f"${t}_sum"]}}
+        period_totals[f"prior_{t}"] = {"$sum": {"$multiply": ["$prior", f"${t}_sum"]}}
+    
+    return [
+        {"$match": {"couple_code": couple_code, "date": {"$gte": lookback, "$lte": end}}},
+        {"$group": {
+            "_id": "$date",
+            "n": {"$sum": 1},
+            **{f"{m}_sum": {"$sum": f"${m}"} for m in MOOD_METRICS},
+            "mood_max": {"$max": "$mood"},
+            "mood_min": {"$min": "$mood"},
+        }},
+        {"$set": {
+            "date": "$_id",
+            "day": {"$toInt": {"$divide": [
+                {"$toLong": {"$dateFromString": {"dateString": "$_id", "format": "%Y-%m-%d"}}}, 86400000
+            ]}},
+            "in_period": {"$cond": [{"$gte": ["$_id", start]}, 1, 0]},
+        }},
+        {"$set": {
+            "weekday": {"$mod": [{"$add": ["$day", 3]}, 7]},
+            "recent": {"$cond": [{"$gte": ["$day", recent_from]}, 1, 0]},
+            "prior": {"$cond": [{"$and": [{"$gte": ["$day", prior_from]}, {"$lt": ["$day", recent_from]}]}, 1, 0]},
+            "sync_value": {"$cond": [
+                {"$and": [{"$eq": ["$n", 2]}, {"$eq": ["$in_period", 1]}]},
+                {"$subtract": [1, {"$divide": [{"$subtract": ["$mood_max", "$mood_min"]}, SYNC_SCALE]}]},
+                None
+            ]},
+        }},
+        {"$setWindowFields": {"sortBy": {"day": 1}, "output": rolling}},
+        {"$setWindowFields": {"partitionBy": "$weekday", "output": {
+            "weekday_n": {"$sum": in_period("n")},
+            "weekday_mood_sum": {"$sum": in_period("mood_sum")},
+        }}},
+        {"$setWindowFields": {"output": period_totals}},
+        {"$sort": {"day": 1}},
+        {"$project": {"_id": 0, "mood_max": 0, "mood_min": 0, "in_period": 0, "recent": 0, "prior": 0, "sync_value": 0}},
+    ]
+
+@api_router.get("/mood/analytics/{couple_code}")
+async def get_mood_analytics(couple_code: str, days: int = MOOD_ANALYTICS_DAYS):
+    """Rolling 7/30-day averages, partner sync, weekday profile and stress/libido trends"""
+    try:
+        lookback, start, end = analytics_range(days, datetime.utcnow().date())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await db.mood_entries.aggregate(mood_analytics_pipeline(couple_code, lookback, start, end)).to_list(None)
+    return build_analytics(rows, start, end)
 
 # ================= LOVE NOTES =================
+# love_note_unread: {couple_code, user_id, unread}. A note is unread for every couple member
+# except its sender. Counters are created by the first read (exact count), after which send /
+# mark-read move them. Without a multi-document transaction a crash between the two writes can
+# leave a counter off by one; `reconcile-unread` recounts them.
+UNREAD_JOB = "reconcile-unread"
+
+note_inbox = NoteInbox()
+
+def unread_filter(couple_code: str, user_id: str) -> dict:
+    return {"couple_code": couple_code, "sender_id": {"$ne": user_id}, "is_read": False}
+
+async def bump_unread(couple_code: str, sender_id: str, delta: int):
+    """Move the counters of the note's recipients"""
+    match = {"couple_code": couple_code, "user_id": {"$ne": sender_id}}
+    if delta < 0:
+        match["unread"] = {"$gte": -delta}
+    await db.love_note_unread.update_many(match, {"$inc": {"unread": delta}})
+
+async def seed_unread(couple_code: str, user_id: str):
+    """Create user_id's counter from a count, if it has none yet"""
+    count = await db.love_notes.count_documents(unread_filter(couple_code, user_id))
+    await db.love_note_unread.update_one(
+        {"couple_code": couple_code, "user_id": user_id}, {"$setOnInsert": {"unread": count}}, upsert=True
+    )
 
-LOVE_NOTE_TEMPLATES = {
-    "sweet": [
-        "Sei la cosa più bella della mia giornata 💕",
-        "Non vedo l'ora di tornare a casa da te",
-        "Pensavo a te... come sempre",
-        "Mi manchi già, anche se ci siamo visti stamattina",
-        "Sei il mio pensiero preferito",
-    ],
-    "spicy": [
-        "Non riesco a smettere di pensare a ieri notte... 🔥",
-        "Ho delle idee per stasera...",
-        "Mi fai impazzire, lo sai?",
-        "Conto i minuti fino a stasera",
-        "Ho bisogno di te. Adesso.",
-    ],
-    "funny": [
-        "Se fossi un vegetale, saresti un carote-ino 🥕",
-        "Ti amo più della pizza. E sai quanto amo la pizza.",
-        "Sei la mia persona preferita da infastidire",
-        "Grazie per sopportare la mia follia",
-        "Reminder: sono figo/a e tu sei fortunato/a",
-    ],
-    "romantic": [
-        "In un universo infinito, ho trovato te ✨",
-        "Ogni giorno con te è un regalo",
-        "Sei il mio per sempre",
-        "Mi hai rubato il cuore e non lo rivoglio indietro",
-        "Con te, tutto ha senso",
-    ]
-}
+async def ensure_recipient_unread(couple_code: str, sender_id: str):
+    """Seed the counter of the note's recipient before the note is written or read.
+
+    A counter created after a note changed then counts it, and one created
+    before is moved by the write's bump, so there is no window where a note
+    is in neither.
+    """
+    sender = await cached_user(sender_id)
+    recipient_id = sender.get("partner_id") if sender else None
+    if recipient_id and not await db.love_note_unread.find_one(
+        {"couple_code": couple_code, "user_id": recipient_id}, {"_id": 1}
+    ):
+        await seed_unread(couple_code, recipient_id)
+
+async def reconcile_unread() -> int:
+    """Recount every unread counter from love_notes; returns how many had drifted"""
+    drifted = 0
+    async for counter in db.love_note_unread.find({}, {"_id": 0}):
+        key = {"couple_code": counter["couple_code"], "user_id": counter["user_id"]}
+        expected = await db.love_notes.count_documents(unread_filter(**key))
+        if expected != counter["unread"]:
+            await db.love_note_unread.update_one(key, {"$set": {"unread": expected}})
+            drifted += 1
+    return drifted
 
 @api_router.post("/love-notes", response_model=LoveNote)
 async def send_love_note(input: LoveNoteCreate):
     note = LoveNote(**input.dict())
+    await ensure_recipient_unread(note.couple_code, note.sender_id)
     await db.love_notes.insert_one(note.dict())
+    await bump_unread(note.couple_code, note.sender_id, 1)
+    await note_inbox.publish(note.couple_code, note.sender_id)
     return note
 
 @api_router.get("/love-notes/{couple_code}/{user_id}")
@@ -1727,28 +2203,58 @@ async def get_love_notes(couple_code: str, user_id: str):
     
     return [LoveNote(**n) for n in notes]
 
+async def latest_received_note(couple_code: str, user_id: str) -> str:
+    """Id of the newest note user_id received ("" if none), the long-poll cursor"""
+    notes = await db.love_notes.find(
+        {"couple_code": couple_code, "sender_id": {"$ne": user_id}}, {"_id": 0, "id": 1}
+    ).sort([("created_at", -1), ("id", -1)]).limit(1).to_list(1)
+    return notes[0]["id"] if notes else ""
+
+@api_router.get("/love-notes/{couple_code}/{user_id}/wait")
+async def wait_love_notes(couple_code: str, user_id: str, after: Optional[str] = None, timeout: float = MAX_WAIT_SECONDS):
+    """Long poll: answers when user_id receives a note past `after` or on timeout; reload the notes when changed"""
+    changed, cursor = await note_inbox.wait(
+        couple_code, user_id, after, lambda: latest_received_note(couple_code, user_id), timeout
+    )
+    return {"changed": changed, "cursor": cursor}
+
 @api_router.get("/love-notes/unread/{couple_code}/{user_id}")
 async def get_unread_notes(couple_code: str, user_id: str):
     """Get unread notes for user"""
-    notes = await db.love_notes.find({
-        "couple_code": couple_code,
-        "sender_id": {"$ne": user_id},
-        "is_read": False
-    }).sort("created_at", -1).to_list(50)
-    
-    return {"count": len(notes), "notes": [LoveNote(**n) for n in notes]}
+    # Keyed lookup; the count only runs the first time a user asks
+    key = {"couple_code": couple_code, "user_id": user_id}
+    counter = await db.love_note_unread.find_one(key, {"_id": 0, "unread": 1})
+    if counter is None:
+        # Sends and reads seed the counter before writing, so one created here
+        # can't miss a concurrent note; re-read it in case that happened
+        await seed_unread(couple_code, user_id)
+        counter = await db.love_note_unread.find_one(key, {"_id": 0, "unread": 1})
+    count = counter["unread"]
+    if not count:
+        return {"count": 0, "notes": []}
+    
+    notes = await db.love_notes.find(unread_filter(couple_code, user_id)).sort("created_at", -1).to_list(50)
+    return {"count": count, "notes": [LoveNote(**n) for n in notes]}
 
 @api_router.put("/love-notes/{note_id}/read")
 async def mark_note_read(note_id: str):
-    await db.love_notes.update_one(
-        {"id": note_id},
-        {"$set": {"is_read": True}}
+    note = await db.love_notes.find_one({"id": note_id, "is_read": False}, {"_id": 0, "couple_code": 1, "sender_id": 1})
+    if not note:
+        return {"message": "Note marked as read"}
+    await ensure_recipient_unread(note["couple_code"], note["sender_id"])
+    # Conditional, so a note read twice (or concurrently) is only counted down once
+    note = await db.love_notes.find_one_and_update(
+        {"id": note_id, "is_read": False},
+        {"$set": {"is_read": True}},
+        projection={"_id": 0, "couple_code": 1, "sender_id": 1}
     )
+    if note:
+        await bump_unread(note["couple_code"], note["sender_id"], -1)
     return {"message": "Note marked as read"}
 
 @api_router.get("/love-notes/templates")
-async def get_note_templates():
-    return LOVE_NOTE_TEMPLATES
+async def get_note_templates(request: Request):
+    return catalog.response(request, "love_note_templates")
 
 
 # ================= AI COACH =================
@@ -1885,6 +2391,7 @@ async def analyze_couple_data(request: AICoachAnalyzeRequest):
         }
 
 @api_router.get("/ai-coach/insights/{couple_code}")
+@cached_until_write("ai_insights")
 async def get_ai_insights(couple_code: str):
     """Get intelligent insights about the couple's relationship"""
     try:
@@ -2083,6 +2590,100 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Keys that upserts / compare-and-set writes rely on being unique: (collection, keys, which
+# duplicate to keep, documents covered). `dedupe-indexes` clears duplicates stored before the
+# index was unique; for mood_entries run `rebuild-rollups` afterwards, as the rollups counted them.
+UNIQUE_INDEXES = (
+    ("cycle_stats", ("user_id",), {"count": -1}, None),
+    # Catalog wishes only: free-form items added through POST /wishlist have no item_id
+    ("wishlist", ("couple_code", "user_id", "item_id"), {"both_want": -1, "_id": 1}, {"item_id": {"$exists": True}}),
+    ("mood_entries", ("user_id", "date"), {"_id": -1}, None),
+    ("quiz_answers", ("couple_code", "user_id", "question_id"), {"_id": -1}, None),
+)
+
+def unique_index_options(partial: Optional[dict]) -> dict:
+    return {"unique": True, "partialFilterExpression": partial} if partial else {"unique": True}
+
+async def drop_duplicates(collection, keys, keep: dict, partial: Optional[dict] = None) -> int:
+    """Delete all but the first document (in `keep` order) of every group sharing `keys`"""
+    removed = 0
+    groups = collection.aggregate([
+        {"$match": partial or {}},
+        {"$sort": keep},
+        {"$group": {"_id": {k: f"${k}" for k in keys}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    async for group in groups:
+        removed += (await collection.delete_many({"_id": {"$in": group["ids"][1:]}})).deleted_count
+    return removed
+
+async def dedupe_indexes() -> int:
+    """Remove duplicates on the UNIQUE_INDEXES keys and (re)build those indexes as unique"""
+    removed = 0
+    for name, keys, keep, partial in UNIQUE_INDEXES:
+        collection = getattr(db, name)
+        removed += await drop_duplicates(collection, keys, keep, partial)
+        spec = [(k, 1) for k in keys]
+        for index in (await collection.index_information()).values():
+            if list(index["key"]) == spec and not index.get("unique"):
+                await collection.drop_index(spec)
+        await collection.create_index(spec, **unique_index_options(partial))
+    return removed
+
+@app.on_event("startup")
+async def ensure_indexes():
+    await db.couples.create_index("couple_code", unique=True)
+    await db.couples.create_index("member_ids")
+    await db.cycle_data.create_index("id", unique=True)
+    # Month view range queries
+    for collection in (db.intimacy, db.mood_entries, db.special_dates):
+        await collection.create_index([("couple_code", 1), ("date", 1)])
+    # Single-document upserts / replaces of the write paths
+    for name, keys, _, partial in UNIQUE_INDEXES:
+        try:
+            await getattr(db, name).create_index([(k, 1) for k in keys], **unique_index_options(partial))
+        except OperationFailure as e:
+            # Existing duplicates, or the earlier non-unique index on the same keys
+            logger.warning("Unique index on %s %s not created (%s); run `python server_mongo_backup.py dedupe-indexes`",
+                           name, keys, e)
+    await db.love_note_unread.create_index([("couple_code", 1), ("user_id", 1)], unique=True)
+    # Received notes, newest first (list and long-poll cursor)
+    await db.love_notes.create_index([("couple_code", 1), ("created_at", -1)])
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
+
+async def run_command(argv: List[str]) -> bool:
+    """Maintenance commands: `python server_mongo_backup.py <command> [args]`"""
+    if not argv:
+        return False
+    command, args = argv[0], argv[1:]
+    if command == "rebuild-rollups":
+        count = await rebuild_daily_rollups(args[0] if args else None)
+        print(f"Rebuilt daily_rollups for {count} couple(s)")
+    elif command == "evaluate-badges":
+        codes = args or await db.intimacy.distinct("couple_code")
+        for code in codes:
+            await evaluate_couple_badges(code, ALL_AGGREGATES)
+        print(f"Evaluated badges for {len(codes)} couple(s)")
+    elif command == "backfill-couples":
+        count = await backfill_couples()
+        print(f"Linked cycles for {count} couple(s)")
+    elif command == "rebuild-score-histogram":
+        count = await rebuild_score_histogram()
+        print(f"Rebuilt score_histogram from {count} couple score(s)")
+    elif command == "dedupe-indexes":
+        count = await dedupe_indexes()
+        print(f"Removed {count} duplicate document(s), unique indexes in place")
+    elif command == UNREAD_JOB:
+        count = await reconcile_unread()
+        print(f"Reconciled unread counters, {count} had drifted")
+    else:
+        raise SystemExit(f"Unknown command: {command}")
+    return True
+
+if __name__ == "__main__":
+    if not asyncio.run(run_command(sys.argv[1:])):
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=8001)
@@ -0,0 +1,90 @@
+"""Activity streaks over day ordinals, shared by every stats endpoint.
+
+Days are `date.toordinal()` values and weeks are `(ordinal - 1) // 7`.
+Ordinal 1 (0001-01-01) is a Monday, so weeks start on Monday and
+consecutive weeks always differ by exactly 1, including across new year.
+"""
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Hashable, Iterable, List, NamedTuple, Optional, Union
+
+
+class Streaks(NamedTuple):
+    current_weeks: int      # consecutive active weeks ending this week (or last week)
+    best_weeks: int
+    consecutive_days: int   # consecutive active days ending at the latest active day
+    best_days: int
+
+
+NO_STREAKS = Streaks(0, 0, 0, 0)
+
+
+def to_ordinal(day: Union[str, date, datetime]) -> int:
+    if isinstance(day, datetime):
+        return day.date().toordinal()
+    if isinstance(day, date):
+        return day.toordinal()
+    return datetime.strptime(day, "%Y-%m-%d").toordinal()
+
+
+def week_ordinal(day: Union[str, date, datetime, int]) -> int:
+    ordinal = day if isinstance(day, int) else to_ordinal(day)
+    return (ordinal - 1) // 7
+
+
+def day_ordinals(days: Iterable[Union[str, date, datetime]]) -> List[int]:
+    """Sorted unique ordinals for a collection of dates"""
+    return sorted({to_ordinal(d) for d in days})
+
+
+def compute_streaks(days: List[int], today: int) -> Streaks:
+    """One pass over sorted unique day ordinals"""
+    if not days:
+        return NO_STREAKS
+
+    best_days = day_run = 1
+    best_weeks = week_run = 1
+    prev_day = days[0]
+    prev_week = week_ordinal(prev_day)
+    for day in days[1:]:
+        day_run = day_run + 1 if day == prev_day + 1 else 1
+        best_days = max(best_days, day_run)
+
+        week = week_ordinal(day)
+        if week != prev_week:
+            week_run = week_run + 1 if week == prev_week + 1 else 1
+            best_weeks = max(best_weeks, week_run)
+            prev_week = week
+        prev_day = day
+
+    # The current week may still be empty without breaking the streak
+    current_weeks = week_run if prev_week >= week_ordinal(today) - 1 else 0
+    return Streaks(current_weeks, best_weeks, day_run, best_days)
+
+
+class StreakCache:
+    """Per-couple memo of the last result, valid while (version, today) match.
+
+    `version` is anything that changes on every write for the couple
+    (e.g. an updated_at timestamp).
+    """
+
+    def __init__(self, max_couples: int = 10_000):
+        self.max_couples = max_couples
+        self._entries = OrderedDict()
+
+    def get(self, couple_code: str, version: Hashable, today: int) -> Optional[Streaks]:
+        cached = self._entries.get(couple_code)
+        if cached is None or cached[0] != (version, today):
+            return None
+        self._entries.move_to_end(couple_code)
+        return cached[1]
+
+    def put(self, couple_code: str, version: Hashable, today: int, streaks: Streaks):
+        self._entries[couple_code] = ((version, today), streaks)
+        self._entries.move_to_end(couple_code)
+        while len(self._entries) > self.max_couples:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, couple_code: str):
+        self._entries.pop(couple_code, None)
@@ -0,0 +1,86 @@
+"""Bucketed intimacy time series for the stats charts, shared by both backends.
+
+The backends group their daily rollups by bucket key in the database: the
+date for days, the week ordinal for weeks, YYYY-MM for months. This module
+resolves the requested range and turns the grouped rows into parallel
+arrays with one slot per bucket, zero-filled so charts can plot them
+directly. Week labels are the Monday of the week.
+"""
+from datetime import date, datetime
+from typing import Iterable, List, Optional, Tuple
+
+from streaks import week_ordinal
+
+BUCKETS = ("day", "week", "month")
+
+# Range used when `from` is omitted
+DEFAULT_SPAN_DAYS = {"day": 30, "week": 12 * 7, "month": 365}
+# Longest range per bucket, so one request builds at most a few hundred slots
+MAX_SPAN_DAYS = {"day": 2 * 366, "week": 5 * 366, "month": 20 * 366}
+
+
+def resolve_range(bucket: str, from_: Optional[str], to: Optional[str], today: date) -> Tuple[str, str]:
+    """Validated (from, to) as YYYY-MM-DD, inclusive; raises ValueError on bad input"""
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket deve essere uno tra {', '.join(BUCKETS)}")
+    end = datetime.strptime(to, "%Y-%m-%d").date() if to else today
+    if from_:
+        start = datetime.strptime(from_, "%Y-%m-%d").date()
+    else:
+        # Clamped at date.min, so a `to` in year 1 can't overflow
+        start = date.fromordinal(max(1, end.toordinal() - DEFAULT_SPAN_DAYS[bucket] + 1))
+    if start > end:
+        raise ValueError("from deve precedere to")
+    if (end - start).days >= MAX_SPAN_DAYS[bucket]:
+        raise ValueError(f"Intervallo massimo per bucket {bucket}: {MAX_SPAN_DAYS[bucket]} giorni")
+    return start.isoformat(), end.isoformat()
+
+
+def bucket_label(bucket: str, key) -> str:
+    """Label for a grouped row key (date string, week ordinal or YYYY-MM)"""
+    if bucket == "week":
+        return date.fromordinal(int(key) * 7 + 1).isoformat()
+    return str(key)
+
+
+def bucket_labels(bucket: str, start: str, end: str) -> List[str]:
+    """Every bucket overlapping [start, end], in order"""
+    first = datetime.strptime(start, "%Y-%m-%d").date()
+    last = datetime.strptime(end, "%Y-%m-%d").date()
+    if bucket == "day":
+        return [date.fromordinal(o).isoformat() for o in range(first.toordinal(), last.toordinal() + 1)]
+    if bucket == "week":
+        return [bucket_label("week", w) for w in range(week_ordinal(first), week_ordinal(last) + 1)]
+    months = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        months.append(f"{year:04d}-{month:02d}")
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return months
+
+
+def build_series(bucket: str, start: str, end: str, rows: Iterable[Tuple[object, int, int, int]]) -> dict:
+    """rows: (bucket key, count, quality_sum, duration_sum) from the GROUP BY"""
+    labels = bucket_labels(bucket, start, end)
+    index = {label: i for i, label in enumerate(labels)}
+    count = [0] * len(labels)
+    average_quality = [0.0] * len(labels)
+    total_duration = [0] * len(labels)
+    for key, n, quality_sum, duration_sum in rows:
+        if key is None or not n:
+            continue  # rollups written before the week key existed; `rebuild-rollups` fills it in
+        i = index.get(bucket_label(bucket, key))
+        if i is None:
+            continue
+        count[i] = int(n)
+        average_quality[i] = round((quality_sum or 0) / n, 2)
+        total_duration[i] = int(duration_sum or 0)
+    return {
+        "bucket": bucket,
+        "from": start,
+        "to": end,
+        "labels": labels,
+        "count": count,
+        "average_quality": average_quality,
+        "total_duration": total_duration,
+    }
@@ -0,0 +1,87 @@
+"""Process-local snapshot of today's mood entries per couple.
+
+GET /mood/today is polled by both partners all day. The first read of a
+couple's day loads it from the database. After that, log_mood keeps the
+snapshot current, so later polls are answered from memory. Snapshots are
+keyed by (couple, day), where day is "today" in the caller's timezone, so
+they reset at day rollover. Older days are dropped.
+
+Within one process the snapshot is always current. The TTL bounds how
+stale it can get when moods are logged through another worker process.
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Callable, Iterable, List, Optional
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+
+def local_today(tz: Optional[str], default: Callable[[], date]) -> date:
+    """Today in the IANA timezone `tz`, or `default()` without one; raises ValueError on unknown zones"""
+    if not tz or ZoneInfo is None:
+        return default()
+    try:
+        return datetime.now(ZoneInfo(tz)).date()
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Fuso orario sconosciuto: {tz}")
+
+
+class MoodSnapshot:
+    def __init__(self, max_couples: int = 20_000, ttl_seconds: float = 60):
+        self.max_couples = max_couples
+        self.ttl_seconds = ttl_seconds
+        self._couples = OrderedDict()  # couple_code -> {day: (expires_at, {user_id: entry})}
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, couple_code: str, day: str) -> Optional[List[dict]]:
+        """Today's entries, or None on a cold miss"""
+        with self._lock:
+            days = self._couples.get(couple_code)
+            entry = days.get(day) if days else None
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._couples.move_to_end(couple_code)
+            self.hits += 1
+            return list(entry[1].values())
+
+    def fill(self, couple_code: str, day: str, entries: Iterable[dict], generation: int):
+        """Store a day loaded from the database, unless a mood was logged meanwhile"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            days = self._couples.setdefault(couple_code, {})
+            # Keep yesterday too: partners in different timezones can be a day apart
+            oldest = (date.fromisoformat(day) - timedelta(days=1)).isoformat()
+            for stale in [d for d in days if d < oldest]:
+                del days[stale]
+            days[day] = (time.monotonic() + self.ttl_seconds, {e["user_id"]: e for e in entries})
+            self._couples.move_to_end(couple_code)
+            while len(self._couples) > self.max_couples:
+                self._couples.popitem(last=False)
+
+    def record(self, couple_code: str, day: str, entry: dict):
+        """Apply a logged mood to the snapshot of its day, if that day is loaded"""
+        with self._lock:
+            self.generation += 1
+            days = self._couples.get(couple_code)
+            if days and day in days:
+                days[day][1][entry["user_id"]] = entry
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "couples": len(self._couples),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
@@ -0,0 +1,60 @@
+"""Process-local cache of the user fields that write paths need.
+
+Write endpoints look up the caller's couple_code and partner_id before
+touching anything else. Those fields only change in join-couple, which
+drops the affected users, so later writes answer the lookup from memory.
+Within one process an entry is always current. The TTL bounds staleness
+when another worker process links a couple.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class UserCache:
+    def __init__(self, max_users: int = 50_000, ttl_seconds: float = 300):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._users = OrderedDict()  # user_id -> (expires_at, fields)
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """The cached fields, or None on a miss"""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._users.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, user_id: str, fields: dict, generation: int):
+        """Store a user loaded from the database, unless one was invalidated meanwhile"""
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._users[user_id] = (time.monotonic() + self.ttl_seconds, fields)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+
+    def invalidate(self, *user_ids: Optional[str]):
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self._users.pop(user_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "users": len(self._users),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0,
+            }
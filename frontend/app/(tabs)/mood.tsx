@@ -91,6 +91,35 @@ export default function MoodScreen() {
        return () => clearInterval(pollInterval);
      }, [user]);
 
+    // New love notes: long poll instead of waiting for the next refresh
+    useEffect(() => {
+      if (!user?.couple_code) return;
+      let active = true;
+      let cursor: string | undefined;
+
+      const listen = async () => {
+        while (active) {
+          try {
+            const started = Date.now();
+            const result = await loveNotesAPI.wait(user.couple_code, user.id, cursor);
+            // Reload only when a note arrived since the cursor we already had
+            const moved = cursor !== undefined && result.cursor !== cursor;
+            if (active && result.changed && moved) loadData();
+            // An answer that came back at once without a timeout: don't loop on it
+            if (result.changed && !moved && Date.now() - started < 1000) {
+              await new Promise((resolve) => setTimeout(resolve, 2000));
+            }
+            cursor = result.cursor;
+          } catch (error) {
+            await new Promise((resolve) => setTimeout(resolve, 5000));
+          }
+        }
+      };
+      listen();
+
+      return () => { active = false; };
+    }, [user]);
+
   const loadData = async () => {
     if (!user?.couple_code) return;
 
@@ -48,13 +48,15 @@ export const cycleAPI = {
     const response = await api.get(`/cycle/${userId}`);
     return response.data;
   },
-  getFertility: async (userId: string) => {
-    const response = await api.get(`/cycle/fertility/${userId}`);
+  // from/to (YYYY-MM-DD) limit the calendar to the visible range;
+  // format 'intervals' | 'bitmap' returns the compact encodings instead of one string per day
+  getFertility: async (userId: string, from?: string, to?: string, format?: 'days' | 'intervals' | 'bitmap') => {
+    const response = await api.get(`/cycle/fertility/${userId}`, { params: { from, to, format } });
     return response.data;
   },
   // Get fertility data by couple code (for male partner)
-  getFertilityByCouple: async (coupleCode: string) => {
-    const response = await api.get(`/cycle/fertility/couple/${coupleCode}`);
+  getFertilityByCouple: async (coupleCode: string, from?: string, to?: string, format?: 'days' | 'intervals' | 'bitmap') => {
+    const response = await api.get(`/cycle/fertility/couple/${coupleCode}`, { params: { from, to, format } });
     return response.data;
   },
   // New: Start new period
@@ -104,6 +106,10 @@ export const intimacyAPI = {
     const response = await api.get(`/intimacy/stats/${coupleCode}`);
     return response.data;
   },
+  getTimeseries: async (coupleCode: string, bucket: 'day' | 'week' | 'month' = 'day', from?: string, to?: string) => {
+    const response = await api.get(`/intimacy/timeseries/${coupleCode}`, { params: { bucket, from, to } });
+    return response.data;
+  },
 };
 
 export const challengeAPI = {
@@ -226,6 +232,18 @@ export const fertilityAPI = {
   },
 };
 
+// ================= CALENDAR API =================
+export const calendarAPI = {
+  // Periods, fertile days, intimacy, moods and special dates of one month (YYYY-MM).
+  // Days are offsets from the first of the month.
+  getMonth: async (coupleCode: string, month: string) => {
+    const response = await api.get(`/calendar/${coupleCode}/${month}`);
+    return response.data;
+  },
+  // Subscription URL (webcal/ICS) with special dates and predicted periods, for phone calendars
+  feedUrl: (coupleCode: string) => `${API_URL}/api/calendar/${coupleCode}.ics`,
+};
+
 // ================= MOOD API =================
 export const moodAPI = {
   log: async (userId: string, coupleCode: string, date: string, mood: number, energy: number, stress: number, libido: number, notes?: string) => {
@@ -245,14 +263,20 @@ export const moodAPI = {
     const response = await api.get(`/mood/${coupleCode}?days=${days}`);
     return response.data;
   },
-  getToday: async (coupleCode: string) => {
-    const response = await api.get(`/mood/today/${coupleCode}`);
+  // tz (IANA name) makes "today" the partner's local day instead of the server's
+  getToday: async (coupleCode: string, tz?: string) => {
+    const response = await api.get(`/mood/today/${coupleCode}`, { params: { tz } });
     return response.data;
   },
   getStats: async (coupleCode: string) => {
     const response = await api.get(`/mood/stats/${coupleCode}`);
     return response.data;
   },
+  // Rolling 7/30-day averages, partner sync, weekday profile and stress/libido trends
+  getAnalytics: async (coupleCode: string, days: number = 30) => {
+    const response = await api.get(`/mood/analytics/${coupleCode}`, { params: { days } });
+    return response.data;
+  },
 };
 
 // ================= LOVE NOTES API =================
@@ -275,6 +299,15 @@ export const loveNotesAPI = {
     const response = await api.get(`/love-notes/unread/${coupleCode}/${userId}`);
     return response.data;
   },
+  // Long poll: resolves when a new note arrives (changed) or after `timeout` seconds.
+  // The cursor is the newest received note's id; pass it back. A missing or older one answers at once.
+  wait: async (coupleCode: string, userId: string, after?: string, timeout: number = 25) => {
+    const response = await api.get(`/love-notes/${coupleCode}/${userId}/wait`, {
+      params: { after, timeout },
+      timeout: (timeout + 10) * 1000,
+    });
+    return response.data as { changed: boolean; cursor: string };
+  },
   markRead: async (noteId: string) => {
     const response = await api.put(`/love-notes/${noteId}/read`);
     return response.data;
@@ -0,0 +1,129 @@
+"""Round trips of the Mongo write paths, counted against a fake Motor database.
+
+Every awaited collection call (and every cursor `to_list`) is one round
+trip. The fake returns canned results, so the tests pin how many requests
+each endpoint sends, not what the server would do with them.
+"""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "couple_test")
+
+import server_mongo_backup as server  # noqa: E402
+from cycle_model import replay  # noqa: E402
+
+COUPLE = "TEST01"
+USER, PARTNER = "user-1", "user-2"
+
+
+class FakeCursor:
+    def __init__(self, db, name, method, result):
+        self._db, self._name, self._method, self._result = db, name, method, result
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    async def to_list(self, length=None):
+        self._db.calls.append((self._name, self._method))
+        return list(self._result)
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self._db, self._name = db, name
+
+    def __getattr__(self, method):
+        if method in ("find", "aggregate"):
+            return lambda *args, **kwargs: FakeCursor(self._db, self._name, method, self._db.result(self._name, method))
+
+        async def call(*args, **kwargs):
+            self._db.calls.append((self._name, method))
+            return self._db.result(self._name, method)
+        return call
+
+
+class FakeDb:
+    """Records (collection, method) per round trip; `results` holds the canned answers"""
+
+    DEFAULTS = {
+        "find": [], "aggregate": [],
+        "update_one": SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None),
+        "update_many": SimpleNamespace(matched_count=0, modified_count=0),
+        "replace_one": SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None),
+        "delete_one": SimpleNamespace(deleted_count=0),
+        "bulk_write": SimpleNamespace(deleted_count=0, modified_count=0),
+    }
+
+    def __init__(self, results=None):
+        self.results = results or {}
+        self.calls = []
+
+    def __getattr__(self, name):
+        return FakeCollection(self, name)
+
+    def result(self, name, method):
+        return self.results.get((name, method), self.DEFAULTS.get(method))
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    def install(results=None):
+        db = FakeDb(results)
+        monkeypatch.setattr(server, "db", db)
+        return db
+
+    # The cached user lookup is outside the counts below
+    server.user_cache.put(USER, {"id": USER, "name": "A", "couple_code": COUPLE, "partner_id": PARTNER},
+                          server.user_cache.generation)
+    yield install
+    server.user_cache.invalidate(USER)
+
+
+def test_toggle_wishlist_remove_is_one_round_trip(fake_db):
+    db = fake_db({("wishlist", "bulk_write"): SimpleNamespace(deleted_count=1, modified_count=1)})
+    result = asyncio.run(server.toggle_wishlist_item(COUPLE, USER, "massage"))
+    assert result["action"] == "removed"
+    assert db.calls == [("wishlist", "bulk_write")]
+
+
+def test_toggle_wishlist_add_is_three_round_trips(fake_db):
+    db = fake_db({("wishlist", "find_one_and_update"): {"_id": 1}})
+    result = asyncio.run(server.toggle_wishlist_item(COUPLE, USER, "massage"))
+    assert result == {"action": "added", "unlocked": True}
+    assert db.calls == [("wishlist", "bulk_write"), ("wishlist", "find_one_and_update"), ("wishlist", "update_one")]
+
+
+def test_start_new_period_round_trips(fake_db):
+    cycle = {"id": "cycle-1", "user_id": USER, "couple_code": COUPLE, "last_period_date": "2026-09-01",
+             "cycle_length": 28, "period_length": 5}
+    stats = {**replay([28, 29, 28]), "last_start": "2026-09-01"}
+    db = fake_db({
+        ("couples", "aggregate"): [{"couple_code": COUPLE, "member_ids": [USER, PARTNER], "cycle": [cycle]}],
+        ("cycle_stats", "find_one"): stats,
+    })
+    result = asyncio.run(server.start_new_period(server.CycleHistoryCreate(user_id=USER, period_start_date="2026-09-29")))
+    assert result["actual_cycle_length"] == 28
+    # The tracked cycle and the statistics are read concurrently
+    assert sorted(db.calls[:2]) == [("couples", "aggregate"), ("cycle_stats", "find_one")]
+    assert db.calls[2:] == [("cycle_history", "insert_one"), ("cycle_stats", "update_one"), ("cycle_data", "update_one")]
+
+
+def test_log_mood_replaces_in_one_round_trip(fake_db):
+    previous = {"user_id": USER, "couple_code": COUPLE, "date": "2026-10-01", "mood": 2, "energy": 3, "stress": 4, "libido": 2}
+    db = fake_db({("mood_entries", "find_one_and_replace"): previous})
+    entry = server.MoodEntryCreate(user_id=USER, couple_code=COUPLE, date="2026-10-01", mood=4, energy=3, stress=2, libido=4)
+    asyncio.run(server.log_mood(entry))
+    assert db.calls == [("mood_entries", "find_one_and_replace"), ("daily_rollups", "update_one")]
+
+
+def test_save_quiz_answer_upserts_in_one_round_trip(fake_db):
+    db = fake_db()
+    answer = server.QuizAnswerCreate(couple_code=COUPLE, user_id=USER, question_id=3, answer_index=1)
+    asyncio.run(server.save_quiz_answer(answer))
+    assert db.calls == [("quiz_answers", "replace_one")]